@@ -0,0 +1,271 @@
+"""Throughput benchmark for the users API against a large SQLite table.
+
+Runs the Flask app in-process (test client) on a throwaway database:
+
+    cd babylon-server
+    python benchmarks/users_api.py --rows 100000 --workers 4
+
+Phases: bulk insert, a full keyset walk (with OFFSET and the old unpaginated
+listing for comparison), prefix filters, bulk update/delete, and finally
+forked reader processes running next to a bulk writer. Pass
+--journal-mode DELETE to compare against SQLite's rollback journal.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=5000, help='users per bulk request')
+    parser.add_argument('--page', type=int, default=1000, help='page size for the keyset walk')
+    parser.add_argument('--workers', type=int, default=4, help='reader processes in the concurrent phase')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of the concurrent phase')
+    parser.add_argument('--journal-mode', default='WAL')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    return parser.parse_args()
+
+
+args = parse_args()
+workdir = tempfile.mkdtemp(prefix='bench-users-')
+os.environ['DATABASE_URL'] = f"sqlite:///{args.database or os.path.join(workdir, 'users.db')}"
+os.environ['SQLITE_JOURNAL_MODE'] = args.journal_mode
+os.environ.setdefault('BABYLON_RUNTIME_DIR', os.path.join(workdir, 'runtime'))
+os.environ.setdefault('SHARED_CACHE_DIR', os.path.join(workdir, 'shm'))
+# Bulk requests are heavy endpoints; the benchmark measures the database, not the admission limits
+os.environ['ADMISSION_ENABLED'] = 'false'
+
+from sqlalchemy import select, text  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models.user import User, db  # noqa: E402
+from src.utils import database  # noqa: E402
+
+
+def report(name, count, unit, seconds, extra=''):
+    rate = count / seconds if seconds > 0 else float('inf')
+    print(f"{name:<34} {count:>8} {unit:<9} {seconds:>8.3f}s {rate:>12,.0f} {unit}/s  {extra}")
+
+
+def call(client, method, url, body=None):
+    response = client.open(url, method=method, json=body)
+    try:
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response.get_json(), response.headers.get('X-Next-Cursor')
+    finally:
+        response.close()
+
+
+def user_rows(start, count, tag='u'):
+    return [{'username': f'{tag}{i:07d}', 'email': f'{tag}{i:07d}@example.com'} for i in range(start, start + count)]
+
+
+def bench_bulk_create(client):
+    started = time.perf_counter()
+    for start in range(0, args.rows, args.batch):
+        call(client, 'POST', '/api/users/bulk', {'users': user_rows(start, min(args.batch, args.rows - start))})
+    report('bulk create', args.rows, 'rows', time.perf_counter() - started, f'({args.batch} per request)')
+
+
+def bench_keyset_walk(client):
+    pages = rows = 0
+    cursor = None
+    page_times = []
+    started = time.perf_counter()
+    while True:
+        url = f'/api/users?limit={args.page}' + (f'&after={cursor}' if cursor else '')
+        page_started = time.perf_counter()
+        users, cursor = call(client, 'GET', url)
+        page_times.append(time.perf_counter() - page_started)
+        pages += 1
+        rows += len(users)
+        if not cursor:
+            break
+    elapsed = time.perf_counter() - started
+    report('keyset walk (GET /api/users)', rows, 'rows', elapsed,
+           f'{pages} pages, first {page_times[0] * 1000:.1f}ms, last {page_times[-1] * 1000:.1f}ms')
+
+
+def bench_offset_walk():
+    """The same walk with LIMIT/OFFSET straight in SQL: deep pages rescan everything before them"""
+    with app.app_context():
+        rows = pages = 0
+        last_page = 0
+        started = time.perf_counter()
+        while True:
+            page_started = time.perf_counter()
+            users = db.session.execute(
+                select(User).order_by(User.id).limit(args.page).offset(pages * args.page)
+            ).scalars().all()
+            last_page = time.perf_counter() - page_started
+            [user.to_dict() for user in users]
+            db.session.expunge_all()
+            if not users:
+                break
+            rows += len(users)
+            pages += 1
+        report('offset walk (SQL only)', rows, 'rows', time.perf_counter() - started,
+               f'{pages} pages, last {last_page * 1000:.1f}ms')
+
+
+def bench_unpaginated():
+    """What GET /api/users used to do, and still does without limit or after: every row in one response"""
+    with app.test_request_context():
+        started = time.perf_counter()
+        users = User.query.all()
+        body = json.dumps([user.to_dict() for user in users])
+        report('unpaginated listing (old)', len(users), 'rows', time.perf_counter() - started,
+               f'{len(body) / 1e6:.1f}MB response')
+        db.session.remove()
+
+
+def bench_filters(client):
+    rng = random.Random(1)
+    requests = 2000
+    started = time.perf_counter()
+    matched = 0
+    for _ in range(requests):
+        prefix = f'u{rng.randrange(args.rows) // 100:05d}'
+        users, _ = call(client, 'GET', f'/api/users?username={prefix}&limit=100')
+        matched += len(users)
+    report('username prefix filter', requests, 'requests', time.perf_counter() - started,
+           f'{matched / requests:.0f} rows per request')
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        prefix = f'u{rng.randrange(args.rows):07d}@'
+        call(client, 'GET', f'/api/users?email={prefix}&sort=email&limit=10')
+    report('email prefix filter', requests, 'requests', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        call(client, 'GET', f'/api/users?after={rng.randrange(args.rows)}&limit=100')
+    report('random deep page (limit=100)', requests, 'requests', time.perf_counter() - started)
+
+
+def all_ids():
+    with app.app_context():
+        ids = db.session.execute(select(User.id).order_by(User.id)).scalars().all()
+        db.session.remove()
+        return ids
+
+
+def bench_bulk_update_delete(client):
+    ids = all_ids()
+    count = min(len(ids), 20000)
+    started = time.perf_counter()
+    for start in range(0, count, args.batch):
+        batch = ids[start:min(start + args.batch, count)]
+        call(client, 'PATCH', '/api/users/bulk', {'users': [{'id': i, 'email': f'changed{i}@example.com'} for i in batch]})
+    report('bulk update', count, 'rows', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, count, args.batch):
+        call(client, 'DELETE', '/api/users/bulk', {'ids': ids[start:min(start + args.batch, count)]})
+    report('bulk delete', count, 'rows', time.perf_counter() - started)
+
+    # Put the rows back so the concurrent phase sees the full table
+    started = time.perf_counter()
+    for start in range(0, count, args.batch):
+        call(client, 'POST', '/api/users/bulk', {'users': user_rows(start, min(args.batch, count - start), 'r')})
+    report('bulk create (refill)', count, 'rows', time.perf_counter() - started)
+
+
+def reader(seconds, results):
+    database.after_fork()
+    client = app.test_client()
+    rng = random.Random(os.getpid())
+    done = errors = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = client.get(f'/api/users?after={rng.randrange(args.rows)}&limit=100')
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 200:
+            done += 1
+        else:
+            errors += 1
+        response.close()
+    results.put(('read', done, errors, latencies))
+
+
+def writer(seconds, results, ids):
+    database.after_fork()
+    client = app.test_client()
+    rng = random.Random(0)
+    done = errors = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    round_number = 0
+    while time.monotonic() < deadline:
+        round_number += 1
+        batch = rng.sample(ids, min(len(ids), 1000))
+        body = {'users': [{'id': i, 'email': f'w{round_number}-{i}@example.com'} for i in batch]}
+        started = time.perf_counter()
+        response = client.patch('/api/users/bulk', json=body)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 200:
+            done += len(batch)
+        else:
+            errors += 1
+        response.close()
+    results.put(('write', done, errors, latencies))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+def bench_concurrent():
+    ids = all_ids()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=reader, args=(args.seconds, results)) for _ in range(args.workers)]
+    processes.append(context.Process(target=writer, args=(args.seconds, results, ids)))
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = [entry for entry in collected if entry[0] == 'read']
+    read_latencies = [value for entry in reads for value in entry[3]]
+    report(f'concurrent reads ({args.workers} procs)', sum(entry[1] for entry in reads), 'requests', args.seconds,
+           f'errors {sum(entry[2] for entry in reads)}, p50 {percentile(read_latencies, 0.5):.1f}ms, '
+           f'p99 {percentile(read_latencies, 0.99):.1f}ms')
+    write = next(entry for entry in collected if entry[0] == 'write')
+    report('concurrent bulk update (1 proc)', write[1], 'rows', args.seconds,
+           f'errors {write[2]}, p50 {percentile(write[3], 0.5):.1f}ms per 1000 rows')
+
+
+def main():
+    # Anything the app opened while importing stays with this process; the forked workers start clean
+    database.release_connections()
+    with app.app_context():
+        mode = db.session.execute(text('PRAGMA journal_mode')).scalar()
+        db.session.remove()
+    print(f"database {os.environ['DATABASE_URL']} (journal_mode={mode})")
+    client = app.test_client()
+
+    bench_bulk_create(client)
+    bench_keyset_walk(client)
+    bench_offset_walk()
+    bench_unpaginated()
+    bench_filters(client)
+    bench_bulk_update_delete(client)
+    database.release_connections()
+    bench_concurrent()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,9 @@ backlog = 2048
 
 # Worker processes
 workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
-worker_class = "sync"
+# Threaded workers: a change-feed stream (SSE) holds one thread for its ~25s instead of a whole process
+worker_class = "gthread"
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
 worker_connections = 1000
 timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
 keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '2'))
@@ -68,6 +70,18 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
     server.log.info(f"Worker {worker.pid} has been forked")
+    # Each worker gets its own database connection pool; inherited connections stay with the master
+    from src.utils import database
+    database.after_fork()
+    # Threads don't survive fork, so each worker starts its own stack sampler
+    from src.utils import profiling
+    if profiling.ensure_sampler() is not None:
+        server.log.info(f"Worker {worker.pid} stack sampler every {profiling.SAMPLER_INTERVAL}s")
+
+def worker_exit(server, worker):
+    """Called just after a worker has been exited, in the worker process."""
+    from src.utils import profiling
+    profiling.stop_sampler()
 
 def worker_abort(worker):
     """Called when a worker receives the SIGABRT signal."""
@@ -3,11 +3,20 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory, send_file
+from flask import Flask, Response, request, send_from_directory, send_file
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.assets import assets_bp
+from src.routes.assets import assets_bp, storage, EXTERNAL_IMPORT_DIR
+from src.routes.replication import replication_bp
+from src.routes.profiling import profiling_bp
+from src.utils.static_manifest import StaticManifest
+from src.utils import metrics
+from src.utils import admission
+from src.utils import profiling
+from src.utils import mesh_optimizer
+from src.utils import texture_variants
+from src.utils import database
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -17,22 +26,56 @@ CORS(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(assets_bp, url_prefix='/api/assets')
+app.register_blueprint(replication_bp, url_prefix='/api/replication')
+app.register_blueprint(profiling_bp, url_prefix='/api/profiling')
+
+# Heavy endpoints get bounded per-client and global worker slots; oversized bodies are refused up front
+admission.init_app(app)
+
+# Opt-in profiling (PROFILING_ENABLED): cProfile per request on X-Profile / armed requests,
+# plus a per-worker stack sampler; output goes to PROFILE_DIR as .folded and .prof files
+profiling.init_app(app)
 
 # Route to serve external import files (audio, etc.)
 @app.route('/external-import/<path:filename>')
 def serve_external_import(filename):
-    # Fix the path to point to the correct external-import directory
-    external_import_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'public', 'external-import')
-    file_path = os.path.join(external_import_dir, filename)
+    # Resolve through the storage backend (local disk, or the S3 read-through cache)
+    try:
+        file_path = storage.open_local(f"{EXTERNAL_IMPORT_DIR}/{filename}")
+    except ValueError:
+        file_path = None
+    
+    # Derivatives written at import/bundle time, falling back to the original when missing:
+    # ?variant=optimized for meshes, ?variant=lod256|pot|strip|cross or ?max_size=N for textures
+    variant = 'original'
+    requested = request.args.get('variant')
+    variant_file = None
+    if file_path is not None and requested:
+        if requested == 'optimized' and filename.lower().endswith(mesh_optimizer.MESH_EXTENSIONS):
+            variant_file = mesh_optimizer.optimized_name(filename)
+        elif texture_variants.is_source_image(filename):
+            variant_file = texture_variants.variant_name(filename, requested)
+    elif file_path is not None and request.args.get('max_size', '').isdigit() and texture_variants.is_source_image(filename):
+        picked = texture_variants.pick_lod(
+            filename,
+            int(request.args['max_size']),
+            lambda name: storage.open_local(f"{EXTERNAL_IMPORT_DIR}/{name}") is not None,
+            texture_variants.image_size(file_path)
+        )
+        if picked is not None:
+            requested, variant_file = picked
+    if variant_file is not None:
+        variant_path = storage.open_local(f"{EXTERNAL_IMPORT_DIR}/{variant_file}")
+        if variant_path is not None:
+            file_path = variant_path
+            variant = requested
     
     print(f"DEBUG: Requested filename: {filename}")
-    print(f"DEBUG: External import dir: {external_import_dir}")
     print(f"DEBUG: Full file path: {file_path}")
-    print(f"DEBUG: File exists: {os.path.exists(file_path)}")
     
     # Check if file exists
-    if not os.path.exists(file_path):
-        print(f"DEBUG: File not found at {file_path}")
+    if file_path is None:
+        print(f"DEBUG: File not found: {filename}")
         return "File not found", 404
     
     # Set proper MIME types for binary files
@@ -53,25 +96,42 @@ def serve_external_import(filename):
     }
     
     # Get file extension
-    _, ext = os.path.splitext(filename.lower())
+    _, ext = os.path.splitext(file_path.lower())
     mime_type = mime_types.get(ext, 'application/octet-stream')
     
     print(f"DEBUG: Serving file with MIME type: {mime_type}")
     
     # Serve file with proper MIME type and binary mode
-    return send_file(
+    response = send_file(
         file_path,
         mimetype=mime_type,
         as_attachment=False,
         conditional=True
     )
+    response.headers['X-Asset-Variant'] = variant
+    return response
+
+# Prometheus metrics aggregated across all gunicorn workers
+@app.route('/api/metrics')
+def prometheus_metrics():
+    if os.getenv('METRICS_ENABLED', 'true').lower() == 'false':
+        return "Not found", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+# DATABASE_URL (default src/database/app.db). SQLite runs in WAL mode with a busy timeout, and the
+# pool is released before fork and recreated in each worker (see database.after_fork in post_fork)
+app.config['SQLALCHEMY_DATABASE_URI'] = database.DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+database.init_app(app, db)
 with app.app_context():
     db.create_all()
+database.release_connections()
+
+# Static files are indexed once at startup (before fork under preload_app) and served from memory.
+# Set STATIC_MANIFEST=false to serve straight from disk, e.g. while editing files in src/static.
+static_manifest = None
+if os.getenv('STATIC_MANIFEST', 'true').lower() != 'false':
+    static_manifest = StaticManifest(app.static_folder)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -79,6 +139,12 @@ def serve(path):
     # Skip external-import paths - let the specific route handle them
     if path.startswith('external-import/'):
         return "Not found", 404
+
+    if static_manifest is not None:
+        response = static_manifest.serve(path)
+        if response is None:
+            return "index.html not found", 404
+        return response
         
     static_folder_path = app.static_folder
     if static_folder_path is None:
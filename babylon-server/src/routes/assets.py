@@ -1,37 +1,143 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, current_app
 import os
 import json
+import time
+import uuid
 import base64
-import shutil
+import posixpath
+import threading
 from datetime import datetime
+from urllib.parse import unquote
 from werkzeug.utils import secure_filename
+from src.utils import change_feed
+from src.utils import search_index
+from src.utils import shared_cache
+from src.utils import request_body
+from src.utils import asset_locks
+from src.utils import mesh_optimizer
+from src.utils import texture_variants
+from src.utils import js_minify
+from src.utils.storage import create_storage
+from src.utils.runtime import runtime_path, temp_path
 
 assets_bp = Blueprint('assets', __name__)
 
-# مجلد حفظ الأصول
-ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets')
-MAPS_DIR = os.path.join(ASSETS_DIR, 'maps')
-CHARACTERS_DIR = os.path.join(ASSETS_DIR, 'characters')
-OBJECTS_DIR = os.path.join(ASSETS_DIR, 'objects')
-SCENES_DIR = os.path.join(ASSETS_DIR, 'scenes')
-FLOW_DIR = os.path.join(ASSETS_DIR, 'flows')
-CODELIB_DIR = os.path.join(ASSETS_DIR, 'code-library')
-
+# مجلد حفظ الأصول على القرص (للتخزين المحلي)؛ ASSETS_DIR يسمح بتشغيل عدة عقد على نفس الجهاز
+ASSETS_ROOT = os.getenv('ASSETS_DIR') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets')
 # مجلد الاستيراد الخارجي المؤقت (في المجلد الجذر للمشروع)
-EXTERNAL_IMPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'public', 'external-import')
+EXTERNAL_IMPORT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'public', 'external-import')
+
+# مشتقات الاستيراد تُحسب في خيط خلفي بعد رد الرفع (لا تحجز قفل مجلد الاستيراد ولا تقترب من مهلة العامل)؛
+# حالة آخر مهمة في هذا الملف وتُقرأ عبر /import-status
+IMPORT_JOB_PATH = runtime_path('imports', 'external.json')
+# العامل الذي يشغل المهمة يلمس ملف النبض دورياً؛ إذا أُعيد تدويره أو قُتل تُعرض المهمة كفاشلة
+IMPORT_HEARTBEAT_PATH = runtime_path('imports', 'external.heartbeat')
+IMPORT_HEARTBEAT_SECONDS = float(os.getenv('IMPORT_HEARTBEAT_SECONDS', '5'))
+
+# مفاتيح المجلدات داخل التخزين (محلي أو S3 حسب STORAGE_BACKEND)
+MAPS_DIR = 'maps'
+CHARACTERS_DIR = 'characters'
+OBJECTS_DIR = 'objects'
+SCENES_DIR = 'scenes'
+FLOW_DIR = 'flows'
+CODELIB_DIR = 'code-library'
+EXTERNAL_IMPORT_DIR = 'external-import'
+
+storage = create_storage({'': ASSETS_ROOT, EXTERNAL_IMPORT_DIR: EXTERNAL_IMPORT_ROOT})
 
 # إنشاء المجلدات إذا لم تكن موجودة
-for directory in [ASSETS_DIR, MAPS_DIR, CHARACTERS_DIR, OBJECTS_DIR, SCENES_DIR, FLOW_DIR, CODELIB_DIR]:
-    os.makedirs(directory, exist_ok=True)
+for directory in [MAPS_DIR, CHARACTERS_DIR, OBJECTS_DIR, SCENES_DIR, FLOW_DIR, CODELIB_DIR]:
+    storage.make_dir(directory)
+
+# نوع الأصل -> مجلده
+ASSET_DIRS = {
+    'map': MAPS_DIR,
+    'character': CHARACTERS_DIR,
+    'object': OBJECTS_DIR,
+    'scene': SCENES_DIR,
+    'flow': FLOW_DIR,
+    'code': CODELIB_DIR
+}
+
+# المجلدات التي يراقبها بث التغييرات عبر inotify (التخزين المحلي فقط؛ مع S3 تكفي أحداث الواجهة)
+WATCHED_ROOTS = {
+    asset_type: storage.local_path(key)
+    for asset_type, key in dict(ASSET_DIRS, external=EXTERNAL_IMPORT_DIR).items()
+    if storage.local_path(key)
+}
+
+# كل حدث تغيير (من الواجهة أو من inotify) يُبطل العناصر المعنية في الذاكرة المشتركة لجميع العمال
+change_feed.add_listener(shared_cache.invalidate_event)
+
+@assets_bp.before_app_request
+def start_change_watcher():
+    # يُشغَّل داخل كل عامل بعد fork وليس في العملية الرئيسية (preload_app)
+    if WATCHED_ROOTS:
+        change_feed.ensure_watcher(WATCHED_ROOTS)
+
+@assets_bp.route('/changes', methods=['GET'])
+def stream_changes():
+    """بث تغييرات مكتبة الأصول (Server-Sent Events) مع الاستئناف من Last-Event-ID"""
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'رقم الحدث غير صحيح'}), 400
+    
+    types = request.args.get('types')
+    asset_types = set(types.split(',')) if types else None
+    
+    return Response(
+        change_feed.stream(since, asset_types),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@assets_bp.route('/search', methods=['GET'])
+def search_assets():
+    """البحث في كود جميع الأصول (نص، تعبير نمطي، أو أسماء رموز)"""
+    try:
+        query = request.args.get('q', '')
+        mode = request.args.get('mode', 'text')
+        types = request.args.get('types')
+        asset_types = set(types.split(',')) if types else None
+        
+        if not query:
+            return jsonify({'error': 'نص البحث مطلوب'}), 400
+        
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+        except ValueError:
+            return jsonify({'error': 'قيمة limit غير صحيحة'}), 400
+        
+        started = datetime.now()
+        search_index.reconcile(storage, ASSET_DIRS)
+        try:
+            results = search_index.search(query, mode, asset_types, limit)
+        except search_index.SearchError as e:
+            return jsonify({'error': f'استعلام غير صالح: {str(e)}'}), 400
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'took_ms': round((datetime.now() - started).total_seconds() * 1000, 2)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في البحث: {str(e)}'}), 500
 
 @assets_bp.route('/save', methods=['POST'])
 def save_asset():
     """حفظ أصل (خريطة، شخصية، أو كائن)"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         asset_type = data.get('type')  # map, character, object, scene, flow, code
         asset_name = data.get('name')
@@ -65,16 +171,17 @@ def save_asset():
             'updated_at': datetime.now().isoformat()
         }
         
-        # إنشاء مجلد فرعي للأصل
-        asset_folder = os.path.join(target_dir, asset_name)
-        os.makedirs(asset_folder, exist_ok=True)
-        
-        # حفظ الملف في المجلد الفرعي
+        # حفظ الملف في المجلد الفرعي للأصل
+        asset_folder = posixpath.join(target_dir, asset_name)
         filename = f"{asset_name}.json"
-        filepath = os.path.join(asset_folder, filename)
+        filepath = posixpath.join(asset_folder, filename)
+        with asset_locks.locked(writes=[asset_locks.asset_key(asset_type, asset_name)]):
+            existed = storage.exists(filepath)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(asset_data, f, ensure_ascii=False, indent=2)
+            storage.write_bytes(filepath, json.dumps(asset_data, ensure_ascii=False, indent=2).encode('utf-8'))
+        
+            change_feed.publish('updated' if existed else 'created', asset_type, asset_name)
+            search_index.index_asset(asset_type, asset_name, asset_code, storage.stat(filepath)[1])
         
         return jsonify({
             'success': True,
@@ -82,6 +189,9 @@ def save_asset():
             'filename': filename
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في الحفظ: {str(e)}'}), 500
 
@@ -106,20 +216,31 @@ def load_asset(asset_type, asset_name):
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
         # البحث في المجلد الفرعي للأصل
-        asset_folder = os.path.join(target_dir, asset_name)
+        asset_folder = posixpath.join(target_dir, asset_name)
         filename = f"{asset_name}.json"
-        filepath = os.path.join(asset_folder, filename)
+        filepath = posixpath.join(asset_folder, filename)
+        
+        # ?mode=play: كود مصغّر للاعبين؛ المحررات تطلب بدون mode فتحصل على الكود كما حُفظ
+        play_mode = request.args.get('mode') == 'play' and js_minify.ENABLED and asset_type != 'flow'
+        
+        def read_payload():
+            try:
+                asset_data = json.loads(storage.read_bytes(filepath))
+            except FileNotFoundError:
+                return None
+            if play_mode and isinstance(asset_data, dict) and isinstance(asset_data.get('code'), str):
+                asset_data['code'] = js_minify.delivered_code(asset_data['code'])
+            return current_app.json.dumps({
+                'success': True,
+                'data': asset_data
+            }).encode('utf-8')
         
-        if not os.path.exists(filepath):
+        cache_key = f"load:{asset_type}/{asset_name}" + (':play' if play_mode else '')
+        payload = shared_cache.cached(cache_key, f"asset:{asset_type}/{asset_name}", read_payload)
+        if payload is None:
             return jsonify({'error': 'الملف غير موجود'}), 404
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            asset_data = json.load(f)
-        
-        return jsonify({
-            'success': True,
-            'data': asset_data
-        })
+        return Response(payload, mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': f'خطأ في التحميل: {str(e)}'}), 500
@@ -144,39 +265,56 @@ def list_assets(asset_type):
         else:
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
-        assets = []
-        
-        # البحث في المجلدات الفرعية
-        if os.path.exists(target_dir):
-            for folder_name in os.listdir(target_dir):
-                folder_path = os.path.join(target_dir, folder_name)
-                if os.path.isdir(folder_path):
-                    json_file = os.path.join(folder_path, f"{folder_name}.json")
-                    thumbnail_file = os.path.join(folder_path, f"{folder_name}_thumbnail.png")
-                    
-                    if os.path.exists(json_file):
-                        try:
-                            with open(json_file, 'r', encoding='utf-8') as f:
-                                asset_data = json.load(f)
-                            
-                            assets.append({
-                                'name': asset_data.get('name'),
-                                'folder': folder_name,
-                                'created_at': asset_data.get('created_at'),
-                                'updated_at': asset_data.get('updated_at'),
-                                'has_thumbnail': os.path.exists(thumbnail_file)
-                            })
-                        except:
-                            continue
+        def scan_catalog():
+            return current_app.json.dumps({
+                'success': True,
+                'assets': _scan_assets(target_dir)
+            }).encode('utf-8')
         
-        return jsonify({
-            'success': True,
-            'assets': assets
-        })
+        payload = shared_cache.cached(f"catalog:{asset_type}", f"catalog:{asset_type}", scan_catalog)
+        return Response(payload, mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب القائمة: {str(e)}'}), 500
 
+def _scan_assets(target_dir):
+    """قراءة بيانات جميع الأصول في مجلد نوع معين"""
+    assets = []
+    
+    # قائمة واحدة بكل الملفات بدلاً من فحص كل مجلد على حدة (طلب واحد مع S3)
+    files = {rel for rel, size, mtime in storage.walk_files(target_dir)}
+    
+    for rel in files:
+        folder_name, _, filename = rel.partition('/')
+        if filename != f"{folder_name}.json":
+            continue
+        try:
+            asset_data = json.loads(storage.read_bytes(posixpath.join(target_dir, rel)))
+            
+            assets.append({
+                'name': asset_data.get('name'),
+                'folder': folder_name,
+                'created_at': asset_data.get('created_at'),
+                'updated_at': asset_data.get('updated_at'),
+                'has_thumbnail': f"{folder_name}/{folder_name}_thumbnail.png" in files
+            })
+        except:
+            continue
+    
+    return assets
+
+def _copy_children(source_dir, dest_dir):
+    """نسخ محتويات مجلد (ملفات ومجلدات) إلى مجلد آخر مع استبدال المجلدات الموجودة"""
+    items = []
+    dirs, files = storage.list_dir(source_dir)
+    for item in dirs:
+        storage.copy_tree(posixpath.join(source_dir, item), posixpath.join(dest_dir, item))
+        items.append(item)
+    for item in files:
+        storage.copy(posixpath.join(source_dir, item), posixpath.join(dest_dir, item))
+        items.append(item)
+    return items
+
 @assets_bp.route('/delete/<asset_type>/<asset_name>', methods=['DELETE'])
 def delete_asset(asset_type, asset_name):
     """حذف أصل محفوظ"""
@@ -198,20 +336,26 @@ def delete_asset(asset_type, asset_name):
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
         # حذف المجلد الفرعي للأصل
-        asset_folder = os.path.join(target_dir, asset_name)
+        asset_folder = posixpath.join(target_dir, asset_name)
         
-        if not os.path.exists(asset_folder):
-            return jsonify({'error': 'الملف غير موجود'}), 404
+        with asset_locks.locked(writes=[asset_locks.asset_key(asset_type, asset_name)]):
+            if not storage.is_dir(asset_folder):
+                return jsonify({'error': 'الملف غير موجود'}), 404
         
-        # حذف جميع الملفات في المجلد الفرعي
-        import shutil
-        shutil.rmtree(asset_folder)
+            # حذف جميع الملفات في المجلد الفرعي
+            storage.delete_tree(asset_folder)
+        
+            change_feed.publish('deleted', asset_type, asset_name)
+            search_index.remove_asset(asset_type, asset_name)
         
         return jsonify({
             'success': True,
             'message': f'تم حذف {asset_type} بنجاح'
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في الحذف: {str(e)}'}), 500
 
@@ -219,14 +363,19 @@ def delete_asset(asset_type, asset_name):
 def save_thumbnail():
     """حفظ صورة مصغرة للأصل"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            if request.mimetype.startswith('image/'):
+                # الصورة كبايتات خام في الجسم، والنوع والاسم في رابط الطلب
+                data = dict(request.args)
+                data['thumbnail'] = request_body.read_body(request)
+            else:
+                data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         asset_type = data.get('type')
         asset_name = data.get('name')
-        thumbnail_data = data.get('thumbnail')  # base64 encoded image
+        thumbnail_data = data.get('thumbnail')  # base64 data-URL (JSON) أو bytes (MessagePack / خام)
         
         if not all([asset_type, asset_name, thumbnail_data]):
             return jsonify({'error': 'البيانات المطلوبة مفقودة'}), 400
@@ -248,26 +397,33 @@ def save_thumbnail():
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
         # مجلد الأصل
-        asset_folder = os.path.join(target_dir, asset_name)
-        if not os.path.exists(asset_folder):
-            return jsonify({'error': 'الأصل غير موجود'}), 404
+        asset_folder = posixpath.join(target_dir, asset_name)
+        with asset_locks.locked(writes=[asset_locks.asset_key(asset_type, asset_name)]):
+            if not storage.is_dir(asset_folder):
+                return jsonify({'error': 'الأصل غير موجود'}), 404
         
-        # إزالة البادئة من البيانات المرمزة بـ base64
-        if thumbnail_data.startswith('data:image'):
-            thumbnail_data = thumbnail_data.split(',')[1]
+            if isinstance(thumbnail_data, str):
+                # إزالة البادئة من البيانات المرمزة بـ base64
+                if thumbnail_data.startswith('data:image'):
+                    thumbnail_data = thumbnail_data.split(',')[1]
+                thumbnail_data = base64.b64decode(thumbnail_data)
         
-        # حفظ الصورة المصغرة
-        thumbnail_filename = f"{asset_name}_thumbnail.png"
-        thumbnail_path = os.path.join(asset_folder, thumbnail_filename)
+            # حفظ الصورة المصغرة
+            thumbnail_filename = f"{asset_name}_thumbnail.png"
+            thumbnail_path = posixpath.join(asset_folder, thumbnail_filename)
         
-        with open(thumbnail_path, 'wb') as f:
-            f.write(base64.b64decode(thumbnail_data))
+            storage.write_bytes(thumbnail_path, thumbnail_data)
+        
+            change_feed.publish('updated', asset_type, asset_name)
         
         return jsonify({
             'success': True,
             'message': 'تم حفظ الصورة المصغرة بنجاح'
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في حفظ الصورة المصغرة: {str(e)}'}), 500
 
@@ -288,17 +444,226 @@ def get_thumbnail(asset_type, asset_name):
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
         # مجلد الأصل
-        asset_folder = os.path.join(target_dir, asset_name)
-        thumbnail_path = os.path.join(asset_folder, f"{asset_name}_thumbnail.png")
+        asset_folder = posixpath.join(target_dir, asset_name)
+        thumbnail_path = posixpath.join(asset_folder, f"{asset_name}_thumbnail.png")
         
-        if not os.path.exists(thumbnail_path):
+        def read_thumbnail():
+            try:
+                return storage.read_bytes(thumbnail_path)
+            except FileNotFoundError:
+                return None
+        
+        payload = shared_cache.cached(f"thumbnail:{asset_type}/{asset_name}", f"asset:{asset_type}/{asset_name}", read_thumbnail)
+        if payload is None:
             return jsonify({'error': 'الصورة المصغرة غير موجودة'}), 404
         
-        return send_file(thumbnail_path, mimetype='image/png')
+        response = Response(payload, mimetype='image/png')
+        response.add_etag()
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب الصورة المصغرة: {str(e)}'}), 500
 
+def _read_external_sibling(folder):
+    """قارئ للملفات المشار إليها من داخل ملف الشبكة (مخازن .bin، خامات) ضمن مجلد الاستيراد فقط"""
+    def read(uri):
+        key = posixpath.normpath(posixpath.join(folder, unquote(uri)))
+        if not key.startswith(EXTERNAL_IMPORT_DIR + '/'):
+            return None
+        try:
+            return storage.read_bytes(key)
+        except (FileNotFoundError, ValueError):
+            return None
+    return read
+
+def _load_import_job():
+    try:
+        with open(IMPORT_JOB_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_import_job(job):
+    tmp_path = temp_path(IMPORT_JOB_PATH)
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, IMPORT_JOB_PATH)
+
+def _touch_import_heartbeat():
+    with open(IMPORT_HEARTBEAT_PATH, 'a'):
+        pass
+    os.utime(IMPORT_HEARTBEAT_PATH)
+
+def _import_heartbeat(job_id, finished):
+    """نبض مهمة الاستيراد ما دامت تعمل وما دامت هي الأحدث (مهمة أقدم لا تُبقي مهمة جديدة ميتة حية)"""
+    while not finished.wait(IMPORT_HEARTBEAT_SECONDS):
+        if _load_import_job().get('id') != job_id:
+            return
+        try:
+            _touch_import_heartbeat()
+        except OSError as e:
+            print(f"WARNING: import heartbeat failed: {e}")
+
+def _import_job_stopped(job):
+    """هل توقف العامل المالك لمهمة لم تنتهِ (أُعيد تدويره بـ max_requests أو قُتل بعد المهلة)"""
+    try:
+        os.kill(job['pid'], 0)
+    except ProcessLookupError:
+        return True
+    except (KeyError, TypeError, PermissionError):
+        pass
+    try:
+        heartbeat = os.stat(IMPORT_HEARTBEAT_PATH).st_mtime
+    except FileNotFoundError:
+        heartbeat = job.get('started', 0)
+    return time.time() - max(heartbeat, job.get('started', 0)) > IMPORT_HEARTBEAT_SECONDS * 3
+
+def _write_derivative(lock_key, sources, key, data, job_id=None):
+    """كتابة ملف مشتق تحت قفل الأصل ما دامت ملفات المصدر كما قُرئت (sources: {المفتاح: stat})
+    وما دامت مهمة الاستيراد job_id هي الأحدث؛ وإلا فقد تغير المصدر ويُهمل الناتج"""
+    with asset_locks.locked(writes=[lock_key]):
+        if job_id is not None and _load_import_job().get('id') != job_id:
+            return False
+        for source, stat in sources.items():
+            try:
+                if tuple(storage.stat(source)) != tuple(stat):
+                    return False
+            except FileNotFoundError:
+                return False
+        storage.write_bytes(key, data)
+        return True
+
+def _optimize_external_mesh(name, job_id=None):
+    """إحصاءات شبكة مستوردة، وكتابة نسخة GLB محسّنة بجانبها إذا كانت أصغر (أو محوّلة من .babylon)"""
+    path = posixpath.join(EXTERNAL_IMPORT_DIR, name)
+    stat = storage.stat(path)
+    size = stat[0]
+    if size > mesh_optimizer.MAX_BYTES:
+        return {'size': size, 'reason': 'الملف أكبر من حد التحسين MESH_OPTIMIZE_MAX_BYTES'}
+    
+    try:
+        report, output, optimized_report, changes = mesh_optimizer.optimize(
+            storage.read_bytes(path), name, _read_external_sibling(posixpath.dirname(path)), mesh_optimizer.QUANTIZE
+        )
+    except Exception as e:
+        # ملف شبكة تالف لا يُفشل الاستيراد نفسه
+        return {'size': size, 'error': f'تعذر فحص الشبكة: {str(e)}'}
+    
+    if output is not None and (len(output) < report['size'] or report['format'] == 'babylon'):
+        optimized_name = mesh_optimizer.optimized_name(name)
+        if _write_derivative(asset_locks.EXTERNAL, {path: stat},
+                             posixpath.join(EXTERNAL_IMPORT_DIR, optimized_name), output, job_id):
+            report['optimized'] = dict(optimized_report, name=optimized_name, changes=changes)
+    return report
+
+def _process_external_import(job_id, names):
+    """مهمة خلفية لاستيراد job_id: نسخ الشبكات المحسّنة والخامات المصغرة ووجوه skybox المجمّعة،
+    ثم حفظ التقرير ونشر حدث تحديث.
+    إذا أُعيد تدوير العامل أثناءها تضيع المشتقات فقط، ويُسلَّم الأصل بدلاً منها."""
+    files = {}
+    job = {'status': 'done', 'skyboxes': []}
+    finished = threading.Event()
+    threading.Thread(
+        target=_import_heartbeat, args=(job_id, finished), name='external-import-heartbeat', daemon=True
+    ).start()
+    try:
+        if mesh_optimizer.OPTIMIZE_ON_IMPORT:
+            for name in names:
+                if name.lower().endswith(mesh_optimizer.MESH_EXTENSIONS):
+                    files.setdefault(name, {})['mesh'] = _optimize_external_mesh(name, job_id)
+        if texture_variants.ENABLED:
+            textures, job['skyboxes'] = _generate_texture_variants(EXTERNAL_IMPORT_DIR, names, job_id=job_id)
+            for name, report in textures.items():
+                files.setdefault(name, {})['texture'] = report
+    except Exception as e:
+        job = {'status': 'failed', 'error': str(e)}
+    finally:
+        finished.set()
+    
+    try:
+        with asset_locks.locked(writes=[asset_locks.EXTERNAL]):
+            current = _load_import_job()
+            if current.get('id') != job_id:
+                return
+            current.update(job, files=files, finished=time.time())
+            _save_import_job(current)
+        change_feed.publish('updated', 'external')
+    except (asset_locks.LockTimeout, OSError) as e:
+        print(f"WARNING: saving import job {job_id} failed: {e}")
+
+def _generate_texture_variants(folder, names, missing_only=False, lock_key=asset_locks.EXTERNAL, job_id=None):
+    """نسخ LOD وقوة 2 لكل صورة، وشريحة وتقاطع لكل مجموعة وجوه skybox مكتملة
+    يعيد (إحصاءات كل صورة حسب الاسم، قائمة skyboxes المجمّعة). يعمل خارج القفل (Pillow بطيء
+    على الصور الكبيرة) ويكتب كل نسخة عبر _write_derivative تحت lock_key"""
+    reports = {}
+    skyboxes = []
+    if not texture_variants.available():
+        print("WARNING: Pillow is not installed, texture variants are disabled")
+        return reports, skyboxes
+    
+    existing = set(names) if missing_only else set()
+    for name in names:
+        if not texture_variants.is_source_image(name):
+            continue
+        if missing_only and any(
+            texture_variants.variant_name(name, variant) in existing
+            for variant in ['pot'] + [f'lod{size}' for size in texture_variants.LOD_SIZES]
+        ):
+            continue
+        path = posixpath.join(folder, name)
+        try:
+            stat = storage.stat(path)
+            report, variants = texture_variants.make_variants(storage.read_bytes(path), name)
+        except FileNotFoundError:
+            continue
+        except texture_variants.TextureError as e:
+            reports[name] = {'error': str(e)}
+            continue
+        for _, variant_file, data in variants:
+            if not _write_derivative(lock_key, {path: stat}, posixpath.join(folder, variant_file), data, job_id):
+                break
+        else:
+            reports[name] = report
+    
+    for faces in texture_variants.find_cubemaps(names):
+        strip_name = texture_variants.variant_name(faces['px'], 'strip')
+        if missing_only and strip_name in existing:
+            continue
+        ext = posixpath.splitext(strip_name.lower())[1]
+        paths = {face: posixpath.join(folder, name) for face, name in faces.items()}
+        try:
+            sources = {path: storage.stat(path) for path in paths.values()}
+            packed = texture_variants.pack_cubemap(
+                {face: storage.read_bytes(path) for face, path in paths.items()}, ext
+            )
+        except FileNotFoundError:
+            continue
+        except texture_variants.TextureError as e:
+            skyboxes.append({'faces': faces, 'error': str(e)})
+            continue
+        skybox = {'faces': faces}
+        for layout, (data, info) in packed.items():
+            packed_name = texture_variants.variant_name(faces['px'], layout)
+            if not _write_derivative(lock_key, sources, posixpath.join(folder, packed_name), data, job_id):
+                break
+            skybox[layout] = dict(info, name=packed_name, size=len(data))
+        else:
+            skyboxes.append(skybox)
+    return reports, skyboxes
+
+def _fill_missing_texture_variants(lock_key, folder, asset_type, name):
+    """إكمال النسخ المصغرة الناقصة لأصول مجمّعة في خيط خلفي بعد رد التجميع"""
+    def run():
+        try:
+            names = [relative_path for relative_path, _, _ in storage.walk_files(folder)]
+            reports, skyboxes = _generate_texture_variants(folder, names, missing_only=True, lock_key=lock_key)
+            if reports or skyboxes:
+                change_feed.publish('updated', asset_type, name)
+        except Exception as e:
+            print(f"WARNING: texture variants for {folder} failed: {e}")
+    
+    threading.Thread(target=run, name='texture-variants', daemon=True).start()
+
 @assets_bp.route('/import-external', methods=['POST'])
 def import_external_assets():
     """استيراد أصول خارجية إلى مجلد مؤقت"""
@@ -313,70 +678,102 @@ def import_external_assets():
             return jsonify({'error': 'لا توجد ملفات للرفع'}), 400
         
         # مسح المجلد المؤقت أولاً (في أول استيراد فقط)
-        if os.path.exists(EXTERNAL_IMPORT_DIR):
-            shutil.rmtree(EXTERNAL_IMPORT_DIR)
-        os.makedirs(EXTERNAL_IMPORT_DIR, exist_ok=True)
+        with asset_locks.locked(writes=[asset_locks.EXTERNAL]):
+            storage.delete_tree(EXTERNAL_IMPORT_DIR)
+            storage.make_dir(EXTERNAL_IMPORT_DIR)
         
-        uploaded_files = []
+            uploaded_files = []
         
-        for i, file in enumerate(files):
-            if file.filename == '':
-                continue
+            for i, file in enumerate(files):
+                if file.filename == '':
+                    continue
                 
-            # الحصول على المسار النسبي إذا كان متوفراً
-            relative_path = paths[i] if i < len(paths) else file.filename
-            
-            # تأمين اسم الملف والمسار
-            if '/' in relative_path or '\\' in relative_path:
-                # هذا ملف من مجلد، احتفظ بهيكل المجلد
-                safe_path = os.path.normpath(relative_path)
-                # إزالة أي مسارات خطرة
-                safe_path = safe_path.replace('..', '').lstrip('/')
-            else:
-                # ملف فردي
-                safe_path = secure_filename(file.filename)
+                # الحصول على المسار النسبي إذا كان متوفراً
+                relative_path = paths[i] if i < len(paths) else file.filename
             
-            # إنشاء المسار الكامل
-            full_path = os.path.join(EXTERNAL_IMPORT_DIR, safe_path)
+                # تأمين اسم الملف والمسار
+                if '/' in relative_path or '\\' in relative_path:
+                    # هذا ملف من مجلد، احتفظ بهيكل المجلد
+                    safe_path = os.path.normpath(relative_path)
+                    # إزالة أي مسارات خطرة
+                    safe_path = safe_path.replace('..', '').lstrip('/')
+                else:
+                    # ملف فردي
+                    safe_path = secure_filename(file.filename)
             
-            # إنشاء المجلدات الفرعية إذا لزم الأمر
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                # إنشاء المسار الكامل
+                full_path = posixpath.join(EXTERNAL_IMPORT_DIR, safe_path)
             
-            # حفظ الملف
-            file.save(full_path)
+                # حفظ الملف (تدفقاً، مع رفع متعدد الأجزاء للملفات الكبيرة في S3)
+                size = storage.save_stream(full_path, file.stream)
             
-            uploaded_files.append({
-                'name': safe_path,
-                'size': os.path.getsize(full_path),
-                'original_name': file.filename
+                uploaded_files.append({
+                    'name': safe_path,
+                    'size': size,
+                    'original_name': file.filename
+                })
+        
+            # فحص الشبكات والنسخ المحسّنة والخامات المصغرة ووجوه skybox بعد الرد
+            # (بعد رفع كل الملفات حتى تتوفر المخازن والخامات المجاورة)
+            job_id = uuid.uuid4().hex
+            _save_import_job({
+                'id': job_id, 'status': 'processing', 'started': time.time(), 'pid': os.getpid(), 'files': {}
             })
+            _touch_import_heartbeat()
+        
+            change_feed.publish('updated', 'external')
+        
+        threading.Thread(
+            target=_process_external_import, args=(job_id, [uploaded['name'] for uploaded in uploaded_files]),
+            name='external-import-job', daemon=True
+        ).start()
         
         return jsonify({
             'success': True,
             'message': f'تم رفع {len(uploaded_files)} ملف بنجاح',
-            'files': uploaded_files
+            'files': uploaded_files,
+            'jobId': job_id
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في استيراد الملفات: {str(e)}'}), 500
 
+@assets_bp.route('/import-status', methods=['GET'])
+def import_status():
+    """حالة مهمة ما بعد آخر استيراد (processing / done / failed) وتقارير الشبكات والخامات وskyboxes"""
+    try:
+        job = _load_import_job()
+        if not job:
+            return jsonify({'error': 'لا يوجد استيراد'}), 404
+        if job.get('status') == 'processing' and _import_job_stopped(job):
+            # المشتقات التي لم تُكتب تبقى ناقصة ويُسلَّم الأصل بدلاً منها؛ استيراد جديد يعيد المحاولة
+            job = dict(job, status='failed', error='توقف العامل قبل انتهاء مهمة الاستيراد')
+        
+        return jsonify(dict(job, success=True))
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب حالة الاستيراد: {str(e)}'}), 500
+
 @assets_bp.route('/list-external', methods=['GET'])
 def list_external_assets():
-    """عرض قائمة الأصول الخارجية المستوردة"""
+    """عرض قائمة الأصول الخارجية المستوردة (دون الملفات المشتقة إلا مع ?derived=true)"""
     try:
         files = []
+        include_derived = request.args.get('derived', 'false').lower() == 'true'
         
-        if os.path.exists(EXTERNAL_IMPORT_DIR):
-            for root, dirs, filenames in os.walk(EXTERNAL_IMPORT_DIR):
-                for filename in filenames:
-                    full_path = os.path.join(root, filename)
-                    relative_path = os.path.relpath(full_path, EXTERNAL_IMPORT_DIR)
-                    
-                    files.append({
-                        'name': relative_path,
-                        'size': os.path.getsize(full_path),
-                        'modified': os.path.getmtime(full_path)
-                    })
+        for relative_path, size, modified in storage.walk_files(EXTERNAL_IMPORT_DIR):
+            if not include_derived and (
+                mesh_optimizer.is_optimized(relative_path) or texture_variants.is_variant(relative_path)
+            ):
+                continue
+            files.append({
+                'name': relative_path,
+                'size': size,
+                'modified': modified
+            })
         
         return jsonify({
             'success': True,
@@ -386,18 +783,60 @@ def list_external_assets():
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب قائمة الملفات: {str(e)}'}), 500
 
+@assets_bp.route('/inspect-external', methods=['GET'])
+def inspect_external_mesh():
+    """إحصاءات ملف شبكة مستورد (رؤوس، مثلثات، خامات) ونسخته المحسّنة إن وجدت"""
+    try:
+        name = request.args.get('path', '')
+        if not name.lower().endswith(mesh_optimizer.MESH_EXTENSIONS):
+            return jsonify({'error': 'المسار يجب أن يكون ملف .glb أو .gltf أو .babylon'}), 400
+        
+        path = posixpath.join(EXTERNAL_IMPORT_DIR, name)
+        if not storage.exists(path):
+            return jsonify({'error': 'الملف غير موجود'}), 404
+        if storage.stat(path)[0] > mesh_optimizer.MAX_BYTES:
+            return jsonify({'error': 'الملف أكبر من حد الفحص MESH_OPTIMIZE_MAX_BYTES'}), 413
+        
+        _, report = mesh_optimizer.load(storage.read_bytes(path), name, _read_external_sibling(posixpath.dirname(path)))
+        
+        optimized_name = mesh_optimizer.optimized_name(name)
+        optimized_path = posixpath.join(EXTERNAL_IMPORT_DIR, optimized_name)
+        if optimized_name != name and storage.exists(optimized_path):
+            data = storage.read_bytes(optimized_path)
+            _, optimized_report = mesh_optimizer.load(data, optimized_name)
+            report['optimized'] = dict(optimized_report, name=optimized_name)
+        
+        return jsonify({
+            'success': True,
+            'name': name,
+            'mesh': report
+        })
+        
+    except (mesh_optimizer.MeshError, ValueError) as e:
+        return jsonify({'error': f'ملف شبكة غير صالح: {str(e)}'}), 400
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في فحص الشبكة: {str(e)}'}), 500
+
 @assets_bp.route('/clear-external', methods=['DELETE'])
 def clear_external_assets():
     """مسح جميع الأصول الخارجية المستوردة"""
     try:
-        if os.path.exists(EXTERNAL_IMPORT_DIR):
-            shutil.rmtree(EXTERNAL_IMPORT_DIR)
+        with asset_locks.locked(writes=[asset_locks.EXTERNAL]):
+            storage.delete_tree(EXTERNAL_IMPORT_DIR)
+            # مهمة الاستيراد الجارية (إن وجدت) تتوقف عن كتابة مشتقاتها
+            _save_import_job({})
+        
+            change_feed.publish('deleted', 'external')
         
         return jsonify({
             'success': True,
             'message': 'تم مسح جميع الملفات المستوردة'
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في مسح الملفات: {str(e)}'}), 500
 
@@ -405,10 +844,10 @@ def clear_external_assets():
 def move_external_to_project():
     """نقل الأصول الخارجية إلى مجلد المشروع"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         asset_type = data.get('type')
         asset_name = data.get('name')
@@ -429,38 +868,28 @@ def move_external_to_project():
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
         # مجلد المشروع (المجلد الفرعي للأصل)
-        project_folder = os.path.join(target_dir, asset_name)
+        project_folder = posixpath.join(target_dir, asset_name)
         
         # التحقق من وجود مجلد المشروع
-        if not os.path.exists(project_folder):
-            return jsonify({'error': 'مجلد المشروع غير موجود'}), 404
+        with asset_locks.locked(writes=[asset_locks.asset_key(asset_type, asset_name), asset_locks.EXTERNAL]):
+            if not storage.is_dir(project_folder):
+                return jsonify({'error': 'مجلد المشروع غير موجود'}), 404
         
-        moved_files = []
+            moved_files = []
         
-        # نقل الملفات إذا كان مجلد الاستيراد الخارجي موجود
-        if os.path.exists(EXTERNAL_IMPORT_DIR):
-            # إنشاء مجلد الأصول داخل مجلد المشروع
-            assets_folder = os.path.join(project_folder, 'assets')
-            os.makedirs(assets_folder, exist_ok=True)
+            # نقل الملفات إذا كان مجلد الاستيراد الخارجي موجود
+            if storage.is_dir(EXTERNAL_IMPORT_DIR):
+                # إنشاء مجلد الأصول داخل مجلد المشروع
+                assets_folder = posixpath.join(project_folder, 'assets')
+                storage.make_dir(assets_folder)
             
-            # نقل جميع الملفات والمجلدات
-            for item in os.listdir(EXTERNAL_IMPORT_DIR):
-                source_path = os.path.join(EXTERNAL_IMPORT_DIR, item)
-                dest_path = os.path.join(assets_folder, item)
-                
-                if os.path.isdir(source_path):
-                    # نقل المجلد
-                    if os.path.exists(dest_path):
-                        shutil.rmtree(dest_path)
-                    shutil.copytree(source_path, dest_path)
-                else:
-                    # نقل الملف
-                    shutil.copy2(source_path, dest_path)
-                
-                moved_files.append(item)
+                # نقل جميع الملفات والمجلدات
+                moved_files = _copy_children(EXTERNAL_IMPORT_DIR, assets_folder)
             
-            # مسح مجلد الاستيراد الخارجي بعد النقل
-            shutil.rmtree(EXTERNAL_IMPORT_DIR)
+                # مسح مجلد الاستيراد الخارجي بعد النقل
+                storage.delete_tree(EXTERNAL_IMPORT_DIR)
+                change_feed.publish('updated', asset_type, asset_name)
+                change_feed.publish('deleted', 'external')
         
         return jsonify({
             'success': True,
@@ -468,6 +897,9 @@ def move_external_to_project():
             'movedFiles': moved_files
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في نقل الملفات: {str(e)}'}), 500
 
@@ -475,10 +907,10 @@ def move_external_to_project():
 def copy_project_assets():
     """نسخ أصول من مجلد المشروع إلى مجلد external-import"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         asset_type = data.get('type')
         asset_name = data.get('name')
@@ -501,41 +933,29 @@ def copy_project_assets():
             return jsonify({'error': 'نوع الأصل غير صحيح'}), 400
         
         # مجلد المشروع (المجلد الفرعي للأصل)
-        project_folder = os.path.join(target_dir, asset_name)
-        assets_folder = os.path.join(project_folder, 'assets')
+        project_folder = posixpath.join(target_dir, asset_name)
+        assets_folder = posixpath.join(project_folder, 'assets')
         
         # التحقق من وجود مجلد المشروع
-        if not os.path.exists(project_folder):
-            return jsonify({'error': 'مجلد المشروع غير موجود'}), 404
+        with asset_locks.locked(writes=[asset_locks.EXTERNAL], reads=[asset_locks.asset_key(asset_type, asset_name)]):
+            if not storage.is_dir(project_folder):
+                return jsonify({'error': 'مجلد المشروع غير موجود'}), 404
         
-        # التحقق من وجود مجلد assets
-        if not os.path.exists(assets_folder):
-            return jsonify({
-                'success': True,
-                'foundAssets': False,
-                'message': 'لا يوجد مجلد assets في المشروع'
-            })
+            # التحقق من وجود مجلد assets
+            if not storage.is_dir(assets_folder):
+                return jsonify({
+                    'success': True,
+                    'foundAssets': False,
+                    'message': 'لا يوجد مجلد assets في المشروع'
+                })
         
-        # إنشاء مجلد external-import
-        os.makedirs(EXTERNAL_IMPORT_DIR, exist_ok=True)
+            # إنشاء مجلد external-import
+            storage.make_dir(EXTERNAL_IMPORT_DIR)
         
-        copied_files = []
+            # نسخ جميع محتويات مجلد assets
+            copied_files = _copy_children(assets_folder, EXTERNAL_IMPORT_DIR)
         
-        # نسخ جميع محتويات مجلد assets
-        for item in os.listdir(assets_folder):
-            source_path = os.path.join(assets_folder, item)
-            dest_path = os.path.join(EXTERNAL_IMPORT_DIR, item)
-            
-            if os.path.isdir(source_path):
-                # نسخ المجلد
-                if os.path.exists(dest_path):
-                    shutil.rmtree(dest_path)
-                shutil.copytree(source_path, dest_path)
-            else:
-                # نسخ الملف
-                shutil.copy2(source_path, dest_path)
-            
-            copied_files.append(item)
+            change_feed.publish('updated', 'external')
         
         return jsonify({
             'success': True,
@@ -544,6 +964,9 @@ def copy_project_assets():
             'copiedFiles': copied_files
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في نسخ أصول المشروع: {str(e)}'}), 500
 
@@ -551,10 +974,10 @@ def copy_project_assets():
 def bundle_scene_assets():
     """تجميع أصول المشهد مع البيانات في مجلد المشروع"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         scene_name = data.get('sceneName')
         scene_code = data.get('sceneCode', '')
@@ -563,30 +986,28 @@ def bundle_scene_assets():
             return jsonify({'error': 'اسم المشهد مطلوب'}), 400
         
         # مجلد المشهد
-        scene_folder = os.path.join(SCENES_DIR, scene_name)
+        scene_folder = posixpath.join(SCENES_DIR, scene_name)
         
-        if not os.path.exists(scene_folder):
-            return jsonify({'error': 'مجلد المشهد غير موجود'}), 404
+        with asset_locks.locked(writes=[asset_locks.asset_key('scene', scene_name)], reads=[asset_locks.EXTERNAL]):
+            if not storage.is_dir(scene_folder):
+                return jsonify({'error': 'مجلد المشهد غير موجود'}), 404
         
-        bundled_files = []
+            bundled_files = []
         
-        # نسخ جميع الملفات من external-import إلى مجلد assets داخل المشهد
-        if os.path.exists(EXTERNAL_IMPORT_DIR):
-            assets_folder = os.path.join(scene_folder, 'assets')
-            os.makedirs(assets_folder, exist_ok=True)
+            # نسخ جميع الملفات من external-import إلى مجلد assets داخل المشهد
+            if storage.is_dir(EXTERNAL_IMPORT_DIR):
+                assets_folder = posixpath.join(scene_folder, 'assets')
+                storage.make_dir(assets_folder)
             
-            for item in os.listdir(EXTERNAL_IMPORT_DIR):
-                source_path = os.path.join(EXTERNAL_IMPORT_DIR, item)
-                dest_path = os.path.join(assets_folder, item)
-                
-                if os.path.isdir(source_path):
-                    if os.path.exists(dest_path):
-                        shutil.rmtree(dest_path)
-                    shutil.copytree(source_path, dest_path)
-                else:
-                    shutil.copy2(source_path, dest_path)
-                
-                bundled_files.append(item)
+                bundled_files = _copy_children(EXTERNAL_IMPORT_DIR, assets_folder)
+            
+                # الأصول المستعادة من مشاريع أقدم قد لا تحمل نسخاً مصغرة بعد (تُكمل بعد الرد)
+                if texture_variants.ENABLED:
+                    _fill_missing_texture_variants(
+                        asset_locks.asset_key('scene', scene_name), assets_folder, 'scene', scene_name
+                    )
+            
+                change_feed.publish('updated', 'scene', scene_name)
         
         return jsonify({
             'success': True,
@@ -594,6 +1015,9 @@ def bundle_scene_assets():
             'bundledFiles': bundled_files
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في تجميع أصول المشهد: {str(e)}'}), 500
 
@@ -601,10 +1025,10 @@ def bundle_scene_assets():
 def bundle_flow_project():
     """تجميع مشروع كامل للمخطط مع جميع المشاهد والأصول"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         flow_name = data.get('flowName')
         scene_names = data.get('sceneNames', [])
@@ -614,51 +1038,48 @@ def bundle_flow_project():
             return jsonify({'error': 'اسم المخطط مطلوب'}), 400
         
         # مجلد المخطط
-        flow_folder = os.path.join(FLOW_DIR, flow_name)
+        flow_folder = posixpath.join(FLOW_DIR, flow_name)
         
-        if not os.path.exists(flow_folder):
-            return jsonify({'error': 'مجلد المخطط غير موجود'}), 404
+        with asset_locks.locked(writes=[asset_locks.asset_key('flow', flow_name)],
+                            reads=[asset_locks.asset_key('scene', name) for name in scene_names] + [asset_locks.EXTERNAL]):
+            if not storage.is_dir(flow_folder):
+                return jsonify({'error': 'مجلد المخطط غير موجود'}), 404
         
-        # إنشاء مجلد assets داخل مجلد المخطط
-        flow_assets_folder = os.path.join(flow_folder, 'assets')
-        os.makedirs(flow_assets_folder, exist_ok=True)
+            # إنشاء مجلد assets داخل مجلد المخطط
+            flow_assets_folder = posixpath.join(flow_folder, 'assets')
+            storage.make_dir(flow_assets_folder)
         
-        bundled_scenes = []
-        total_bundled_files = 0
+            bundled_scenes = []
+            total_bundled_files = 0
         
-        # جمع جميع المشاهد وأصولها
-        for scene_name in scene_names:
-            scene_folder = os.path.join(SCENES_DIR, scene_name)
-            scene_assets_folder = os.path.join(scene_folder, 'assets')
+            # جمع جميع المشاهد وأصولها
+            for scene_name in scene_names:
+                scene_folder = posixpath.join(SCENES_DIR, scene_name)
+                scene_assets_folder = posixpath.join(scene_folder, 'assets')
             
-            if os.path.exists(scene_folder):
-                # نسخ بيانات المشهد
-                scene_json_file = os.path.join(scene_folder, f"{scene_name}.json")
-                if os.path.exists(scene_json_file):
-                    dest_scene_file = os.path.join(flow_assets_folder, f"scene_{scene_name}.json")
-                    shutil.copy2(scene_json_file, dest_scene_file)
-                    bundled_scenes.append(scene_name)
+                if storage.is_dir(scene_folder):
+                    # نسخ بيانات المشهد
+                    scene_json_file = posixpath.join(scene_folder, f"{scene_name}.json")
+                    if storage.exists(scene_json_file):
+                        dest_scene_file = posixpath.join(flow_assets_folder, f"scene_{scene_name}.json")
+                        storage.copy(scene_json_file, dest_scene_file)
+                        bundled_scenes.append(scene_name)
                 
-                # نسخ أصول المشهد إذا كانت موجودة
-                if os.path.exists(scene_assets_folder):
-                    scene_assets_dest = os.path.join(flow_assets_folder, f"scene_{scene_name}_assets")
-                    if os.path.exists(scene_assets_dest):
-                        shutil.rmtree(scene_assets_dest)
-                    shutil.copytree(scene_assets_folder, scene_assets_dest)
-                    
-                    # حساب عدد الملفات المنسوخة
-                    for root, dirs, files in os.walk(scene_assets_dest):
-                        total_bundled_files += len(files)
-        
-        # نسخ أي أصول من external-import إلى المخطط
-        if os.path.exists(EXTERNAL_IMPORT_DIR):
-            external_assets_dest = os.path.join(flow_assets_folder, 'external_assets')
-            if os.path.exists(external_assets_dest):
-                shutil.rmtree(external_assets_dest)
-            shutil.copytree(EXTERNAL_IMPORT_DIR, external_assets_dest)
-            
-            for root, dirs, files in os.walk(external_assets_dest):
-                total_bundled_files += len(files)
+                    # نسخ أصول المشهد إذا كانت موجودة (مع حساب عدد الملفات المنسوخة)
+                    if storage.is_dir(scene_assets_folder):
+                        scene_assets_dest = posixpath.join(flow_assets_folder, f"scene_{scene_name}_assets")
+                        total_bundled_files += storage.copy_tree(scene_assets_folder, scene_assets_dest)
+        
+            # نسخ أي أصول من external-import إلى المخطط
+            if storage.is_dir(EXTERNAL_IMPORT_DIR):
+                external_assets_dest = posixpath.join(flow_assets_folder, 'external_assets')
+                total_bundled_files += storage.copy_tree(EXTERNAL_IMPORT_DIR, external_assets_dest)
+                if texture_variants.ENABLED:
+                    _fill_missing_texture_variants(
+                        asset_locks.asset_key('flow', flow_name), external_assets_dest, 'flow', flow_name
+                    )
+        
+            change_feed.publish('updated', 'flow', flow_name)
         
         return jsonify({
             'success': True,
@@ -667,6 +1088,9 @@ def bundle_flow_project():
             'totalFiles': total_bundled_files
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في تجميع مشروع المخطط: {str(e)}'}), 500
 
@@ -674,10 +1098,10 @@ def bundle_flow_project():
 def restore_flow_assets():
     """استعادة أصول المخطط إلى مجلد external-import للعب"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'لا توجد بيانات'}), 400
+        try:
+            data = request_body.parse_body(request)
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
         
         flow_name = data.get('flowName')
         
@@ -685,64 +1109,66 @@ def restore_flow_assets():
             return jsonify({'error': 'اسم المخطط مطلوب'}), 400
         
         # مجلد المخطط
-        flow_folder = os.path.join(FLOW_DIR, flow_name)
-        flow_assets_folder = os.path.join(flow_folder, 'assets')
+        flow_folder = posixpath.join(FLOW_DIR, flow_name)
+        flow_assets_folder = posixpath.join(flow_folder, 'assets')
         
-        if not os.path.exists(flow_assets_folder):
+        if not storage.is_dir(flow_assets_folder):
             return jsonify({
                 'success': True,
                 'foundAssets': False,
                 'message': 'لا توجد أصول محفوظة في المخطط'
             })
         
-        # إنشاء مجلد external-import
-        os.makedirs(EXTERNAL_IMPORT_DIR, exist_ok=True)
+        # المشاهد التي سيستعيدها المخطط تُعرف من ملفاته، فتُقفل معه قبل البدء
+        dirs, files = storage.list_dir(flow_assets_folder)
+        scene_names = [
+            item.replace('scene_', '').replace('.json', '')
+            for item in files if item.startswith('scene_') and item.endswith('.json')
+        ]
+        
+        with asset_locks.locked(writes=[asset_locks.asset_key('scene', name) for name in scene_names] + [asset_locks.EXTERNAL],
+                                reads=[asset_locks.asset_key('flow', flow_name)]):
+            # إنشاء مجلد external-import
+            storage.make_dir(EXTERNAL_IMPORT_DIR)
         
-        restored_files = 0
-        restored_scenes = []
+            restored_files = 0
+            restored_scenes = []
         
-        # استعادة جميع الأصول من مجلد المخطط
-        for item in os.listdir(flow_assets_folder):
-            source_path = os.path.join(flow_assets_folder, item)
+            # استعادة جميع الأصول من مجلد المخطط (إعادة السرد بعد أخذ القفل)
+            dirs, files = storage.list_dir(flow_assets_folder)
+        
+            for item in files:
+                source_path = posixpath.join(flow_assets_folder, item)
             
-            if item.startswith('scene_') and item.endswith('.json'):
-                # ملف مشهد - نسخه إلى scenes folder إذا لزم الأمر
-                scene_name = item.replace('scene_', '').replace('.json', '')
-                scene_folder = os.path.join(SCENES_DIR, scene_name)
-                os.makedirs(scene_folder, exist_ok=True)
-                dest_path = os.path.join(scene_folder, f"{scene_name}.json")
-                shutil.copy2(source_path, dest_path)
-                restored_scenes.append(scene_name)
-                
-            elif item.startswith('scene_') and item.endswith('_assets'):
-                # مجلد أصول مشهد - نسخ الأصول إلى external-import
-                if os.path.isdir(source_path):
-                    for asset_item in os.listdir(source_path):
-                        asset_source = os.path.join(source_path, asset_item)
-                        asset_dest = os.path.join(EXTERNAL_IMPORT_DIR, asset_item)
-                        
-                        if os.path.isdir(asset_source):
-                            if os.path.exists(asset_dest):
-                                shutil.rmtree(asset_dest)
-                            shutil.copytree(asset_source, asset_dest)
-                        else:
-                            shutil.copy2(asset_source, asset_dest)
-                        restored_files += 1
-                        
-            elif item == 'external_assets':
-                # أصول خارجية - نسخها مباشرة إلى external-import
-                if os.path.isdir(source_path):
-                    for ext_item in os.listdir(source_path):
-                        ext_source = os.path.join(source_path, ext_item)
-                        ext_dest = os.path.join(EXTERNAL_IMPORT_DIR, ext_item)
+                if item.startswith('scene_') and item.endswith('.json'):
+                    # ملف مشهد - نسخه إلى scenes folder إذا لزم الأمر
+                    scene_name = item.replace('scene_', '').replace('.json', '')
+                    if scene_name not in scene_names:
+                        # أضيف بعد السرد الأول ولم يُقفل؛ يُستعاد في المرة القادمة
+                        continue
+                    dest_path = posixpath.join(SCENES_DIR, scene_name, f"{scene_name}.json")
+                    storage.copy(source_path, dest_path)
+                    search_index.index_asset(
+                        'scene', scene_name,
+                        search_index.code_from_json(storage.read_bytes(dest_path)),
+                        storage.stat(dest_path)[1]
+                    )
+                    restored_scenes.append(scene_name)
+        
+            for item in dirs:
+                source_path = posixpath.join(flow_assets_folder, item)
+            
+                if item.startswith('scene_') and item.endswith('_assets'):
+                    # مجلد أصول مشهد - نسخ الأصول إلى external-import
+                    restored_files += len(_copy_children(source_path, EXTERNAL_IMPORT_DIR))
                         
-                        if os.path.isdir(ext_source):
-                            if os.path.exists(ext_dest):
-                                shutil.rmtree(ext_dest)
-                            shutil.copytree(ext_source, ext_dest)
-                        else:
-                            shutil.copy2(ext_source, ext_dest)
-                        restored_files += 1
+                elif item == 'external_assets':
+                    # أصول خارجية - نسخها مباشرة إلى external-import
+                    restored_files += len(_copy_children(source_path, EXTERNAL_IMPORT_DIR))
+        
+            for scene_name in restored_scenes:
+                change_feed.publish('updated', 'scene', scene_name)
+            change_feed.publish('updated', 'external')
         
         return jsonify({
             'success': True,
@@ -752,6 +1178,9 @@ def restore_flow_assets():
             'restoredScenes': restored_scenes
         })
         
+    except asset_locks.LockTimeout as e:
+        return jsonify({'error': str(e)}), 503
+        
     except Exception as e:
         return jsonify({'error': f'خطأ في استعادة أصول المخطط: {str(e)}'}), 500
 
@@ -0,0 +1,76 @@
+import os
+from flask import Blueprint, jsonify, request, send_file
+from src.utils import profiling
+
+profiling_bp = Blueprint('profiling', __name__)
+
+@profiling_bp.before_request
+def check_token():
+    if not profiling.ENABLED:
+        return jsonify({'error': 'القياس معطل (PROFILING_ENABLED)'}), 404
+    # ملفات القياس تكشف مسارات الشيفرة وتفاصيل الطلبات، فلا تعمل إطلاقاً دون PROFILING_TOKEN
+    if not profiling.TOKEN:
+        return jsonify({'error': 'القياس معطل: PROFILING_TOKEN غير مضبوط'}), 403
+    if not profiling.authorized():
+        return jsonify({'error': 'رمز القياس غير صحيح'}), 401
+
+@profiling_bp.route('/status', methods=['GET'])
+def profiling_status():
+    """حالة القياس في هذا العامل، والطلبات المسلحة، وملفات القياس المتوفرة"""
+    try:
+        return jsonify({
+            'success': True,
+            'sampler': profiling.sampler_state(),
+            'armed': profiling.armed_state(),
+            'directory': profiling.PROFILE_DIR,
+            'files': profiling.list_files()
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب حالة القياس: {str(e)}'}), 500
+
+@profiling_bp.route('/arm', methods=['POST'])
+def arm_requests():
+    """قياس الطلبات التالية بـ cProfile في أي عامل (مثلاً {"count": 3, "endpoint": "assets.list_assets"})"""
+    try:
+        data = request.get_json(silent=True) or {}
+        count = data.get('count', 1)
+        if not isinstance(count, int) or count < 0:
+            return jsonify({'error': 'count يجب أن يكون عدداً صحيحاً موجباً'}), 400
+
+        profiling.arm(count, data.get('endpoint') or None)
+
+        return jsonify({
+            'success': True,
+            'armed': profiling.armed_state()
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في تسليح القياس: {str(e)}'}), 500
+
+@profiling_bp.route('/files/<name>', methods=['GET'])
+def download_profile(name):
+    """تنزيل ملف قياس (.folded لـ flamegraph.pl / speedscope، أو .prof لـ pstats / snakeviz)"""
+    try:
+        if name not in {entry['name'] for entry in profiling.list_files()}:
+            return jsonify({'error': 'الملف غير موجود'}), 404
+
+        mimetype = 'text/plain' if name.endswith('.folded') else 'application/octet-stream'
+        return send_file(os.path.join(profiling.PROFILE_DIR, name), mimetype=mimetype, as_attachment=True)
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في تنزيل ملف القياس: {str(e)}'}), 500
+
+@profiling_bp.route('/files', methods=['DELETE'])
+def clear_profiles():
+    """حذف كل ملفات القياس"""
+    try:
+        removed = profiling.clear_files()
+
+        return jsonify({
+            'success': True,
+            'message': f'تم حذف {removed} ملف'
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في حذف ملفات القياس: {str(e)}'}), 500
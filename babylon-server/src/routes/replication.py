@@ -0,0 +1,124 @@
+import hmac
+import time
+import threading
+from flask import Blueprint, jsonify, request, send_file
+from src.routes.assets import storage, ASSET_DIRS
+from src.utils import replication
+
+replication_bp = Blueprint('replication', __name__)
+
+@replication_bp.before_request
+def check_token():
+    # النسخ يكشف كل ملفات المكتبة ويكتب فيها، فلا يعمل إطلاقاً دون REPLICATION_TOKEN
+    if not replication.TOKEN:
+        return jsonify({'error': 'النسخ معطل: REPLICATION_TOKEN غير مضبوط'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Replication-Token', ''), replication.TOKEN):
+        return jsonify({'error': 'رمز النسخ غير صحيح'}), 401
+
+@replication_bp.route('/manifest', methods=['GET'])
+def get_manifest():
+    """بيان ملفات المكتبة (كامل، أو تزايدي منذ since) لتسحب منه العقد الأخرى"""
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({'error': 'الرقم التسلسلي غير صحيح'}), 400
+
+        try:
+            manifest = replication.build_manifest(storage, ASSET_DIRS, request.args.get('prefix', ''), since)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify(manifest)
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في بناء البيان: {str(e)}'}), 500
+
+@replication_bp.route('/blob', methods=['GET'])
+def get_blob():
+    """محتوى ملف واحد من المكتبة"""
+    try:
+        try:
+            key = replication.check_key(request.args.get('path', ''), ASSET_DIRS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        path = storage.open_local(key) if key else None
+        if path is None:
+            return jsonify({'error': 'الملف غير موجود'}), 404
+
+        return send_file(path, mimetype='application/octet-stream', conditional=False, etag=False)
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في قراءة الملف: {str(e)}'}), 500
+
+@replication_bp.route('/pull', methods=['POST'])
+def pull_from_peers():
+    """سحب التغييرات من العقد المسموح بها في REPLICATION_PEERS (في الخلفية، أو فوراً مع wait)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        peer = (data.get('peer') or '').rstrip('/')
+        prefix = data.get('prefix', '')
+        full = bool(data.get('full', False))
+        wait = bool(data.get('wait', False))
+
+        if peer and peer not in replication.PEERS:
+            return jsonify({'error': 'العقدة غير موجودة في REPLICATION_PEERS'}), 403
+        peers = [peer] if peer else replication.PEERS
+        if not peers:
+            return jsonify({'error': 'لم يتم ضبط أي عقدة في REPLICATION_PEERS'}), 400
+
+        try:
+            replication.check_key(prefix, ASSET_DIRS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def run():
+            started_at = time.time()
+            replication.save_last_pull({'running': True, 'started_at': started_at, 'results': []})
+            results = []
+            for target in peers:
+                # أي خطأ (من التخزين أو الشبكة) يُسجل لهذه العقدة ولا يوقف الخيط الخلفي بصمت
+                try:
+                    results.append(replication.pull(storage, ASSET_DIRS, target, prefix, full))
+                except Exception as e:
+                    results.append({'peer': target, 'error': str(e)})
+            replication.save_last_pull({
+                'running': False,
+                'started_at': started_at,
+                'finished_at': time.time(),
+                'success': all('error' not in result for result in results),
+                'results': results
+            })
+            return results
+
+        if not wait:
+            # السحب قد يتجاوز مهلة عامل gunicorn، لذا يعمل في خيط خلفي وتُتابع نتيجته عبر /status
+            threading.Thread(target=run, name='replication-pull', daemon=True).start()
+            return jsonify({'success': True, 'message': 'بدأ السحب في الخلفية', 'peers': peers}), 202
+
+        results = run()
+        return jsonify({
+            'success': all('error' not in result for result in results),
+            'results': results
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في السحب: {str(e)}'}), 500
+
+@replication_bp.route('/status', methods=['GET'])
+def replication_status():
+    """معرّف هذه العقدة وآخر رقم تسلسلي سُحب من كل عقدة، ونتيجة آخر سحب (الخلفي منه أيضاً)"""
+    try:
+        return jsonify({
+            'success': True,
+            'node': replication.node_id(),
+            'peers': replication.PEERS,
+            'state': replication.load_state(),
+            'lastPull': replication.load_last_pull()
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'خطأ في قراءة الحالة: {str(e)}'}), 500
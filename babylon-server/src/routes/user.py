@@ -1,12 +1,130 @@
+import os
+from urllib.parse import quote, urlencode
+
 from flask import Blueprint, jsonify, request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from src.models.user import User, db
+from src.utils import database
+from src.utils import request_body
 
 user_bp = Blueprint('user', __name__)
 
+# حجم الصفحة الافتراضي والأقصى لقائمة المستخدمين (ترقيم بالمؤشر بدلاً من OFFSET)
+PAGE_SIZE = int(os.getenv('USERS_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('USERS_MAX_PAGE_SIZE', '1000'))
+# العمليات الجماعية: معاملة واحدة لكل طلب، والجمل تُرسل على دفعات من BULK_BATCH_SIZE صفاً
+BULK_MAX_ITEMS = int(os.getenv('USERS_BULK_MAX_ITEMS', '10000'))
+BULK_BATCH_SIZE = int(os.getenv('USERS_BULK_BATCH_SIZE', '500'))
+
+SORT_COLUMNS = {'id': User.id, 'username': User.username, 'email': User.email}
+FIELD_LIMITS = {'username': 80, 'email': 120}
+
+
+def _prefix_filter(column, prefix):
+    """بحث بالبادئة كنطاق [prefix, prefix التالي) فيستخدم الفهرس الفريد (LIKE في SQLite لا يستخدمه)"""
+    last = prefix[-1]
+    if ord(last) >= 0x10FFFF:
+        return column.startswith(prefix, autoescape=True)
+    return (column >= prefix) & (column < prefix[:-1] + chr(ord(last) + 1))
+
+
+def _batches(items):
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        yield items[start:start + BULK_BATCH_SIZE]
+
+
+def _parse_bulk_items(key):
+    data = request_body.parse_body(request)
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise request_body.BodyError(f'{key} يجب أن يكون قائمة غير فارغة')
+    if len(items) > BULK_MAX_ITEMS:
+        raise request_body.BodyError(f'الحد الأقصى {BULK_MAX_ITEMS} عنصر في الطلب الواحد', 413)
+    return items
+
+
+def _validate_fields(item, required):
+    """القيم النصية للحقول المرسلة، أو رسالة خطأ"""
+    values = {}
+    for field, limit in FIELD_LIMITS.items():
+        if field not in item:
+            if required:
+                return None, f'{field} مطلوب'
+            continue
+        value = item[field]
+        if not isinstance(value, str) or not value.strip() or len(value) > limit:
+            return None, f'{field} يجب أن يكون نصاً غير فارغ بطول {limit} حرفاً على الأكثر'
+        values[field] = value
+    return values, None
+
+
+def _duplicate_values(rows):
+    """قيمة مكررة داخل الطلب نفسه لحقل فريد (قبل الوصول إلى قاعدة البيانات)"""
+    for field in FIELD_LIMITS:
+        seen = set()
+        for row in rows:
+            value = row.get(field)
+            if value is None:
+                continue
+            if value in seen:
+                return f'{field} مكرر في الطلب: {value}'
+            seen.add(value)
+    return None
+
+
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    """المستخدمون مرتبين حسب sort (id أو username أو email)؛ username= و email= للبحث بالبادئة.
+    مع limit أو after: صفحة بعد المؤشر after ومؤشر الصفحة التالية في ترويستي X-Next-Cursor و Link،
+    وبدونهما القائمة كاملة كما كانت (للعملاء الحاليين)"""
+    sort = request.args.get('sort', 'id')
+    if sort not in SORT_COLUMNS:
+        return jsonify({'error': f"sort يجب أن يكون أحد: {', '.join(SORT_COLUMNS)}"}), 400
+    column = SORT_COLUMNS[sort]
+
+    after = request.args.get('after')
+    paginated = 'limit' in request.args or after is not None
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit يجب أن يكون عدداً صحيحاً'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit يجب أن يكون بين 1 و {MAX_PAGE_SIZE}'}), 400
+
+    # أعمدة فقط دون كائنات ORM (نفس مفاتيح to_dict)؛ بناء الكائنات كان معظم زمن الصفحة
+    query = select(User.id, User.username, User.email)
+    if after is not None:
+        if sort == 'id':
+            try:
+                after = int(after)
+            except ValueError:
+                return jsonify({'error': 'after يجب أن يكون معرف مستخدم'}), 400
+        query = query.where(column > after)
+
+    for field in ('username', 'email'):
+        prefix = request.args.get(field)
+        if prefix:
+            query = query.where(_prefix_filter(SORT_COLUMNS[field], prefix))
+
+    query = query.order_by(column)
+    if not paginated:
+        return jsonify([row._asdict() for row in db.session.execute(query)])
+
+    # صف إضافي يكشف وجود صفحة تالية دون COUNT
+    users = [row._asdict() for row in db.session.execute(query.limit(limit + 1))]
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    response = jsonify(users)
+    if has_more:
+        cursor = users[-1][sort]
+        args = request.args.to_dict()
+        args.update({'after': cursor, 'limit': limit})
+        # مرمّز للرابط: الترويسات لا تقبل إلا latin-1 وأسماء المستخدمين قد تكون عربية
+        response.headers['X-Next-Cursor'] = quote(str(cursor), safe='')
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
@@ -17,6 +135,132 @@ def create_user():
     db.session.commit()
     return jsonify(user.to_dict()), 201
 
+@user_bp.route('/users/bulk', methods=['POST'])
+def bulk_create_users():
+    """إنشاء عدة مستخدمين في معاملة واحدة: {"users": [{"username": ..., "email": ...}, ...]}"""
+    try:
+        try:
+            items = _parse_bulk_items('users')
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
+
+        rows = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                return jsonify({'error': f'العنصر {index} يجب أن يكون كائناً'}), 400
+            values, error = _validate_fields(item, required=True)
+            if error:
+                return jsonify({'error': f'العنصر {index}: {error}'}), 400
+            rows.append(values)
+        duplicate = _duplicate_values(rows)
+        if duplicate:
+            return jsonify({'error': duplicate}), 400
+
+        ids = []
+        try:
+            database.begin_write(db.session)
+            for batch in _batches(rows):
+                result = db.session.execute(insert(User).returning(User.id, sort_by_parameter_order=True), batch)
+                ids.extend(result.scalars().all())
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'اسم مستخدم أو بريد إلكتروني مستخدم مسبقاً، لم يُنشأ أي مستخدم'}), 409
+
+        return jsonify({
+            'success': True,
+            'created': len(ids),
+            'ids': ids
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في إنشاء المستخدمين: {str(e)}'}), 500
+
+@user_bp.route('/users/bulk', methods=['PATCH'])
+def bulk_update_users():
+    """تعديل عدة مستخدمين في معاملة واحدة: {"users": [{"id": 1, "email": ...}, ...]}؛ المعرفات غير الموجودة تُعاد في missing"""
+    try:
+        try:
+            items = _parse_bulk_items('users')
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
+
+        rows = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get('id'), int) or isinstance(item.get('id'), bool):
+                return jsonify({'error': f'العنصر {index} يجب أن يحتوي على id صحيح'}), 400
+            values, error = _validate_fields(item, required=False)
+            if error:
+                return jsonify({'error': f'العنصر {index}: {error}'}), 400
+            if values:
+                values['id'] = item['id']
+                rows.append(values)
+        if len({row['id'] for row in rows}) != len(rows):
+            return jsonify({'error': 'id مكرر في الطلب'}), 400
+        duplicate = _duplicate_values(rows)
+        if duplicate:
+            return jsonify({'error': duplicate}), 400
+
+        missing = []
+        updated = 0
+        try:
+            database.begin_write(db.session)
+            for batch in _batches(rows):
+                ids = [row['id'] for row in batch]
+                existing = set(db.session.execute(select(User.id).where(User.id.in_(ids))).scalars())
+                missing.extend(user_id for user_id in ids if user_id not in existing)
+                batch = [row for row in batch if row['id'] in existing]
+                if batch:
+                    # تحديث جماعي بالمفتاح الأساسي (executemany لكل مجموعة حقول)
+                    db.session.execute(update(User), batch)
+                    updated += len(batch)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'اسم مستخدم أو بريد إلكتروني مستخدم مسبقاً، لم يُعدَّل أي مستخدم'}), 409
+
+        return jsonify({
+            'success': True,
+            'updated': updated,
+            'missing': missing
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في تعديل المستخدمين: {str(e)}'}), 500
+
+@user_bp.route('/users/bulk', methods=['DELETE'])
+def bulk_delete_users():
+    """حذف عدة مستخدمين في معاملة واحدة: {"ids": [1, 2, 3]}"""
+    try:
+        try:
+            ids = _parse_bulk_items('ids')
+        except request_body.BodyError as e:
+            return jsonify({'error': str(e)}), e.status
+        if not all(isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in ids):
+            return jsonify({'error': 'ids يجب أن تكون أعداداً صحيحة'}), 400
+        ids = list(dict.fromkeys(ids))
+
+        deleted = 0
+        database.begin_write(db.session)
+        for batch in _batches(ids):
+            result = db.session.execute(
+                delete(User).where(User.id.in_(batch)),
+                execution_options={'synchronize_session': False}
+            )
+            deleted += result.rowcount
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'deleted': deleted
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في حذف المستخدمين: {str(e)}'}), 500
+
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
@@ -0,0 +1,161 @@
+import os
+import fcntl
+import hashlib
+import multiprocessing
+
+from flask import g, jsonify, request
+
+from src.utils import metrics
+from src.utils.runtime import runtime_path
+
+# التحكم في القبول: العمليات الثقيلة (رفع، تجميع، استعادة، بث) تُحصر بعدد محدود من العمال
+# على مستوى الخادم ولكل عميل، فيبقى دائماً عمال متاحون للطلبات الخفيفة مثل load و/api/users.
+# كل خانة تنفيذ ملف قفل flock: الطلب يحجز خانة حرة دون انتظار، والنواة تحررها تلقائياً إذا مات العامل.
+SLOT_DIR = os.path.dirname(runtime_path('admission', 'x'))
+ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() != 'false'
+WORKERS = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+THREADS = int(os.getenv('GUNICORN_THREADS', '8'))
+RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '2'))
+TRUST_PROXY = os.getenv('ADMISSION_TRUST_PROXY', 'false').lower() == 'true'
+# خانات العملاء في عدد ثابت من المجموعات (حسب بصمة العنوان) فلا ينمو عدد ملفات القفل مع عدد العملاء؛
+# عميلان في نفس المجموعة يتشاركان الحد لكل عميل
+CLIENT_BUCKETS = int(os.getenv('ADMISSION_CLIENT_BUCKETS', '1024'))
+
+# الفئة -> (الحد الكلي، الحد لكل عميل)؛ الافتراضي يترك نصف العمال على الأقل للطلبات الخفيفة
+LIMITS = {
+    'heavy': (
+        int(os.getenv('ADMISSION_HEAVY_GLOBAL', str(max(1, WORKERS // 2)))),
+        int(os.getenv('ADMISSION_HEAVY_PER_CLIENT', '2'))
+    ),
+    # بث التغييرات يحجز خيطاً (عمال gthread) طوال مدة الاتصال؛ يبقى نصف الخيوط للطلبات الأخرى
+    'stream': (
+        int(os.getenv('ADMISSION_STREAM_GLOBAL', str(max(1, WORKERS * THREADS // 2)))),
+        int(os.getenv('ADMISSION_STREAM_PER_CLIENT', '2'))
+    )
+}
+
+HEAVY_ENDPOINTS = {
+    'assets.import_external_assets': 'heavy',
+    'assets.move_external_to_project': 'heavy',
+    'assets.copy_project_assets': 'heavy',
+    'assets.bundle_scene_assets': 'heavy',
+    'assets.bundle_flow_project': 'heavy',
+    'assets.restore_flow_assets': 'heavy',
+    'assets.search_assets': 'heavy',
+    'assets.inspect_external_mesh': 'heavy',
+    'assets.stream_changes': 'stream',
+    'replication.get_manifest': 'heavy',
+    'replication.pull_from_peers': 'heavy',
+    'user.bulk_create_users': 'heavy',
+    'user.bulk_update_users': 'heavy',
+    'user.bulk_delete_users': 'heavy'
+}
+
+# حدود حجم الجسم تُفحص من Content-Length قبل قراءة أي بايت
+MAX_UPLOAD_BYTES = int(os.getenv('ADMISSION_MAX_UPLOAD_BYTES', str(512 * 1024 * 1024)))
+MAX_BODY_BYTES = int(os.getenv('ADMISSION_MAX_BODY_BYTES', str(32 * 1024 * 1024)))
+UPLOAD_ENDPOINTS = {'assets.import_external_assets'}
+
+metrics.describe('admission_rejected_total', 'Heavy requests rejected with 429, by class and limit')
+metrics.describe('admission_body_rejected_total', 'Requests rejected for exceeding the body size limit')
+
+
+def client_id():
+    """هوية العميل: عنوان IP (أو أول عنوان في X-Forwarded-For خلف وكيل موثوق)"""
+    if TRUST_PROXY:
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+
+def _try_slot(prefix, limit):
+    """حجز أول خانة حرة من limit خانات، أو None إذا كانت كلها مشغولة"""
+    for index in range(limit):
+        slot_file = open(os.path.join(SLOT_DIR, f"{prefix}-{index}.lock"), 'a')
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot_file
+        except BlockingIOError:
+            slot_file.close()
+    return None
+
+
+def _reject(status, message, **headers):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers.update(headers)
+    return response
+
+
+def _check_body():
+    limit = MAX_UPLOAD_BYTES if request.endpoint in UPLOAD_ENDPOINTS else MAX_BODY_BYTES
+    # يُطبَّق أيضاً على الأجسام بدون Content-Length أثناء القراءة المتدفقة
+    request.max_content_length = limit
+    if request.content_length is not None and request.content_length > limit:
+        metrics.inc('admission_body_rejected_total')
+        return _reject(413, f'حجم الطلب يتجاوز الحد المسموح ({limit} بايت)')
+    if request.endpoint in UPLOAD_ENDPOINTS and request.content_length is None and request.method == 'POST':
+        return _reject(411, 'رفع الملفات يتطلب ترويسة Content-Length')
+    return None
+
+
+def _admit():
+    """حجز خانة تنفيذ للطلب الثقيل، أو رد 429 مع Retry-After عند التشبع"""
+    g.admission_slots = []
+    g.admission_deferred = False
+    if not ENABLED or request.method == 'OPTIONS':
+        return None
+
+    response = _check_body()
+    if response is not None:
+        return response
+
+    request_class = HEAVY_ENDPOINTS.get(request.endpoint)
+    if request_class is None:
+        return None
+    global_limit, client_limit = LIMITS[request_class]
+
+    # خانة العميل أولاً: عميل واحد يكرر الطلبات لا يستهلك الخانات الكلية
+    bucket = int(hashlib.sha1(client_id().encode('utf-8')).hexdigest(), 16) % CLIENT_BUCKETS
+    client_slot = _try_slot(f"{request_class}-client-{bucket}", client_limit)
+    if client_slot is None:
+        metrics.inc('admission_rejected_total', **{'class': request_class, 'limit': 'client'})
+        return _reject(429, 'عدد كبير من العمليات الجارية لهذا العميل، حاول لاحقاً', **{'Retry-After': str(RETRY_AFTER)})
+    g.admission_slots.append(client_slot)
+
+    global_slot = _try_slot(f"{request_class}-global", global_limit)
+    if global_slot is None:
+        _release(g.admission_slots)
+        metrics.inc('admission_rejected_total', **{'class': request_class, 'limit': 'global'})
+        return _reject(429, 'الخادم مشغول بعمليات ثقيلة، حاول لاحقاً', **{'Retry-After': str(RETRY_AFTER)})
+    g.admission_slots.append(global_slot)
+    return None
+
+
+def _release(slots):
+    # إغلاق الملف يحرر قفل flock
+    for slot_file in slots:
+        slot_file.close()
+    del slots[:]
+
+
+def _defer_release(response):
+    # الاستجابات المتدفقة (SSE، send_file) تستمر بعد انتهاء الدالة، فتُحرر الخانة عند إغلاق الاستجابة
+    slots = getattr(g, 'admission_slots', None)
+    if slots:
+        g.admission_deferred = True
+        response.call_on_close(lambda: _release(slots))
+    return response
+
+
+def _teardown(error=None):
+    slots = getattr(g, 'admission_slots', None)
+    if slots and not getattr(g, 'admission_deferred', False):
+        _release(slots)
+
+
+def init_app(app):
+    app.before_request(_admit)
+    app.after_request(_defer_release)
+    app.teardown_request(_teardown)
@@ -0,0 +1,85 @@
+import os
+import time
+import fcntl
+import hashlib
+from contextlib import contextmanager
+
+from src.utils import metrics
+from src.utils.runtime import runtime_path
+
+# أقفال قراءة/كتابة بين العمليات لكل أصل عبر flock (مشترك للقراءة، حصري للكتابة).
+# المفاتيح تُوزع بالتجزئة على عدد ثابت من ملفات القفل (ASSET_LOCK_STRIPES) فلا يتراكم ملف لكل أصل؛
+# أصلان في نفس الشريحة يتسلسلان، وهذا نادر مع عدد شرائح كافٍ.
+# القراءات البسيطة (load, list, thumbnail) لا تأخذ أي قفل لأن الكتابة ذرية (ملف مؤقت ثم replace)؛
+# الأقفال المشتركة للعمليات التي تقرأ شجرة كاملة (نسخ، تجميع) حتى لا ترى شجرة نصف محذوفة.
+LOCK_DIR = os.path.dirname(runtime_path('locks', 'x'))
+LOCK_TIMEOUT = float(os.getenv('ASSET_LOCK_TIMEOUT', '20'))
+STRIPES = int(os.getenv('ASSET_LOCK_STRIPES', '256'))
+# مجلد الاستيراد الخارجي مساحة عمل واحدة مشتركة، فله مفتاح واحد
+EXTERNAL = 'external'
+
+metrics.describe('asset_lock_wait_seconds', 'Time spent waiting for per-asset locks')
+metrics.describe('asset_lock_timeouts_total', 'Asset lock acquisitions that gave up after ASSET_LOCK_TIMEOUT')
+
+
+class LockTimeout(Exception):
+    """لم يتم الحصول على القفل خلال ASSET_LOCK_TIMEOUT"""
+
+
+def asset_key(asset_type, name):
+    return f"{asset_type}/{name}"
+
+
+def _stripe(key):
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % STRIPES
+
+
+def _lock_path(stripe):
+    return os.path.join(LOCK_DIR, f"stripe-{stripe}.lock")
+
+
+def _acquire(lock_file, operation, deadline):
+    # محاولة فورية أولاً (الحالة الشائعة بلا تنافس)، ثم انتظار متزايد حتى المهلة
+    delay = 0.001
+    while True:
+        try:
+            fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise LockTimeout('الأصل مشغول بعملية أخرى، حاول مرة أخرى')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+
+@contextmanager
+def locked(writes=(), reads=(), timeout=None):
+    """أخذ أقفال الكتابة والقراءة المطلوبة معاً بترتيب الشرائح (لتجنب الجمود) وتسجيل زمن الانتظار.
+    كل شريحة تُقفل مرة واحدة والكتابة تغلب القراءة، وإلا لانتظر الطلب قفله هو على نفس الملف"""
+    operations = {_stripe(key): fcntl.LOCK_SH for key in reads}
+    operations.update({_stripe(key): fcntl.LOCK_EX for key in writes})
+    mode = 'write' if writes else 'read'
+    started = time.monotonic()
+    deadline = started + (LOCK_TIMEOUT if timeout is None else timeout)
+    files = []
+    try:
+        for stripe in sorted(operations):
+            lock_file = open(_lock_path(stripe), 'a')
+            files.append(lock_file)
+            _acquire(lock_file, operations[stripe], deadline)
+    except LockTimeout:
+        for lock_file in files:
+            lock_file.close()
+        metrics.inc('asset_lock_timeouts_total', mode=mode)
+        raise
+    except BaseException:
+        for lock_file in files:
+            lock_file.close()
+        raise
+    metrics.observe('asset_lock_wait_seconds', time.monotonic() - started, mode=mode)
+    try:
+        yield
+    finally:
+        # إغلاق الملف يحرر قفل flock
+        for lock_file in files:
+            lock_file.close()
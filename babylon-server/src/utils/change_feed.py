@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import fcntl
+import struct
+import select
+import threading
+import ctypes
+import ctypes.util
+
+from src.utils.runtime import is_temp_path, runtime_path, temp_path
+
+# سجل التغييرات مشترك بين جميع عمليات gunicorn: ملف JSON lines يحمل كل سطر فيه حدثاً برقم تسلسلي
+JOURNAL_PATH = runtime_path('changes', 'changes.log')
+JOURNAL_LOCK_PATH = runtime_path('changes', 'changes.lock')
+WATCHER_LOCK_PATH = runtime_path('changes', 'watcher.lock')
+
+JOURNAL_MAX_BYTES = int(os.getenv('CHANGE_FEED_MAX_BYTES', str(4 * 1024 * 1024)))
+JOURNAL_KEEP_EVENTS = int(os.getenv('CHANGE_FEED_KEEP_EVENTS', '5000'))
+# البث يدمج الأحداث المتتالية من نفس النوع لنفس الأصل خلال هذه النافذة (السجل نفسه يحتفظ بكل حدث)
+DEDUPE_WINDOW = float(os.getenv('CHANGE_FEED_DEDUPE_SECONDS', '1.0'))
+# العمال من نوع sync يُقتلون إذا تجاوز الطلب مهلة gunicorn، لذا يُغلق البث قبلها ويعيد العميل الاتصال بـ Last-Event-ID
+STREAM_SECONDS = float(os.getenv('CHANGE_FEED_STREAM_SECONDS', '25'))
+POLL_INTERVAL = 0.05
+HEARTBEAT_INTERVAL = 10.0
+
+_state_lock = threading.Lock()
+_journal_inode = None
+_journal_offset = 0
+_last_id = 0
+_listeners = []
+
+
+def add_listener(callback):
+    """تسجيل دالة تُستدعى مع كل حدث منشور في هذه العملية، مثل إبطال الذاكرة المؤقتة"""
+    _listeners.append(callback)
+
+
+def _read_lines(f, offset):
+    """قراءة الأسطر الكاملة من موضع معين وإرجاعها مع الموضع الجديد"""
+    f.seek(offset)
+    data = f.read()
+    end = data.rfind(b'\n') + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events, offset + end
+
+
+def _catch_up():
+    """مزامنة الحالة المحلية مع ما كتبته العمليات الأخرى في السجل"""
+    global _journal_inode, _journal_offset, _last_id
+    try:
+        st = os.stat(JOURNAL_PATH)
+    except FileNotFoundError:
+        _journal_inode, _journal_offset = None, 0
+        return
+    if st.st_ino != _journal_inode or st.st_size < _journal_offset:
+        _journal_inode, _journal_offset = st.st_ino, 0
+    if st.st_size == _journal_offset:
+        return
+    with open(JOURNAL_PATH, 'rb') as f:
+        events, _journal_offset = _read_lines(f, _journal_offset)
+    for event in events:
+        _last_id = max(_last_id, event.get('id', 0))
+
+
+def _coalesce(events):
+    """حذف الأحداث التي يليها في نفس الدفعة حدث من نفس النوع لنفس الأصل خلال DEDUPE_WINDOW
+    (من الواجهة ومن inotify معاً)؛ يبقى الأحدث فلا يفوت العميل آخر حالة"""
+    latest = {}
+    for event in events:
+        latest[(event.get('asset_type'), event.get('name'), event.get('kind'))] = event
+    kept = []
+    for event in events:
+        last = latest[(event.get('asset_type'), event.get('name'), event.get('kind'))]
+        if last is not event and last.get('ts', 0) - event.get('ts', 0) <= DEDUPE_WINDOW:
+            continue
+        kept.append(event)
+    return kept
+
+
+def _compact():
+    """الاحتفاظ بآخر الأحداث فقط عندما يتجاوز السجل الحجم الأقصى"""
+    global _journal_inode, _journal_offset
+    with open(JOURNAL_PATH, 'rb') as f:
+        lines = f.read().splitlines()[-JOURNAL_KEEP_EVENTS:]
+    tmp_path = temp_path(JOURNAL_PATH)
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\n'.join(lines) + b'\n')
+    os.replace(tmp_path, JOURNAL_PATH)
+    st = os.stat(JOURNAL_PATH)
+    _journal_inode, _journal_offset = st.st_ino, st.st_size
+
+
+def publish(kind, asset_type, name='', source='api'):
+    """نشر حدث تغيير (created, updated, deleted, resync) لكل المشتركين في البث"""
+    global _journal_inode, _journal_offset, _last_id
+    event = {
+        'kind': kind,
+        'asset_type': asset_type,
+        'name': name,
+        'source': source,
+        'ts': time.time()
+    }
+    for callback in _listeners:
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"WARNING: change feed listener failed: {e}")
+    try:
+        with _state_lock, open(JOURNAL_LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # كل حدث يأخذ رقماً في السجل: المستهلكون (النسخ، الفهرس) يعتمدون عليه ولا يُدمج شيء هنا
+                _catch_up()
+                event['id'] = _last_id + 1
+                line = json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n'
+                with open(JOURNAL_PATH, 'ab') as f:
+                    f.write(line)
+                    _journal_inode = os.fstat(f.fileno()).st_ino
+                _journal_offset += len(line)
+                _last_id = event['id']
+                if _journal_offset > JOURNAL_MAX_BYTES:
+                    _compact()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    except OSError as e:
+        # فشل البث لا يجب أن يُفشل عملية الحفظ نفسها
+        print(f"WARNING: change feed publish failed: {e}")
+        return None
+    return event
+
+
+def read_since(since):
+    """(الأحداث بعد since، آخر رقم تسلسلي، هل السجل كامل منذ since) لمن يحتاج قراءة دفعة واحدة بدل البث"""
+    try:
+        with open(JOURNAL_PATH, 'rb') as f:
+            events, _ = _read_lines(f, 0)
+    except FileNotFoundError:
+        events = []
+    newest = events[-1]['id'] if events else 0
+    oldest = events[0]['id'] if events else 0
+    # رقم أكبر من آخر حدث يعني أن السجل أُعيد إنشاؤه، وفجوة في البداية تعني أن الضغط حذف أحداثاً مطلوبة
+    complete = since <= newest and (not events or oldest <= since + 1)
+    return [event for event in events if event.get('id', 0) > since], newest, complete
+
+
+def _format_event(event):
+    return f"id: {event['id']}\nevent: change\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def _format_reset(last_id):
+    return f"id: {last_id}\nevent: reset\ndata: {json.dumps({'last_id': last_id})}\n\n"
+
+
+def stream(since=None, asset_types=None, duration=STREAM_SECONDS):
+    """مولّد Server-Sent Events يتابع السجل ابتداءً من الحدث التالي لـ since (أو من الآن إذا كان None)"""
+    yield 'retry: 1000\n\n'
+    deadline = time.monotonic() + duration
+    last_beat = time.monotonic()
+    f = None
+    inode = None
+    position = 0
+    try:
+        while time.monotonic() < deadline:
+            try:
+                st = os.stat(JOURNAL_PATH)
+            except FileNotFoundError:
+                st = None
+
+            if st is not None and (st.st_ino != inode or st.st_size < position):
+                # ملف جديد أو تم ضغط السجل: إعادة الفتح والتحقق من عدم ضياع أحداث
+                if f:
+                    f.close()
+                f = open(JOURNAL_PATH, 'rb')
+                inode, position = st.st_ino, 0
+                events, position = _read_lines(f, position)
+                newest = events[-1]['id'] if events else 0
+                oldest = events[0]['id'] if events else 0
+                if since is None:
+                    since = newest
+                elif since and (since > newest or oldest > since + 1):
+                    since = newest
+                    yield _format_reset(newest)
+            elif st is not None and st.st_size > position:
+                events, position = _read_lines(f, position)
+            else:
+                events = []
+                if st is None:
+                    if since:
+                        yield _format_reset(0)
+                    since = 0
+
+            sent = False
+            events = [event for event in events if event.get('id', 0) > since]
+            if events:
+                since = events[-1]['id']
+            for event in _coalesce(events):
+                if asset_types and event.get('asset_type') not in asset_types and event.get('asset_type') != '*':
+                    continue
+                sent = True
+                yield _format_event(event)
+
+            now = time.monotonic()
+            if sent:
+                last_beat = now
+            elif now - last_beat >= HEARTBEAT_INTERVAL:
+                last_beat = now
+                yield ': keep-alive\n\n'
+            else:
+                time.sleep(POLL_INTERVAL)
+    finally:
+        if f:
+            f.close()
+
+
+# ===== مراقبة نظام الملفات عبر inotify (لينكس فقط) =====
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class AssetWatcher:
+    """يحوّل إشعارات النواة لمجلدات الأصول إلى أحداث في سجل التغييرات"""
+
+    def __init__(self, roots):
+        # roots: نوع الأصل -> المجلد الجذر (external يعني مجلد الاستيراد الخارجي)
+        self.roots = dict(roots)
+        self.libc = _load_libc()
+        self.fd = None
+        self.watches = {}  # wd -> (asset_type, path)
+        self.watched_roots = set()
+
+    def _add_watch(self, asset_type, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = (asset_type, path)
+
+    def _add_tree(self, asset_type, path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            self._add_watch(asset_type, dirpath)
+
+    def _watch_missing_roots(self):
+        for asset_type, root in self.roots.items():
+            if root not in self.watched_roots and os.path.isdir(root):
+                self._add_tree(asset_type, root)
+                self.watched_roots.add(root)
+
+    def _classify(self, asset_type, path, mask):
+        """تحديد (النوع، الاسم، الحدث) لإشعار واحد أو None إذا لم يكن له معنى على مستوى الأصول"""
+        root = self.roots[asset_type]
+        rel = os.path.relpath(path, root)
+        is_dir = bool(mask & IN_ISDIR)
+        if not is_dir and is_temp_path(path):
+            # الملف المؤقت للكتابة الذرية؛ الاستبدال يصل كإشعار IN_MOVED_TO باسم الملف النهائي
+            return None
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            kind = 'created'
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            kind = 'deleted'
+        else:
+            kind = 'updated'
+
+        if asset_type == 'external':
+            # في مجلد الاستيراد كل ملف عنصر مستقل
+            if is_dir and kind == 'created':
+                return None
+            return asset_type, rel, kind
+
+        parts = rel.split(os.sep)
+        name = parts[0]
+        if len(parts) == 1:
+            # مجلد الأصل نفسه؛ الملفات المباشرة في الجذر ليست أصولاً
+            return (asset_type, name, kind) if is_dir else None
+        if kind == 'created' and len(parts) == 2 and parts[1] == f"{name}.json":
+            return asset_type, name, 'created'
+        return asset_type, name, 'updated'
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            publish('resync', '*', '', source='watcher')
+            return
+        watch = self.watches.get(wd)
+        if watch is None:
+            return
+        if mask & IN_IGNORED:
+            del self.watches[wd]
+            return
+        asset_type, dirpath = watch
+        root = self.roots[asset_type]
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if dirpath == root:
+                self.watched_roots.discard(root)
+                publish('deleted', asset_type, '', source='watcher')
+            return
+        path = os.path.join(dirpath, name) if name else dirpath
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self._add_tree(asset_type, path)
+        change = self._classify(asset_type, path, mask)
+        if change:
+            publish(change[2], change[0], change[1], source='watcher')
+
+    def run(self):
+        if self.libc is None:
+            print("WARNING: inotify is not available, change feed relies on API events only")
+            return
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            print(f"WARNING: inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return
+        while True:
+            self._watch_missing_roots()
+            ready, _, _ = select.select([self.fd], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+                offset += length
+                try:
+                    self._handle(wd, mask, name)
+                except Exception as e:
+                    print(f"WARNING: change feed watcher error: {e}")
+
+
+_watcher_pid = None
+
+
+def _watch_as_leader(roots):
+    # عامل واحد فقط يراقب الملفات؛ البقية تنتظر القفل وتتولى المراقبة إذا توقف العامل الحالي
+    lock_file = open(WATCHER_LOCK_PATH, 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    AssetWatcher(roots).run()
+
+
+def ensure_watcher(roots):
+    """تشغيل خيط المراقبة مرة واحدة لكل عملية (بعد fork في gunicorn)"""
+    global _watcher_pid
+    if _watcher_pid == os.getpid():
+        return
+    _watcher_pid = os.getpid()
+    threading.Thread(target=_watch_as_leader, args=(roots,), name='asset-watcher', daemon=True).start()
@@ -0,0 +1,108 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# إعداد قاعدة البيانات للعمل مع عدة عمال gunicorn:
+# - SQLite بوضع WAL (القراء لا ينتظرون الكاتب) مع مهلة انتظار للقفل بدلاً من خطأ "database is locked" فوراً
+# - مجمع اتصالات لكل عامل: اتصالات العملية الأم تُهمل بعد fork (post_fork) فلا يتشارك عاملان اتصالاً واحداً
+DEFAULT_DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')
+# القيمة القديمة في .env.example (ملف نسبي لم يُستخدم قط): تُتجاهل حتى لا تفتح النسخ المنسوخة منه قاعدة فارغة
+LEGACY_DATABASE_URL = 'sqlite:///babylon_game.db'
+DATABASE_URL = os.getenv('DATABASE_URL') or f"sqlite:///{DEFAULT_DATABASE_PATH}"
+if DATABASE_URL == LEGACY_DATABASE_URL:
+    print(f"WARNING: ignoring legacy DATABASE_URL={LEGACY_DATABASE_URL}, using {DEFAULT_DATABASE_PATH}")
+    DATABASE_URL = f"sqlite:///{DEFAULT_DATABASE_PATH}"
+POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', '30'))
+
+# ثوانٍ ينتظرها الاتصال قبل SQLITE_BUSY عندما يحمل عامل آخر قفل الكتابة
+BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '15'))
+JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL').upper()
+# NORMAL آمن مع WAL (قد تضيع آخر معاملة عند انقطاع الكهرباء فقط، دون إتلاف الملف)
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))
+MMAP_BYTES = int(os.getenv('SQLITE_MMAP_BYTES', str(128 * 1024 * 1024)))
+
+_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+_SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+_engines = []
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _is_memory(url):
+    return make_url(url).database in (None, '', ':memory:')
+
+
+def engine_options(url):
+    """خيارات create_engine: حجم المجمع ومهلته، ومهلة القفل لاتصالات SQLite"""
+    if not is_sqlite(url):
+        return {'pool_size': POOL_SIZE, 'pool_timeout': POOL_TIMEOUT, 'pool_pre_ping': True}
+    if _is_memory(url):
+        # Flask-SQLAlchemy يستخدم StaticPool لقاعدة الذاكرة (اتصال واحد)
+        return {}
+    return {
+        'pool_size': POOL_SIZE,
+        'pool_timeout': POOL_TIMEOUT,
+        'connect_args': {'timeout': BUSY_TIMEOUT}
+    }
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        if JOURNAL_MODE in _JOURNAL_MODES:
+            cursor.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        if SYNCHRONOUS in _SYNCHRONOUS_MODES:
+            cursor.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def init_app(app, db):
+    """ربط db بالتطبيق مع ضبط SQLite لكل اتصال جديد (يُستدعى بدلاً من db.init_app)"""
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', DATABASE_URL)
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    options = engine_options(url)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+    if is_sqlite(url):
+        event.listen(engine, 'connect', _apply_pragmas)
+    _engines.append(engine)
+    return engine
+
+
+def release_connections():
+    """إغلاق اتصالات المجمع في العملية الأم قبل fork (بعد create_all مثلاً)"""
+    for engine in _engines:
+        engine.dispose()
+
+
+def after_fork():
+    """في العامل بعد fork: مجمع جديد دون إغلاق اتصالات ورثها من الأم (ما زالت ملكها)"""
+    for engine in _engines:
+        engine.dispose(close=False)
+
+
+def begin_write(session):
+    """بدء معاملة كتابة بـ BEGIN IMMEDIATE في SQLite.
+    المعاملة المؤجلة التي تقرأ ثم تكتب قد تفشل بـ SQLITE_BUSY فوراً دون انتظار busy_timeout
+    إذا كتب عامل آخر بينهما؛ حجز قفل الكتابة من البداية يجعلها تنتظر دورها."""
+    connection = session.connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    raw = connection.connection.dbapi_connection
+    if not raw.in_transaction:
+        raw.execute('BEGIN IMMEDIATE')
@@ -0,0 +1,364 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+from src.utils import metrics
+from src.utils.runtime import runtime_path, temp_path
+
+# تصغير كود JavaScript للأصول (مشاهد، خرائط، مكتبة الكود) عند التسليم للاعبين فقط (?mode=play):
+# حذف التعليقات والمسافات مع الإبقاء على الأسطر التي قد يعتمد عليها الإدراج التلقائي للفواصل (ASI)،
+# والنصوص والقوالب والتعابير النمطية تُنسخ كما هي. النتيجة تُحفظ مرة لكل بصمة محتوى في ذاكرة قرص محدودة.
+# معطل افتراضياً: يُفعَّل فقط حيث يتوفر node للتحقق من الناتج
+ENABLED = os.getenv('JS_MINIFY_ENABLED', 'false').lower() == 'true'
+# كل ناتج يُفحص بـ node --check؛ بدون node (أو إذا تعذر الفحص) يُسلَّم الكود الأصلي دائماً
+NODE_BINARY = os.getenv('JS_MINIFY_NODE') or shutil.which('node')
+CACHE_DIR = os.path.dirname(runtime_path('js-cache', 'x'))
+CACHE_MAX_BYTES = int(os.getenv('JS_MINIFY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# يُضاف إلى البصمة فتُبطل النسخ المخزنة عند تغيير المصغّر
+MINIFIER_VERSION = '3'
+
+# تعليقات يقرؤها المحرر أو المتصفح فتبقى في الناتج
+PRESERVED_COMMENTS = ('FLOW_TRIGGER', '# sourceURL', '# sourceMappingURL', '@license', '@preserve')
+
+# بعد هذه الرموز لا يمكن أن يكون / عملية قسمة، فهو بداية تعبير نمطي
+_REGEX_AFTER_PUNCTUATION = set('(,=:[!&|?{;+-*%<>~^')
+_REGEX_AFTER_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'case', 'do', 'else', 'yield', 'await'
+}
+# القوس ) الذي يغلق رأس هذه الجمل يليه تعبير نمطي (if (x) /a/.test(s))، وأي ) آخر يليه قسمة
+_CONTROL_KEYWORDS = {'if', 'while', 'for', 'with'}
+# بعد هذه الرموز يمكن حذف السطر الجديد بأمان (لا ينتهي عندها تعبير)
+_NEWLINE_SAFE_AFTER = set('{([,;:=*%&|^!~?<>')
+
+metrics.describe('js_minify_total', 'Play-mode code deliveries by cache result')
+
+_cache_writes = 0
+
+
+class _Ambiguous(Exception):
+    """/ لا يمكن الجزم بأنه قسمة أو تعبير نمطي؛ يُسلَّم الكود الأصلي بدلاً من التخمين"""
+
+
+def _is_word(char):
+    return char.isalnum() or char in '_$\\' or ord(char) > 127
+
+
+def _needs_space(before, after):
+    """هل يلزم فاصل بين آخر حرف مكتوب وأول حرف تالٍ حتى لا يندمج الرمزان"""
+    if _is_word(before) and _is_word(after):
+        return True
+    if before in '+-' and after == before:
+        return True
+    if before == '/' and after in '/*':
+        return True
+    if before.isdigit() and after == '.':
+        return True
+    return before == '<' and after == '!'
+
+
+def _skip_string(source, i):
+    quote = source[i]
+    i += 1
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == quote or char == '\n':
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_template(source, i):
+    """نهاية قالب `...` مع التعابير المتداخلة ${...} (تُنسخ كما هي)"""
+    i += 1
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 2
+        elif char == '`':
+            return i + 1
+        elif char == '$' and source.startswith('${', i):
+            i = _skip_expression(source, i + 2)
+        else:
+            i += 1
+    return i
+
+
+def _skip_expression(source, i):
+    """نهاية تعبير ${...} داخل قالب. التعابير النمطية لا تُتتبع هنا، و } أو ` داخل أحدها ينهي التعبير
+    في غير موضعه، لذا أي / ليس قسمة واضحة (بعد اسم أو رقم أو ]) يرفع _Ambiguous"""
+    depth = 1
+    last = ''
+    word = ''
+    while i < len(source):
+        char = source[i]
+        if char in '\'"':
+            i = _skip_string(source, i)
+            last = char
+        elif char == '`':
+            i = _skip_template(source, i)
+            last = char
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = len(source) if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = len(source) if end == -1 else end + 2
+        elif char == '/':
+            if not (_is_word(last) or last == ']') or word in _REGEX_AFTER_KEYWORDS:
+                raise _Ambiguous()
+            last = char
+            i += 1
+        elif char == '{':
+            depth += 1
+            last = char
+            i += 1
+        elif char == '}':
+            depth -= 1
+            last = char
+            i += 1
+            if depth == 0:
+                return i
+        elif char.isspace():
+            i += 1
+        else:
+            word = word + char if _is_word(char) and _is_word(source[i - 1]) else char
+            last = char
+            i += 1
+    return i
+
+
+def _skip_regex(source, i):
+    """نهاية تعبير نمطي /.../flags، أو None إذا لم يُغلق في نفس السطر (فهو قسمة)"""
+    i += 1
+    in_class = False
+    while i < len(source):
+        char = source[i]
+        if char == '\n':
+            return None
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            i += 1
+            while i < len(source) and _is_word(source[i]):
+                i += 1
+            return i
+        i += 1
+    return None
+
+
+def minify(source):
+    """حذف التعليقات والمسافات الزائدة من كود JavaScript دون تغيير معناه؛
+    يعيد الأصل كما هو إذا ظهر / لا يُعرف نوعه"""
+    try:
+        return _minify(source)
+    except _Ambiguous:
+        return source
+
+
+def _minify(source):
+    out = []
+    last = ''          # آخر حرف مكتوب
+    last_token = ''    # آخر رمز (كلمة كاملة أو علامة) لتمييز التعبير النمطي عن القسمة
+    pending_space = False
+    pending_newline = False
+    # لكل ( مفتوح: هل يفتح رأس if/while/for/with؛ وقيمة آخر ) مغلق (None إذا لم يُعرف قوسه)
+    parens = []
+    control_paren = None
+    i = 0
+    length = len(source)
+
+    def emit(text, token):
+        nonlocal last, last_token, pending_space, pending_newline
+        if out and (pending_space or pending_newline):
+            if pending_newline and last not in _NEWLINE_SAFE_AFTER:
+                out.append('\n')
+            elif _needs_space(last, text[0]):
+                out.append(' ')
+        pending_space = pending_newline = False
+        out.append(text)
+        last = text[-1]
+        last_token = token
+
+    while i < length:
+        char = source[i]
+        if char in ' \t\r\f\v\u00a0\ufeff':
+            pending_space = True
+            i += 1
+        elif char in '\n\u2028\u2029':
+            pending_newline = True
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            end = length if end == -1 else end
+            comment = source[i:end]
+            if any(marker in comment for marker in PRESERVED_COMMENTS):
+                emit(comment, last_token)
+                # التعليق السطري يجب أن ينتهي بسطر جديد
+                pending_newline = True
+                last = '\n'
+            i = end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            comment = source[i:end]
+            if comment.startswith('/*!') or any(marker in comment for marker in PRESERVED_COMMENTS):
+                emit(comment, last_token)
+            elif '\n' in comment:
+                pending_newline = True
+            else:
+                pending_space = True
+            i = end
+        elif char in '\'"':
+            end = _skip_string(source, i)
+            emit(source[i:end], 'string')
+            i = end
+        elif char == '`':
+            end = _skip_template(source, i)
+            emit(source[i:end], 'string')
+            i = end
+        elif char == '/' and (
+            not last_token or last_token in _REGEX_AFTER_PUNCTUATION or last_token in _REGEX_AFTER_KEYWORDS
+            or (last_token == ')' and control_paren)
+        ):
+            end = _skip_regex(source, i)
+            if end is None:
+                emit('/', '/')
+                i += 1
+            else:
+                emit(source[i:end], 'regex')
+                i = end
+        elif char == '/' and last_token in ('}', ')') and _skip_regex(source, i) is not None:
+            # بعد } (كتلة أو كائن؟) أو ) غير معروف القوس: قد يكون تعبيراً نمطياً يحتوي مسافات
+            if last_token == '}' or control_paren is None:
+                raise _Ambiguous()
+            emit('/', '/')
+            i += 1
+        elif _is_word(char):
+            end = i + 1
+            while end < length and (_is_word(source[end]) or (source[end] == '.' and source[i].isdigit())):
+                end += 1
+            emit(source[i:end], source[i:end])
+            i = end
+        else:
+            if char == '(':
+                parens.append(last_token in _CONTROL_KEYWORDS)
+            elif char == ')':
+                control_paren = parens.pop() if parens else None
+            emit(char, char)
+            i += 1
+    return ''.join(out)
+
+
+class VerifierUnavailable(Exception):
+    """node غير متوفر أو تعذر تشغيله"""
+
+
+def check_syntax(code):
+    """رسالة خطأ الصياغة أو None؛ الكود يُلف كجسم دالة كما ينفذه العميل (new Function)"""
+    if not NODE_BINARY:
+        raise VerifierUnavailable('node not found')
+    fd, path = tempfile.mkstemp(suffix='.js', dir=CACHE_DIR)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('(function (BABYLON, engine, canvas, scene) {\n' + code + '\n});\n')
+        result = subprocess.run([NODE_BINARY, '--check', path], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise VerifierUnavailable(str(e))
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if result.returncode == 0:
+        return None
+    lines = [line for line in result.stderr.splitlines() if 'SyntaxError' in line]
+    return lines[0].strip() if lines else result.stderr.strip()[:200]
+
+
+def _cache_path(digest):
+    return os.path.join(CACHE_DIR, digest[:2], digest + '.json')
+
+
+def _store(path, entry):
+    global _cache_writes
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+    _cache_writes += 1
+    if _cache_writes % 64 == 0:
+        _sweep_cache()
+
+
+def _sweep_cache():
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(CACHE_DIR):
+        for filename in files:
+            if filename.endswith('.json'):
+                path = os.path.join(root, filename)
+                st = os.stat(path)
+                entries.append((st.st_atime, st.st_size, path))
+                total += st.st_size
+    entries.sort()
+    for atime, size, path in entries:
+        if total <= CACHE_MAX_BYTES * 0.9:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def delivered_code(source):
+    """الكود المصغّر من الذاكرة (أو بعد تصغيره مرة واحدة)، أو الأصل إذا لم يكن التصغير آمناً
+    أو لم يمكن التحقق منه"""
+    if not NODE_BINARY:
+        metrics.inc('js_minify_total', result='unverified')
+        return source
+    digest = hashlib.sha256((MINIFIER_VERSION + '\0' + source).encode('utf-8')).hexdigest()
+    path = _cache_path(digest)
+    try:
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f)
+        metrics.inc('js_minify_total', result='hit')
+        return entry['code'] if entry['code'] is not None else source
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    minified = minify(source)
+    entry = {'code': minified, 'error': None}
+    if len(minified) >= len(source):
+        entry['code'] = None
+    else:
+        try:
+            error = check_syntax(minified)
+            if error is not None:
+                # خطأ في الأصل نفسه يُعرض كما هو للمؤلف؛ غير ذلك فالمصغّر لم يفهم الكود
+                entry['code'] = None
+                entry['error'] = check_syntax(source) or f'minified output rejected: {error}'
+        except VerifierUnavailable as e:
+            # لا يُحفظ: المحاولة التالية قد تجد node متاحاً
+            print(f"WARNING: JavaScript syntax check unavailable: {e}")
+            metrics.inc('js_minify_total', result='unverified')
+            return source
+    try:
+        _store(path, entry)
+    except OSError as e:
+        print(f"WARNING: JavaScript minify cache write failed: {e}")
+    metrics.inc('js_minify_total', result='miss' if entry['code'] is not None else 'fallback')
+    return entry['code'] if entry['code'] is not None else source
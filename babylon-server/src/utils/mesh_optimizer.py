@@ -0,0 +1,859 @@
+import os
+import sys
+import json
+import math
+import base64
+import struct
+import posixpath
+from array import array
+
+# فحص وتحسين ملفات الشبكات المستوردة (GLB / glTF / .babylon) بدون مكتبات خارجية:
+# إحصاءات الرؤوس والخامات، حذف العقد والموارد غير المستخدمة، دمج البيانات المكررة،
+# تكميم السمات (KHR_mesh_quantization)، وتحويل .babylon الثابت إلى GLB.
+OPTIMIZE_ON_IMPORT = os.getenv('MESH_OPTIMIZE_ON_IMPORT', 'true').lower() != 'false'
+QUANTIZE = os.getenv('MESH_QUANTIZE', 'true').lower() != 'false'
+# المحسّن مكتوب ببايثون فقط (~8MB/s على نواة واحدة): 32MB تنتهي في ثوانٍ قليلة
+MAX_BYTES = int(os.getenv('MESH_OPTIMIZE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+FLOAT = 5126
+BYTE = 5120
+UNSIGNED_BYTE = 5121
+SHORT = 5122
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+COMPONENT_FORMATS = {BYTE: 'b', UNSIGNED_BYTE: 'B', SHORT: 'h', UNSIGNED_SHORT: 'H', UNSIGNED_INT: 'I', FLOAT: 'f'}
+COMPONENT_SIZES = {BYTE: 1, UNSIGNED_BYTE: 1, SHORT: 2, UNSIGNED_SHORT: 2, UNSIGNED_INT: 4, FLOAT: 4}
+TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+# امتدادات لا تخزن مراجع خفية للموارد، فيمكن إعادة ترقيم الموارد بأمان مع وجودها
+SAFE_EXTENSIONS = {
+    'KHR_mesh_quantization', 'KHR_texture_transform', 'KHR_lights_punctual', 'KHR_materials_unlit',
+    'KHR_materials_emissive_strength', 'KHR_materials_ior', 'KHR_materials_specular', 'KHR_materials_clearcoat',
+    'KHR_materials_sheen', 'KHR_materials_transmission', 'KHR_materials_volume', 'KHR_materials_iridescence',
+    'KHR_materials_anisotropy', 'KHR_materials_pbrSpecularGlossiness', 'KHR_texture_basisu', 'EXT_texture_webp'
+}
+
+IMAGE_MIME_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.webp': 'image/webp', '.ktx2': 'image/ktx2'}
+MESH_EXTENSIONS = ('.glb', '.gltf', '.babylon')
+BABYLON_WRAP_MODES = {0: 33071, 1: 10497, 2: 33648}
+
+
+class MeshError(ValueError):
+    """ملف شبكة غير صالح أو غير قابل للتحويل"""
+
+
+def _align(length, alignment=4):
+    return (length + alignment - 1) // alignment * alignment
+
+
+class GltfAsset:
+    """مستند glTF مع بيانات كل bufferView منفصلة (تُعاد تعبئة المخزن عند الكتابة)"""
+
+    def __init__(self, doc, views):
+        self.doc = doc
+        self.views = views
+
+    # ---- القراءة ----
+
+    @classmethod
+    def from_glb(cls, data, read_uri=None):
+        if len(data) < 20:
+            raise MeshError('ملف GLB قصير جداً')
+        magic, version, length = struct.unpack_from('<III', data)
+        if magic != GLB_MAGIC or version != 2:
+            raise MeshError('ليس ملف GLB بإصدار 2')
+        offset = 12
+        doc = None
+        binary = None
+        while offset + 8 <= min(length, len(data)):
+            chunk_length, chunk_type = struct.unpack_from('<II', data, offset)
+            chunk = data[offset + 8:offset + 8 + chunk_length]
+            if chunk_type == CHUNK_JSON:
+                doc = json.loads(chunk)
+            elif chunk_type == CHUNK_BIN and binary is None:
+                binary = bytes(chunk)
+            offset += 8 + _align(chunk_length)
+        if doc is None:
+            raise MeshError('ملف GLB بدون جزء JSON')
+        return cls._from_doc(doc, binary, read_uri)
+
+    @classmethod
+    def from_gltf(cls, data, read_uri=None):
+        try:
+            doc = json.loads(data)
+        except ValueError as e:
+            raise MeshError(f'ملف glTF غير صالح: {e}')
+        return cls._from_doc(doc, None, read_uri)
+
+    @classmethod
+    def _from_doc(cls, doc, binary, read_uri):
+        if not str(doc.get('asset', {}).get('version', '')).startswith('2'):
+            raise MeshError('إصدار glTF غير مدعوم')
+        buffers = []
+        for index, buffer in enumerate(doc.get('buffers', [])):
+            uri = buffer.get('uri')
+            if uri is None:
+                if index != 0 or binary is None:
+                    raise MeshError(f'المخزن {index} بدون بيانات')
+                buffers.append(binary)
+            else:
+                content = _read_uri(uri, read_uri)
+                if content is None:
+                    raise MeshError(f'ملف المخزن غير موجود: {uri}')
+                buffers.append(content)
+        views = []
+        for view in doc.get('bufferViews', []):
+            start = view.get('byteOffset', 0)
+            views.append(bytes(buffers[view['buffer']][start:start + view['byteLength']]))
+        asset = cls(doc, views)
+        # الصور المضمنة (data:) أو المجاورة تُنقل إلى مخزن GLB ليصبح الملف الناتج مستقلاً
+        for image in doc.get('images', []):
+            uri = image.get('uri')
+            if uri is None:
+                continue
+            content = _read_uri(uri, read_uri)
+            if content is None:
+                continue
+            mime_type = image.get('mimeType') or _image_mime_type(uri)
+            if mime_type is None:
+                continue
+            image.pop('uri')
+            image['mimeType'] = mime_type
+            image['bufferView'] = asset.add_view(content)
+        return asset
+
+    def add_view(self, data, target=None, stride=None):
+        view = {'buffer': 0, 'byteLength': len(data)}
+        if target is not None:
+            view['target'] = target
+        if stride is not None:
+            view['byteStride'] = stride
+        self.doc.setdefault('bufferViews', []).append(view)
+        self.views.append(bytes(data))
+        return len(self.views) - 1
+
+    def add_accessor(self, values, accessor_type, component_type=FLOAT, target=None, normalized=False, with_bounds=False):
+        """إضافة accessor جديد من قائمة قيم مسطحة (بدون تداخل)"""
+        packed = array(COMPONENT_FORMATS[component_type], values)
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        width = TYPE_SIZES[accessor_type]
+        accessor = {
+            'bufferView': self.add_view(packed.tobytes(), target),
+            'componentType': component_type,
+            'count': len(values) // width,
+            'type': accessor_type
+        }
+        if normalized:
+            accessor['normalized'] = True
+        if with_bounds and values:
+            accessor['min'] = [min(values[i::width]) for i in range(width)]
+            accessor['max'] = [max(values[i::width]) for i in range(width)]
+        self.doc.setdefault('accessors', []).append(accessor)
+        return len(self.doc['accessors']) - 1
+
+    def read_accessor(self, index):
+        """قيم accessor كقائمة مسطحة (مع مراعاة byteStride وsparse)"""
+        accessor = self.doc['accessors'][index]
+        width = TYPE_SIZES[accessor['type']]
+        component_type = accessor['componentType']
+        fmt = COMPONENT_FORMATS[component_type]
+        size = COMPONENT_SIZES[component_type]
+        count = accessor['count']
+        if 'bufferView' not in accessor:
+            values = [0] * (count * width)
+        else:
+            data = self.views[accessor['bufferView']]
+            stride = self.doc['bufferViews'][accessor['bufferView']].get('byteStride') or width * size
+            offset = accessor.get('byteOffset', 0)
+            if stride == width * size:
+                packed = array(fmt)
+                packed.frombytes(data[offset:offset + count * stride])
+                if sys.byteorder != 'little':
+                    packed.byteswap()
+                values = packed.tolist()
+            else:
+                row = struct.Struct(f'<{width}{fmt}')
+                values = []
+                for i in range(count):
+                    values.extend(row.unpack_from(data, offset + i * stride))
+        sparse = accessor.get('sparse')
+        if sparse:
+            indices = self._read_raw(sparse['indices'], sparse['count'], 1)
+            sparse_values = self._read_raw(dict(sparse['values'], componentType=component_type), sparse['count'], width)
+            for n, target in enumerate(indices):
+                values[target * width:(target + 1) * width] = sparse_values[n * width:(n + 1) * width]
+        return values
+
+    def _read_raw(self, ref, count, width):
+        packed = array(COMPONENT_FORMATS[ref['componentType']])
+        start = ref.get('byteOffset', 0)
+        packed.frombytes(self.views[ref['bufferView']][start:start + count * width * packed.itemsize])
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        return packed.tolist()
+
+    # ---- الكتابة ----
+
+    def to_glb(self):
+        doc = self.doc
+        binary = bytearray()
+        for view, data in zip(doc.get('bufferViews', []), self.views):
+            binary += b'\0' * (_align(len(binary)) - len(binary))
+            view['buffer'] = 0
+            view['byteOffset'] = len(binary)
+            view['byteLength'] = len(data)
+            binary += data
+        binary += b'\0' * (_align(len(binary)) - len(binary))
+        if binary:
+            doc['buffers'] = [{'byteLength': len(binary)}]
+        else:
+            doc.pop('buffers', None)
+        for key in [key for key, value in doc.items() if isinstance(value, list) and not value]:
+            doc.pop(key)
+        json_chunk = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+        json_chunk += b' ' * (_align(len(json_chunk)) - len(json_chunk))
+        total = 12 + 8 + len(json_chunk) + (8 + len(binary) if binary else 0)
+        out = bytearray(struct.pack('<III', GLB_MAGIC, 2, total))
+        out += struct.pack('<II', len(json_chunk), CHUNK_JSON) + json_chunk
+        if binary:
+            out += struct.pack('<II', len(binary), CHUNK_BIN) + binary
+        return bytes(out)
+
+
+def _read_uri(uri, read_uri):
+    if uri.startswith('data:'):
+        header, _, payload = uri.partition(',')
+        if not header.endswith(';base64'):
+            raise MeshError('رابط data: غير مرمز بـ base64')
+        return base64.b64decode(payload)
+    if read_uri is None:
+        return None
+    return read_uri(uri)
+
+
+def _image_mime_type(uri):
+    if uri.startswith('data:'):
+        return uri[5:].split(';', 1)[0] or None
+    return IMAGE_MIME_TYPES.get(posixpath.splitext(uri.lower())[1])
+
+
+# ---- المراجع بين الموارد ----
+
+def _texture_infos(value):
+    """كل كائنات textureInfo داخل مادة (بما فيها الامتدادات)"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, dict) and key.lower().endswith('texture') and isinstance(item.get('index'), int):
+                yield item
+            yield from _texture_infos(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _texture_infos(item)
+
+
+def _refs(doc):
+    """(الحاوية، المفتاح، المجموعة) لكل مرجع إلى مورد في المستند"""
+    if 'scene' in doc:
+        yield doc, 'scene', 'scenes'
+    for scene in doc.get('scenes', []):
+        for i in range(len(scene.get('nodes', []))):
+            yield scene['nodes'], i, 'nodes'
+    for node in doc.get('nodes', []):
+        for i in range(len(node.get('children', []))):
+            yield node['children'], i, 'nodes'
+        for key, collection in (('mesh', 'meshes'), ('skin', 'skins'), ('camera', 'cameras')):
+            if key in node:
+                yield node, key, collection
+    for skin in doc.get('skins', []):
+        for i in range(len(skin.get('joints', []))):
+            yield skin['joints'], i, 'nodes'
+        if 'skeleton' in skin:
+            yield skin, 'skeleton', 'nodes'
+        if 'inverseBindMatrices' in skin:
+            yield skin, 'inverseBindMatrices', 'accessors'
+    for animation in doc.get('animations', []):
+        for channel in animation.get('channels', []):
+            if 'node' in channel.get('target', {}):
+                yield channel['target'], 'node', 'nodes'
+        for sampler in animation.get('samplers', []):
+            yield sampler, 'input', 'accessors'
+            yield sampler, 'output', 'accessors'
+    for mesh in doc.get('meshes', []):
+        for primitive in mesh.get('primitives', []):
+            for name in primitive.get('attributes', {}):
+                yield primitive['attributes'], name, 'accessors'
+            if 'indices' in primitive:
+                yield primitive, 'indices', 'accessors'
+            if 'material' in primitive:
+                yield primitive, 'material', 'materials'
+            for target in primitive.get('targets', []):
+                for name in target:
+                    yield target, name, 'accessors'
+    for material in doc.get('materials', []):
+        for info in _texture_infos(material):
+            yield info, 'index', 'textures'
+    for texture in doc.get('textures', []):
+        if 'sampler' in texture:
+            yield texture, 'sampler', 'samplers'
+        if 'source' in texture:
+            yield texture, 'source', 'images'
+        for extension in texture.get('extensions', {}).values():
+            if isinstance(extension, dict) and 'source' in extension:
+                yield extension, 'source', 'images'
+    for image in doc.get('images', []):
+        if 'bufferView' in image:
+            yield image, 'bufferView', 'bufferViews'
+    for accessor in doc.get('accessors', []):
+        if 'bufferView' in accessor:
+            yield accessor, 'bufferView', 'bufferViews'
+        for part in ('indices', 'values'):
+            if 'bufferView' in accessor.get('sparse', {}).get(part, {}):
+                yield accessor['sparse'][part], 'bufferView', 'bufferViews'
+
+
+def _remap(asset, collection, mapping):
+    """إعادة ترقيم مجموعة: mapping يربط الرقم القديم بالجديد، وما ليس فيه يُحذف"""
+    doc = asset.doc
+    for container, key, target in list(_refs(doc)):
+        if target == collection:
+            container[key] = mapping[container[key]]
+    items = doc.get(collection, [])
+    kept = [None] * (max(mapping.values()) + 1 if mapping else 0)
+    kept_views = [None] * len(kept) if collection == 'bufferViews' else None
+    for old, new in mapping.items():
+        if kept[new] is None:
+            kept[new] = items[old]
+            if kept_views is not None:
+                kept_views[new] = asset.views[old]
+    doc[collection] = kept
+    if kept_views is not None:
+        asset.views = kept_views
+
+
+def _drop_unreferenced(asset, collection):
+    used = sorted({container[key] for container, key, target in _refs(asset.doc) if target == collection})
+    removed = len(asset.doc.get(collection, [])) - len(used)
+    if removed:
+        _remap(asset, collection, {old: new for new, old in enumerate(used)})
+    return removed
+
+
+def _dedupe(asset, collection, key_fn):
+    seen = {}
+    mapping = {}
+    for index, item in enumerate(asset.doc.get(collection, [])):
+        key = key_fn(index, item)
+        if key not in seen:
+            seen[key] = len(seen)
+        mapping[index] = seen[key]
+    removed = len(mapping) - len(seen)
+    if removed:
+        _remap(asset, collection, mapping)
+    return removed
+
+
+def _json_key(index, item):
+    return json.dumps({key: value for key, value in item.items() if key not in ('name', 'extras')}, sort_keys=True)
+
+
+# ---- مراحل التحسين ----
+
+def _prune(asset):
+    """حذف العقد غير المتصلة بأي مشهد، ثم كل ما لم يعد مستخدماً (شبكات، مواد، خامات، accessors)"""
+    doc = asset.doc
+    stats = {}
+    if doc.get('scenes'):
+        nodes = doc.get('nodes', [])
+        reachable = set()
+        stack = [index for scene in doc['scenes'] for index in scene.get('nodes', [])]
+        while stack:
+            index = stack.pop()
+            if index in reachable:
+                continue
+            reachable.add(index)
+            node = nodes[index]
+            stack.extend(node.get('children', []))
+            if 'skin' in node:
+                skin = doc['skins'][node['skin']]
+                stack.extend(skin.get('joints', []))
+                if 'skeleton' in skin:
+                    stack.append(skin['skeleton'])
+        for animation in doc.get('animations', []):
+            animation['channels'] = [
+                channel for channel in animation.get('channels', [])
+                if channel.get('target', {}).get('node', -1) in reachable
+            ]
+        stats['nodes'] = len(nodes) - len(reachable)
+        if stats['nodes']:
+            _remap(asset, 'nodes', {old: new for new, old in enumerate(sorted(reachable))})
+
+    animations = []
+    for animation in doc.get('animations', []):
+        used = sorted({channel['sampler'] for channel in animation['channels']})
+        if not used:
+            continue
+        local = {old: new for new, old in enumerate(used)}
+        animation['samplers'] = [animation['samplers'][old] for old in used]
+        for channel in animation['channels']:
+            channel['sampler'] = local[channel['sampler']]
+        animations.append(animation)
+    stats['animations'] = len(doc.get('animations', [])) - len(animations)
+    if 'animations' in doc:
+        doc['animations'] = animations
+
+    for collection in ('meshes', 'skins', 'cameras', 'materials', 'textures', 'images', 'samplers', 'accessors', 'bufferViews'):
+        stats[collection] = _drop_unreferenced(asset, collection)
+    return {key: value for key, value in stats.items() if value}
+
+
+def _dedupe_all(asset):
+    """دمج البيانات المتطابقة: bufferViews بالمحتوى، ثم accessors والصور والخامات المتطابقة"""
+    doc = asset.doc
+    stats = {}
+    stats['bufferViews'] = _dedupe(asset, 'bufferViews', lambda index, view: (
+        asset.views[index], view.get('byteStride'), view.get('target')
+    ))
+    stats['accessors'] = _dedupe(asset, 'accessors', _json_key)
+    stats['images'] = _dedupe(asset, 'images', lambda index, image: (
+        image.get('uri'), image.get('bufferView'), image.get('mimeType')
+    ))
+    stats['samplers'] = _dedupe(asset, 'samplers', _json_key)
+    stats['textures'] = _dedupe(asset, 'textures', _json_key)
+    return {key: value for key, value in stats.items() if value}
+
+
+def _accessor_uses(doc):
+    """الاستخدامات المختلفة لكل accessor (سمة رؤوس، فهارس، مسار حركة...)"""
+    uses = {}
+    for mesh in doc.get('meshes', []):
+        for primitive in mesh.get('primitives', []):
+            for name, index in primitive.get('attributes', {}).items():
+                uses.setdefault(index, set()).add(name.split('_')[0] if name[0] != '_' else name)
+            if 'indices' in primitive:
+                uses.setdefault(primitive['indices'], set()).add('indices')
+            for target in primitive.get('targets', []):
+                for index in target.values():
+                    uses.setdefault(index, set()).add('morph')
+    for skin in doc.get('skins', []):
+        if 'inverseBindMatrices' in skin:
+            uses.setdefault(skin['inverseBindMatrices'], set()).add('skin')
+    for animation in doc.get('animations', []):
+        for channel in animation.get('channels', []):
+            sampler = animation['samplers'][channel['sampler']]
+            uses.setdefault(sampler['input'], set()).add('time')
+            uses.setdefault(sampler['output'], set()).add('anim:' + channel['target'].get('path', ''))
+    return uses
+
+
+def _quantize_signed(values, scale):
+    return [max(-scale, min(scale, int(round(value * scale)))) for value in values]
+
+
+def _pad_rows(values, width, padded_width, fill=0):
+    if width == padded_width:
+        return values
+    out = []
+    for i in range(0, len(values), width):
+        out.extend(values[i:i + width])
+        out.extend([fill] * (padded_width - width))
+    return out
+
+
+def _replace_accessor(asset, index, values, component_type, normalized, target, stride=None):
+    accessor = asset.doc['accessors'][index]
+    packed = array(COMPONENT_FORMATS[component_type], values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    accessor['bufferView'] = asset.add_view(packed.tobytes(), target, stride)
+    accessor.pop('byteOffset', None)
+    accessor['componentType'] = component_type
+    if normalized:
+        accessor['normalized'] = True
+    else:
+        accessor.pop('normalized', None)
+
+
+def _quantize(asset):
+    """تكميم السمات: المتجهات العمودية والمماسات إلى 8 بت، الإحداثيات النسيجية والدورانات إلى 16 بت،
+    الأوزان إلى 8 بت، والفهارس إلى 16 بت عندما يكفي. المواضع تبقى float لأن تكميمها يتطلب تعديل تحويلات العقد."""
+    doc = asset.doc
+    stats = {}
+    needs_extension = False
+    for index, kinds in _accessor_uses(doc).items():
+        accessor = doc['accessors'][index]
+        if len(kinds) != 1 or 'sparse' in accessor or 'bufferView' not in accessor:
+            continue
+        kind = next(iter(kinds))
+        component_type = accessor['componentType']
+        if kind == 'indices':
+            if component_type == UNSIGNED_INT:
+                values = asset.read_accessor(index)
+                if values and max(values) < 65535:
+                    _replace_accessor(asset, index, values, UNSIGNED_SHORT, False, ELEMENT_ARRAY_BUFFER)
+                    stats['indices'] = stats.get('indices', 0) + 1
+            continue
+        if component_type != FLOAT:
+            continue
+        width = TYPE_SIZES[accessor['type']]
+        if kind == 'NORMAL' and width == 3:
+            values = _pad_rows(_quantize_signed(asset.read_accessor(index), 127), 3, 4)
+            _replace_accessor(asset, index, values, BYTE, True, ARRAY_BUFFER, 4)
+            needs_extension = True
+        elif kind == 'TANGENT' and width == 4:
+            values = _quantize_signed(asset.read_accessor(index), 127)
+            _replace_accessor(asset, index, values, BYTE, True, ARRAY_BUFFER, 4)
+            needs_extension = True
+        elif kind == 'TEXCOORD' and width == 2:
+            values = asset.read_accessor(index)
+            if not values or min(values) < 0 or max(values) > 1:
+                # إحداثيات خارج [0, 1] تحتاج KHR_texture_transform، فتبقى كما هي
+                continue
+            values = [int(round(value * 65535)) for value in values]
+            _replace_accessor(asset, index, values, UNSIGNED_SHORT, True, ARRAY_BUFFER, 4)
+        elif kind == 'WEIGHTS' and width == 4:
+            values = asset.read_accessor(index)
+            quantized = []
+            for i in range(0, len(values), 4):
+                row = [max(0, int(round(value * 255))) for value in values[i:i + 4]]
+                # الحفاظ على مجموع الأوزان = 1 بعد التقريب
+                row[row.index(max(row))] += 255 - sum(row) if sum(row) else 0
+                quantized.extend(row)
+            _replace_accessor(asset, index, quantized, UNSIGNED_BYTE, True, ARRAY_BUFFER, 4)
+        elif kind == 'anim:rotation' and width == 4:
+            values = _quantize_signed(asset.read_accessor(index), 32767)
+            _replace_accessor(asset, index, values, SHORT, True, None)
+        else:
+            continue
+        accessor.pop('min', None)
+        accessor.pop('max', None)
+        stats[kind] = stats.get(kind, 0) + 1
+    if needs_extension:
+        for key in ('extensionsUsed', 'extensionsRequired'):
+            extensions = doc.setdefault(key, [])
+            if 'KHR_mesh_quantization' not in extensions:
+                extensions.append('KHR_mesh_quantization')
+    return stats
+
+
+# ---- الإحصاءات ----
+
+def inspect_gltf(asset, size):
+    doc = asset.doc
+    vertices = 0
+    triangles = 0
+    primitives = 0
+    for mesh in doc.get('meshes', []):
+        for primitive in mesh.get('primitives', []):
+            primitives += 1
+            position = primitive.get('attributes', {}).get('POSITION')
+            count = doc['accessors'][position]['count'] if position is not None else 0
+            vertices += count
+            if primitive.get('mode', 4) == 4:
+                indices = primitive.get('indices')
+                triangles += (doc['accessors'][indices]['count'] if indices is not None else count) // 3
+    image_bytes = sum(
+        len(asset.views[image['bufferView']]) for image in doc.get('images', []) if 'bufferView' in image
+    )
+    return {
+        'format': 'gltf',
+        'size': size,
+        'meshes': len(doc.get('meshes', [])),
+        'primitives': primitives,
+        'vertices': vertices,
+        'triangles': triangles,
+        'nodes': len(doc.get('nodes', [])),
+        'materials': len(doc.get('materials', [])),
+        'textures': len(doc.get('textures', [])),
+        'images': len(doc.get('images', [])),
+        'imageBytes': image_bytes,
+        'animations': len(doc.get('animations', [])),
+        'skins': len(doc.get('skins', [])),
+        'accessors': len(doc.get('accessors', [])),
+        'bufferViews': len(doc.get('bufferViews', [])),
+        'extensions': doc.get('extensionsUsed', [])
+    }
+
+
+def inspect_babylon(scene, size):
+    meshes = scene.get('meshes') or []
+    texture_names = set()
+    for material in scene.get('materials') or []:
+        for key, value in material.items():
+            if key.endswith('Texture') and isinstance(value, dict) and value.get('name'):
+                texture_names.add(value['name'])
+    return {
+        'format': 'babylon',
+        'size': size,
+        'meshes': len(meshes),
+        'vertices': sum(len(mesh.get('positions') or []) // 3 for mesh in meshes),
+        'triangles': sum(len(mesh.get('indices') or []) // 3 for mesh in meshes),
+        'materials': len(scene.get('materials') or []),
+        'textures': len(texture_names),
+        'skeletons': len(scene.get('skeletons') or []),
+        'animations': sum(len(mesh.get('animations') or []) for mesh in meshes)
+    }
+
+
+# ---- تحويل .babylon ----
+
+def _quaternion_from_babylon_euler(rotation):
+    # نفس ترتيب Babylon.js: Quaternion.RotationYawPitchRoll(y, x, z)
+    pitch, yaw, roll = rotation
+    sin_roll, cos_roll = math.sin(roll * 0.5), math.cos(roll * 0.5)
+    sin_pitch, cos_pitch = math.sin(pitch * 0.5), math.cos(pitch * 0.5)
+    sin_yaw, cos_yaw = math.sin(yaw * 0.5), math.cos(yaw * 0.5)
+    return [
+        cos_yaw * sin_pitch * cos_roll + sin_yaw * cos_pitch * sin_roll,
+        sin_yaw * cos_pitch * cos_roll - cos_yaw * sin_pitch * sin_roll,
+        cos_yaw * cos_pitch * sin_roll - sin_yaw * sin_pitch * cos_roll,
+        cos_yaw * cos_pitch * cos_roll + sin_yaw * sin_pitch * sin_roll
+    ]
+
+
+def _babylon_node(source):
+    """تحويل موضع/دوران/حجم من نظام Babylon (يد يسرى) إلى glTF (يد يمنى) بعكس المحور X،
+    وهو عكس ما يطبقه محمّل glTF في Babylon على العقدة __root__"""
+    node = {'name': source.get('name') or source.get('id', '')}
+    position = source.get('position')
+    if position and any(position):
+        node['translation'] = [-position[0], position[1], position[2]]
+    quaternion = source.get('rotationQuaternion')
+    if not quaternion and source.get('rotation') and any(source['rotation']):
+        quaternion = _quaternion_from_babylon_euler(source['rotation'])
+    if quaternion and list(quaternion) != [0, 0, 0, 1]:
+        node['rotation'] = [quaternion[0], -quaternion[1], -quaternion[2], quaternion[3]]
+    scaling = source.get('scaling')
+    if scaling and list(scaling) != [1, 1, 1]:
+        node['scale'] = list(scaling)
+    return node
+
+
+def _babylon_material(asset, material, read_uri, textures):
+    doc = asset.doc
+    gltf_material = {'name': material.get('name') or material.get('id', '')}
+    alpha = material.get('alpha', 1)
+    if 'albedo' in material or 'albedoColor' in material:
+        color = material.get('albedo') or material.get('albedoColor') or [1, 1, 1]
+        texture = material.get('albedoTexture')
+        pbr = {'metallicFactor': material.get('metallic', 1) if material.get('metallic') is not None else 1,
+               'roughnessFactor': material.get('roughness', 1) if material.get('roughness') is not None else 1}
+    else:
+        color = material.get('diffuse') or [1, 1, 1]
+        texture = material.get('diffuseTexture')
+        pbr = {'metallicFactor': 0, 'roughnessFactor': 1}
+    pbr['baseColorFactor'] = list(color[:3]) + [alpha]
+    if texture and texture.get('name'):
+        texture_index = _babylon_texture(asset, texture, read_uri, textures)
+        if texture_index is not None:
+            pbr['baseColorTexture'] = {'index': texture_index}
+            if texture.get('hasAlpha'):
+                gltf_material['alphaMode'] = 'MASK'
+    bump = material.get('bumpTexture')
+    if bump and bump.get('name'):
+        texture_index = _babylon_texture(asset, bump, read_uri, textures)
+        if texture_index is not None:
+            gltf_material['normalTexture'] = {'index': texture_index}
+    gltf_material['pbrMetallicRoughness'] = pbr
+    emissive = material.get('emissive')
+    if emissive and any(emissive):
+        gltf_material['emissiveFactor'] = list(emissive[:3])
+    if alpha < 1:
+        gltf_material['alphaMode'] = 'BLEND'
+    if not material.get('backFaceCulling', True):
+        gltf_material['doubleSided'] = True
+    doc.setdefault('materials', []).append(gltf_material)
+    return len(doc['materials']) - 1
+
+
+def _babylon_texture(asset, texture, read_uri, textures):
+    doc = asset.doc
+    name = texture['name']
+    key = (name, texture.get('wrapU', 1), texture.get('wrapV', 1))
+    if key in textures:
+        return textures[key]
+    mime_type = _image_mime_type(name)
+    content = read_uri(name) if read_uri is not None else None
+    if content is not None and mime_type is not None:
+        image = {'mimeType': mime_type, 'bufferView': asset.add_view(content)}
+    else:
+        image = {'uri': name}
+    doc.setdefault('images', []).append(image)
+    doc.setdefault('samplers', []).append({
+        'wrapS': BABYLON_WRAP_MODES.get(texture.get('wrapU', 1), 10497),
+        'wrapT': BABYLON_WRAP_MODES.get(texture.get('wrapV', 1), 10497)
+    })
+    doc.setdefault('textures', []).append({'source': len(doc['images']) - 1, 'sampler': len(doc['samplers']) - 1})
+    textures[key] = len(doc['textures']) - 1
+    return textures[key]
+
+
+def babylon_to_gltf(scene, read_uri=None):
+    """تحويل مشهد .babylon ثابت (شبكات، مواد قياسية أو PBR، خامات) إلى glTF؛
+    الهياكل العظمية وأهداف التحويل والهندسة المؤجلة غير مدعومة"""
+    meshes = scene.get('meshes') or []
+    if any(mesh.get('skeletonId', -1) not in (-1, None) for mesh in meshes) and scene.get('skeletons'):
+        raise MeshError('التحويل لا يدعم الشبكات ذات الهيكل العظمي (skeletons)')
+    if scene.get('morphTargetManagers'):
+        raise MeshError('التحويل لا يدعم أهداف التحويل (morph targets)')
+    if any(mesh.get('delayLoadingFile') or mesh.get('geometryId') for mesh in meshes):
+        raise MeshError('التحويل لا يدعم الهندسة المؤجلة أو المشتركة')
+
+    asset = GltfAsset({'asset': {'version': '2.0', 'generator': 'babylon-game-api mesh optimizer'}}, [])
+    doc = asset.doc
+    materials = {material['id']: material for material in scene.get('materials') or []}
+    multi_materials = {material['id']: material for material in scene.get('multiMaterials') or []}
+    material_indices = {}
+    textures = {}
+
+    def material_index(material_id):
+        if material_id not in materials:
+            return None
+        if material_id not in material_indices:
+            material_indices[material_id] = _babylon_material(asset, materials[material_id], read_uri, textures)
+        return material_indices[material_id]
+
+    sources = list(scene.get('transformNodes') or []) + list(meshes)
+    node_ids = {}
+    for source in sources:
+        node_ids[source.get('id')] = len(node_ids)
+        doc.setdefault('nodes', []).append(_babylon_node(source))
+
+    for source in meshes:
+        positions = source.get('positions')
+        if not positions:
+            continue
+        node = doc['nodes'][node_ids[source.get('id')]]
+        vertex_count = len(positions) // 3
+        mirrored = list(positions)
+        mirrored[0::3] = [-x for x in positions[0::3]]
+        attributes = {'POSITION': asset.add_accessor(mirrored, 'VEC3', target=ARRAY_BUFFER, with_bounds=True)}
+        if source.get('normals'):
+            normals = list(source['normals'])
+            normals[0::3] = [-x for x in normals[0::3]]
+            attributes['NORMAL'] = asset.add_accessor(normals, 'VEC3', target=ARRAY_BUFFER)
+        for key, semantic in (('uvs', 'TEXCOORD_0'), ('uvs2', 'TEXCOORD_1')):
+            if source.get(key):
+                # glTF يضع أصل الإحداثيات النسيجية أعلى الصورة
+                uvs = list(source[key])
+                uvs[1::2] = [1 - v for v in uvs[1::2]]
+                attributes[semantic] = asset.add_accessor(uvs, 'VEC2', target=ARRAY_BUFFER)
+        if source.get('colors') and len(source['colors']) == vertex_count * 4:
+            attributes['COLOR_0'] = asset.add_accessor(list(source['colors']), 'VEC4', target=ARRAY_BUFFER)
+
+        indices = list(source.get('indices') or range(vertex_count))
+        # عكس الترتيب يحافظ على الوجه الأمامي بعد قلب اتجاه المحاور
+        for i in range(0, len(indices) - 2, 3):
+            indices[i + 1], indices[i + 2] = indices[i + 2], indices[i + 1]
+        index_type = UNSIGNED_SHORT if vertex_count < 65535 else UNSIGNED_INT
+
+        material_id = source.get('materialId')
+        sub_meshes = source.get('subMeshes') or [{'materialIndex': 0, 'indexStart': 0, 'indexCount': len(indices)}]
+        primitives = []
+        for sub_mesh in sub_meshes:
+            start = sub_mesh.get('indexStart', 0)
+            part = indices[start:start + sub_mesh.get('indexCount', len(indices))]
+            if not part:
+                continue
+            primitive = {
+                'attributes': dict(attributes),
+                'indices': asset.add_accessor(part, 'SCALAR', index_type, ELEMENT_ARRAY_BUFFER)
+            }
+            if material_id in multi_materials:
+                sub_materials = multi_materials[material_id].get('materials') or []
+                material_index_value = sub_mesh.get('materialIndex', 0)
+                gltf_material = material_index(sub_materials[material_index_value]) if material_index_value < len(sub_materials) else None
+            else:
+                gltf_material = material_index(material_id)
+            if gltf_material is not None:
+                primitive['material'] = gltf_material
+            primitives.append(primitive)
+        if primitives:
+            doc.setdefault('meshes', []).append({'name': node['name'], 'primitives': primitives})
+            node['mesh'] = len(doc['meshes']) - 1
+
+    roots = []
+    for source in sources:
+        index = node_ids[source.get('id')]
+        parent = node_ids.get(source.get('parentId')) if source.get('parentId') else None
+        if parent is None or parent == index:
+            roots.append(index)
+        else:
+            doc['nodes'][parent].setdefault('children', []).append(index)
+    doc['scenes'] = [{'nodes': roots}]
+    doc['scene'] = 0
+    if not doc.get('meshes'):
+        raise MeshError('لا توجد شبكات بهندسة قابلة للتحويل')
+    return asset
+
+
+# ---- نقطة الدخول ----
+
+def optimized_name(path):
+    """اسم النسخة المحسّنة بجانب الأصل: meshes/HVGirl.glb -> meshes/HVGirl.optimized.glb"""
+    return posixpath.splitext(path)[0] + '.optimized.glb'
+
+
+def is_optimized(path):
+    return path.lower().endswith('.optimized.glb')
+
+
+def load(data, filename, read_uri=None):
+    """تحميل ملف شبكة إلى (GltfAsset، إحصاءات الملف الأصلي)"""
+    ext = posixpath.splitext(filename.lower())[1]
+    if ext == '.glb':
+        asset = GltfAsset.from_glb(data, read_uri)
+        return asset, dict(inspect_gltf(asset, len(data)), format='glb')
+    if ext == '.gltf':
+        asset = GltfAsset.from_gltf(data, read_uri)
+        return asset, inspect_gltf(asset, len(data))
+    if ext == '.babylon':
+        try:
+            scene = json.loads(data)
+        except ValueError as e:
+            raise MeshError(f'ملف .babylon غير صالح: {e}')
+        report = inspect_babylon(scene, len(data))
+        try:
+            asset = babylon_to_gltf(scene, read_uri)
+        except MeshError as e:
+            report['convertible'] = False
+            report['reason'] = str(e)
+            return None, report
+        report['convertible'] = True
+        return asset, report
+    raise MeshError(f'نوع ملف غير مدعوم: {ext}')
+
+
+def optimize(data, filename, read_uri=None, quantize=True):
+    """(إحصاءات الأصل، بايتات GLB المحسّن أو None، إحصاءات المحسّن، ملخص التغييرات)"""
+    asset, report = load(data, filename, read_uri)
+    if asset is None:
+        return report, None, None, {}
+    unsupported = set(asset.doc.get('extensionsUsed', [])) - SAFE_EXTENSIONS
+    if unsupported:
+        report['reason'] = 'امتدادات غير مدعومة للتحسين: ' + ', '.join(sorted(unsupported))
+        return report, None, None, {}
+
+    changes = {}
+    pruned = _prune(asset)
+    if pruned:
+        changes['pruned'] = pruned
+    if quantize:
+        quantized = _quantize(asset)
+        if quantized:
+            changes['quantized'] = quantized
+    deduped = _dedupe_all(asset)
+    if deduped:
+        changes['deduplicated'] = deduped
+    # التكميم والدمج يتركان bufferViews يتيمة
+    _drop_unreferenced(asset, 'bufferViews')
+
+    output = asset.to_glb()
+    optimized_report = dict(inspect_gltf(asset, len(output)), format='glb')
+    return report, output, optimized_report, changes
@@ -0,0 +1,145 @@
+import os
+import json
+import mmap
+import fcntl
+import struct
+
+from src.utils.runtime import runtime_path, temp_path
+
+# مقاييس مشتركة بين جميع عمال gunicorn: قيم float64 في ملف mmap، وكل سلسلة (اسم + تسميات)
+# تحصل على خانة ثابتة تُسجَّل في ملف فهرس، فيقرأ /api/metrics مجموع كل العمال بصيغة Prometheus.
+VALUES_PATH = runtime_path('metrics', 'values.bin')
+INDEX_PATH = runtime_path('metrics', 'index.json')
+LOCK_PATH = runtime_path('metrics', 'metrics.lock')
+MAX_SERIES = 4096
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_VALUE = struct.Struct('<d')
+
+_values = None
+_values_pid = None
+_slots = {}
+_help = {}
+
+
+def _table():
+    """ملف القيم المشترك (يُفتح مرة لكل عملية)"""
+    global _values, _values_pid
+    if _values is not None and _values_pid == os.getpid():
+        return _values
+    fd = os.open(VALUES_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        size = MAX_SERIES * _VALUE.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        _values = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+    finally:
+        os.close(fd)
+    _values_pid = os.getpid()
+    return _values
+
+
+def _read_index():
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'series': {}, 'types': {}}
+
+
+def _series_name(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+def _slot(series, metric, metric_type):
+    """رقم خانة السلسلة، مع تسجيلها في الفهرس المشترك عند أول استخدام (يُستدعى مع القفل)"""
+    slot = _slots.get(series)
+    if slot is not None:
+        return slot
+    index = _read_index()
+    if series not in index['series']:
+        if len(index['series']) >= MAX_SERIES:
+            return None
+        index['series'][series] = len(index['series'])
+        index['types'][metric] = metric_type
+        tmp_path = temp_path(INDEX_PATH)
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, INDEX_PATH)
+    _slots[series] = index['series'][series]
+    return _slots[series]
+
+
+def _add(updates, metric, metric_type):
+    """إضافة قيم إلى عدة سلاسل دفعة واحدة تحت قفل واحد"""
+    try:
+        table = _table()
+        with open(LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for series, value in updates:
+                slot = _slot(series, metric, metric_type)
+                if slot is None:
+                    continue
+                offset = slot * _VALUE.size
+                _VALUE.pack_into(table, offset, _VALUE.unpack_from(table, offset)[0] + value)
+    except OSError as e:
+        # المقاييس لا يجب أن تُفشل الطلب نفسه
+        print(f"WARNING: metrics update failed: {e}")
+
+
+def describe(name, text):
+    """نص HELP للمقياس في مخرجات Prometheus"""
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    """زيادة عدّاد"""
+    _add([(_series_name(name, labels), value)], name, 'counter')
+
+
+def gauge_add(name, value, **labels):
+    """تعديل مقياس gauge (مثل عدد الطلبات الجارية)"""
+    _add([(_series_name(name, labels), value)], name, 'gauge')
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """تسجيل قيمة في مدرج تكراري (histogram) بحدود Prometheus التراكمية"""
+    updates = [
+        (_series_name(f'{name}_bucket', dict(labels, le=str(bound))), 1 if value <= bound else 0)
+        for bound in buckets
+    ]
+    updates.append((_series_name(f'{name}_bucket', dict(labels, le='+Inf')), 1))
+    updates.append((_series_name(f'{name}_sum', labels), value))
+    updates.append((_series_name(f'{name}_count', labels), 1))
+    _add(updates, name, 'histogram')
+
+
+def render():
+    """كل المقاييس بصيغة Prometheus النصية"""
+    table = _table()
+    index = _read_index()
+    rows = []
+    for series, slot in index['series'].items():
+        metric = series.split('{', 1)[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            if metric.endswith(suffix) and index['types'].get(metric[:-len(suffix)]) == 'histogram':
+                metric = metric[:-len(suffix)]
+                break
+        rows.append((metric, slot, series))
+    # ترتيب التسجيل يحفظ ترتيب حدود المدرج التكراري داخل كل مقياس
+    rows.sort()
+
+    lines = []
+    described = set()
+    for metric, slot, series in rows:
+        if metric not in described:
+            described.add(metric)
+            if metric in _help:
+                lines.append(f'# HELP {metric} {_help[metric]}')
+            lines.append(f"# TYPE {metric} {index['types'].get(metric, 'untyped')}")
+        value = _VALUE.unpack_from(table, slot * _VALUE.size)[0]
+        lines.append(f'{series} {value:.17g}')
+    return '\n'.join(lines) + '\n'
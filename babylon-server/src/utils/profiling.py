@@ -0,0 +1,302 @@
+import os
+import sys
+import hmac
+import json
+import time
+import fcntl
+import pstats
+import cProfile
+import threading
+
+from flask import g, request
+
+from src.utils.runtime import runtime_path, temp_path
+
+# أدوات قياس الأداء داخل عمال gunicorn (معطلة افتراضياً):
+# - cProfile لطلب واحد عند ترويسة X-Profile أو بعد تسليح عدد من الطلبات عبر /api/profiling/arm
+# - عينات دورية لمكدسات كل الخيوط في كل عامل (sys._current_frames) بتكلفة منخفضة
+# الناتج ملفات .folded (صيغة flamegraph.pl / speedscope) وملفات .prof (pstats / snakeviz).
+ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.dirname(runtime_path('profiles', 'x'))
+MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+# فترة أخذ العينات بالثواني (0 يعطل العينات الدورية)، وفترة كتابة الملف
+SAMPLER_INTERVAL = float(os.getenv('PROFILE_SAMPLER_INTERVAL', '0'))
+SAMPLER_FLUSH = float(os.getenv('PROFILE_SAMPLER_FLUSH', '30'))
+MAX_DEPTH = 128
+
+ARMED_PATH = runtime_path('profiling', 'armed.json')
+
+_sampler = None
+_sampler_pid = None
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _write(name, data):
+    """كتابة ذرية داخل PROFILE_DIR مع حذف الأقدم عند تجاوز PROFILE_MAX_FILES"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, name)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _prune()
+    return path
+
+
+def _prune():
+    files = list_files()
+    for entry in files[MAX_FILES:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry['name']))
+        except OSError:
+            pass
+
+
+def list_files():
+    """ملفات القياس الأحدث أولاً"""
+    entries = []
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        if not name.endswith(('.folded', '.prof')):
+            continue
+        try:
+            st = os.stat(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            continue
+        entries.append({'name': name, 'size': st.st_size, 'modified': st.st_mtime})
+    entries.sort(key=lambda entry: entry['modified'], reverse=True)
+    return entries
+
+
+def clear_files():
+    removed = 0
+    for entry in list_files():
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry['name']))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# ---- cProfile لكل طلب ----
+
+def folded_from_stats(stats):
+    """تحويل بيانات cProfile إلى مكدسات مطوية (بالميكروثانية).
+    cProfile يسجل أزواج المستدعي/المستدعى فقط، فيُوزَّع وقت كل دالة على مساراتها بنسبة زمن كل مستدعٍ."""
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            if caller != func:
+                callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in raw.items() if not [c for c in entry[4] if c != func]]
+
+    def label(func):
+        filename, line, name = func
+        if filename == '~':
+            return name
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    lines = {}
+    # عدد المسارات قد ينفجر في الرسوم الكبيرة، فيُحد عدد الزيارات
+    budget = [200000]
+
+    def walk(func, stack, share):
+        budget[0] -= 1
+        if budget[0] < 0:
+            return
+        _, _, self_time, total_time, _ = raw[func]
+        stack = stack + [label(func)]
+        micros = int(self_time * share * 1e6)
+        if micros > 0:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + micros
+        if len(stack) >= MAX_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, []):
+            callee_total = raw[callee][3]
+            if callee_total <= 0 or label(callee) in stack:
+                continue
+            child_share = share * edge_time / callee_total if total_time > 0 else 0
+            if child_share * callee_total * 1e6 >= 1:
+                walk(callee, stack, min(child_share, 1.0))
+
+    for root in roots:
+        walk(root, [], 1.0)
+    return ''.join(f"{stack} {value}\n" for stack, value in sorted(lines.items()))
+
+
+def _consume_armed(endpoint):
+    """هل هذا الطلب من الطلبات المسلحة عبر /arm؟ (العدّاد مشترك بين العمال)"""
+    if not os.path.exists(ARMED_PATH):
+        return False
+    with open(ARMED_PATH, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            armed = json.loads(f.read() or '{}')
+        except ValueError:
+            armed = {}
+        if armed.get('count', 0) <= 0 or (armed.get('endpoint') and armed['endpoint'] != endpoint):
+            return False
+        armed['count'] -= 1
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(armed))
+    if armed['count'] <= 0:
+        try:
+            os.remove(ARMED_PATH)
+        except OSError:
+            pass
+    return True
+
+
+def arm(count, endpoint=None):
+    """تسليح الطلبات الـ count التالية (لنقطة نهاية محددة اختيارياً، مثل assets.bundle_flow_project)"""
+    with open(ARMED_PATH, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps({'count': count, 'endpoint': endpoint}))
+
+
+def armed_state():
+    try:
+        with open(ARMED_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'count': 0, 'endpoint': None}
+
+
+def authorized():
+    """الرمز مطلوب دائماً: خلف وكيل عكسي يبدو كل طلب قادماً من 127.0.0.1، فلا استثناء للجهاز نفسه"""
+    if not TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Profile-Token', ''), TOKEN)
+
+
+def _start_request_profile():
+    g.profiler = None
+    if request.blueprint == 'profiling':
+        return
+    if request.headers.get('X-Profile') == '1' and authorized() or _consume_armed(request.endpoint):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # مُحلل آخر نشط في نفس العملية (خادم التطوير متعدد الخيوط)
+            return
+        g.profiler = profiler
+        g.profiler_started = time.time()
+
+
+def _finish_request_profile(response):
+    profiler = getattr(g, 'profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    g.profiler = None
+    elapsed = time.time() - g.profiler_started
+    stem = f"request-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{os.getpid()}-{(request.endpoint or 'unknown').replace('.', '_')}"
+    try:
+        _write(stem + '.folded', folded_from_stats(pstats.Stats(profiler)))
+        profiler.dump_stats(os.path.join(PROFILE_DIR, stem + '.prof'))
+        response.headers['X-Profile-Id'] = stem
+        response.headers['X-Profile-Duration'] = f"{elapsed:.6f}"
+    except OSError as e:
+        print(f"WARNING: writing request profile failed: {e}")
+    return response
+
+
+# ---- العينات الدورية ----
+
+class StackSampler(threading.Thread):
+    """خيط يأخذ مكدسات كل الخيوط كل SAMPLER_INTERVAL ويكتب المجاميع دورياً (ملف لكل عامل)"""
+
+    def __init__(self, interval, flush_every):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.interval = interval
+        self.flush_every = flush_every
+        self.counts = {}
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.filename = f"sampler-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded"
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(f"thread:{names.get(ident, ident)}")
+            key = ';'.join(reversed(stack))
+            with self.lock:
+                self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def flush(self):
+        with self.lock:
+            data = ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+        if data:
+            try:
+                _write(self.filename, data)
+            except OSError as e:
+                print(f"WARNING: writing sampler profile failed: {e}")
+
+    def run(self):
+        next_flush = time.monotonic() + self.flush_every
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_every
+
+    def stop(self):
+        self.stop_event.set()
+        self.flush()
+
+
+def ensure_sampler():
+    """تشغيل خيط العينات مرة لكل عامل (بعد fork؛ الخيوط لا تنجو من fork)"""
+    global _sampler, _sampler_pid
+    if not ENABLED or SAMPLER_INTERVAL <= 0 or _sampler_pid == os.getpid():
+        return _sampler
+    _sampler = StackSampler(SAMPLER_INTERVAL, SAMPLER_FLUSH)
+    _sampler_pid = os.getpid()
+    _sampler.start()
+    return _sampler
+
+
+def stop_sampler():
+    if _sampler is not None and _sampler_pid == os.getpid():
+        _sampler.stop()
+
+
+def sampler_state():
+    if _sampler is None or _sampler_pid != os.getpid():
+        return None
+    return {'pid': _sampler_pid, 'interval': _sampler.interval, 'samples': _sampler.samples, 'file': _sampler.filename}
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    if not TOKEN:
+        print("WARNING: PROFILING_ENABLED without PROFILING_TOKEN: X-Profile and /api/profiling are refused")
+    app.before_request(_start_request_profile)
+    # خادم التطوير بدون gunicorn (post_fork) يبدأ العينات مع أول طلب
+    app.before_request(lambda: ensure_sampler() and None)
+    app.after_request(_finish_request_profile)
@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import sqlite3
+import hashlib
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import change_feed
+from src.utils import asset_locks
+from src.utils.runtime import is_temp_path, runtime_path, temp_path
+from src.utils.storage import normalize_key
+
+# النسخ بين العقد: كل عقدة تنشر بياناً (manifest) بملفات المكتبة (المسار، الحجم، البصمة، وقت التعديل)،
+# والبيان التزايدي منذ رقم تسلسلي يُبنى من سجل التغييرات فيغطي فقط مجلدات الأصول التي تغيرت.
+# العقدة الأخرى تقارن البصمات وتجلب الملفات الناقصة أو المختلفة فقط عبر اتصالات HTTP مجمّعة.
+# الحذف لا يُستنتج من غياب ملف في البيان (قد يكون أصلاً أُنشئ على هذه العقدة فقط)، بل من أحداث
+# الحذف الصريحة في سجل العقدة الأخرى (tombstones)؛ وضع المرآة الكاملة اختياري عبر REPLICATION_MIRROR_DELETES.
+HASH_DB_PATH = runtime_path('replication', 'hashes.db')
+STATE_PATH = runtime_path('replication', 'state.json')
+NODE_ID_PATH = runtime_path('replication', 'node_id')
+PULL_LOCK_PATH = runtime_path('replication', 'pull.lock')
+LAST_PULL_PATH = runtime_path('replication', 'last_pull.json')
+
+TOKEN = os.getenv('REPLICATION_TOKEN', '')
+PEERS = [peer.strip().rstrip('/') for peer in os.getenv('REPLICATION_PEERS', '').split(',') if peer.strip()]
+MAX_CONNECTIONS = int(os.getenv('REPLICATION_MAX_CONNECTIONS', '8'))
+HTTP_TIMEOUT = float(os.getenv('REPLICATION_HTTP_TIMEOUT', '30'))
+# حذف كل ملف محلي لا تملكه العقدة الأخرى داخل نطاقات البيان (مناسب فقط لنسخة قراءة لا تقبل كتابات)
+MIRROR_DELETES = os.getenv('REPLICATION_MIRROR_DELETES', 'false').lower() == 'true'
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT NOT NULL
+);
+'''
+
+_local = threading.local()
+
+
+class ReplicationError(Exception):
+    """فشل في التواصل مع العقدة الأخرى أو بيان غير صالح"""
+
+
+class ReplicationBusy(ReplicationError):
+    """عملية سحب أخرى جارية على هذه العقدة"""
+
+
+def node_id():
+    """معرّف ثابت لهذه العقدة؛ يتغير إذا مُسح مجلد التشغيل (ومعه سجل التغييرات وأرقامه التسلسلية)"""
+    try:
+        with open(NODE_ID_PATH) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(NODE_ID_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        with os.fdopen(fd, 'w') as f:
+            f.write(uuid.uuid4().hex)
+    except FileExistsError:
+        pass
+    with open(NODE_ID_PATH) as f:
+        return f.read().strip()
+
+
+def _connect():
+    """اتصال لكل خيط ولكل عملية (لا تُشارك اتصالات SQLite عبر fork)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(HASH_DB_PATH, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def _hash_file(storage, key):
+    path = storage.open_local(key)
+    if path is None:
+        raise FileNotFoundError(key)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def file_hash(conn, storage, key, size, mtime):
+    """بصمة sha256 للملف، من ذاكرة البصمات ما دام الحجم ووقت التعديل لم يتغيرا"""
+    row = conn.execute('SELECT size, mtime, hash FROM hashes WHERE path = ?', (key,)).fetchone()
+    if row is not None and row[0] == size and row[1] == mtime:
+        return row[2]
+    digest = _hash_file(storage, key)
+    conn.execute('INSERT OR REPLACE INTO hashes (path, size, mtime, hash) VALUES (?, ?, ?, ?)',
+                 (key, size, mtime, digest))
+    return digest
+
+
+def _is_temporary(rel_path):
+    # ملفات الكتابة الذرية (name.<pid>.tmp) لم تكتمل بعد
+    return is_temp_path(rel_path)
+
+
+def check_key(key, asset_dirs):
+    """توحيد مفتاح أو بادئة والتأكد أنه داخل مكتبة الأصول (وليس مجلد الاستيراد المؤقت مثلاً)"""
+    key = normalize_key(key)
+    if key and key.split('/', 1)[0] not in asset_dirs.values():
+        raise ValueError(f'المسار خارج مكتبة الأصول: {key}')
+    return key
+
+
+def _changed_scopes(events, asset_dirs):
+    """مجلدات الأصول التي تغيرت حسب الأحداث، أو None إذا تطلب حدث ما (مثل resync العام) بياناً كاملاً"""
+    scopes = set()
+    for event in events:
+        asset_type = event.get('asset_type')
+        if asset_type == '*':
+            return None
+        prefix = asset_dirs.get(asset_type)
+        if prefix is None:
+            continue
+        name = event.get('name') or ''
+        try:
+            scopes.add(normalize_key(f"{prefix}/{name}"))
+        except ValueError:
+            continue
+    return scopes
+
+
+def _deleted_scopes(events, asset_dirs):
+    """مجلدات الأصول التي حُذفت صراحة (حدث deleted لأصل مسمى) ضمن الأحداث"""
+    deleted = set()
+    for event in events:
+        prefix = asset_dirs.get(event.get('asset_type'))
+        # حذف جذر نوع كامل (name فارغ) لا يُنسخ: غالباً خطأ تشغيلي على تلك العقدة
+        if event.get('kind') != 'deleted' or prefix is None or not event.get('name'):
+            continue
+        try:
+            deleted.add(normalize_key(f"{prefix}/{event['name']}"))
+        except ValueError:
+            continue
+    return deleted
+
+
+def _in_scopes(key, scopes):
+    return any(key == scope or key.startswith(scope + '/') for scope in scopes)
+
+
+def _minimal_scopes(scopes, prefix=''):
+    """حصر النطاقات داخل البادئة المطلوبة وحذف أي نطاق يغطيه نطاق أب"""
+    restricted = set()
+    for scope in scopes:
+        if not prefix or scope == prefix or scope.startswith(prefix + '/'):
+            restricted.add(scope)
+        elif prefix.startswith(scope + '/'):
+            restricted.add(prefix)
+    return sorted(
+        scope for scope in restricted
+        if not any(scope.startswith(parent + '/') for parent in restricted)
+    )
+
+
+def build_manifest(storage, asset_dirs, prefix='', since=None):
+    """بيان كامل للمكتبة أو لمسار فرعي، أو بيان تزايدي بالمجلدات التي تغيرت بعد الرقم التسلسلي since"""
+    prefix = check_key(prefix, asset_dirs)
+    # الرقم التسلسلي يُقرأ قبل سرد الملفات: أي تغيير أثناء السرد سيظهر في البيان التزايدي التالي
+    events, seq, complete = change_feed.read_since(since or 0)
+    scopes = None
+    deleted = []
+    if since is not None and complete:
+        scopes = _changed_scopes(events, asset_dirs)
+    full = scopes is None
+    if full:
+        scopes = [prefix] if prefix else sorted(asset_dirs.values())
+    else:
+        scopes = _minimal_scopes(scopes, prefix)
+        deleted = sorted(scope for scope in _deleted_scopes(events, asset_dirs) if _in_scopes(scope, scopes))
+
+    entries = []
+    conn = _connect()
+    with conn:
+        for scope in scopes:
+            for rel_path, size, mtime in storage.walk_files(scope):
+                if _is_temporary(rel_path):
+                    continue
+                key = f"{scope}/{rel_path}"
+                try:
+                    digest = file_hash(conn, storage, key, size, mtime)
+                except OSError:
+                    # حُذف أثناء السرد؛ الحذف نفسه سيظهر في البيان التالي
+                    continue
+                entries.append({'path': key, 'size': size, 'mtime': mtime, 'hash': digest})
+
+    return {
+        'node': node_id(),
+        'seq': seq,
+        'full': full,
+        'prefix': prefix,
+        'scopes': scopes,
+        'deleted': deleted,
+        'entries': entries
+    }
+
+
+class PeerClient:
+    """عميل HTTP لعقدة أخرى مع اتصال keep-alive لكل خيط في مجمع الجلب"""
+
+    def __init__(self, base_url, token=TOKEN, timeout=HTTP_TIMEOUT):
+        parts = urllib.parse.urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ReplicationError(f'عنوان عقدة غير صالح: {base_url}')
+        self.base_url = base_url
+        self.https = parts.scheme == 'https'
+        self.netloc = parts.netloc
+        self.base_path = parts.path.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = connection_class(self.netloc, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, path, params=None):
+        url = self.base_path + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        headers = {'X-Replication-Token': self.token} if self.token else {}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('GET', url, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                # الخادم أغلق اتصال keep-alive؛ محاولة واحدة على اتصال جديد
+                conn.close()
+                if attempt:
+                    raise ReplicationError(f'{self.base_url}{path}: {e}')
+        if response.status != 200:
+            raise ReplicationError(f'{self.base_url}{path}: HTTP {response.status}')
+        return body
+
+    def get_json(self, path, params=None):
+        try:
+            return json.loads(self.get(path, params))
+        except ValueError as e:
+            raise ReplicationError(f'{self.base_url}{path}: رد JSON غير صالح: {e}')
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+def load_state():
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def load_last_pull():
+    """نتيجة آخر سحب طُلب عبر /pull (تشمل أخطاء السحب الخلفي)، أو None"""
+    try:
+        with open(LAST_PULL_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_last_pull(value):
+    # الحالة للعرض فقط: فشل كتابتها لا يُفشل السحب
+    try:
+        tmp_path = temp_path(LAST_PULL_PATH)
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, LAST_PULL_PATH)
+    except OSError as e:
+        print(f"WARNING: saving replication pull result failed: {e}")
+
+
+def _save_peer_state(state_key, value):
+    state = load_state()
+    state[state_key] = value
+    tmp_path = temp_path(STATE_PATH)
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def _fetch(client, entry):
+    data = client.get('/api/replication/blob', {'path': entry['path']})
+    if hashlib.sha256(data).hexdigest() != entry['hash']:
+        # تغير الملف على العقدة الأخرى بعد بناء البيان؛ سيصل في البيان التزايدي التالي
+        return None
+    return data
+
+
+def pull(storage, asset_dirs, peer, prefix='', full=False):
+    """سحب التغييرات من عقدة أخرى وتطبيقها محلياً؛ يعيد ملخص العملية.
+    الملفات المحلية التي لا تملكها العقدة الأخرى تبقى، إلا داخل أصل حذفته صراحة (أو مع MIRROR_DELETES)"""
+    started = time.monotonic()
+    prefix = check_key(prefix, asset_dirs)
+    lock_file = open(PULL_LOCK_PATH, 'a')
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ReplicationBusy('عملية سحب أخرى جارية')
+        return _pull_locked(storage, asset_dirs, peer, prefix, full, started)
+    finally:
+        lock_file.close()
+
+
+def _pull_locked(storage, asset_dirs, peer, prefix, full, started):
+    state_key = f"{peer}|{prefix}"
+    peer_state = load_state().get(state_key, {})
+    client = PeerClient(peer)
+    try:
+        params = {'prefix': prefix} if prefix else {}
+        if not full and peer_state.get('seq') is not None:
+            params['since'] = peer_state['seq']
+        manifest = client.get_json('/api/replication/manifest', params)
+        if manifest.get('node') == node_id():
+            raise ReplicationError('لا يمكن السحب من العقدة نفسها')
+        if 'since' in params and manifest.get('node') != peer_state.get('node'):
+            # العقدة الأخرى أعادت إنشاء سجلها فأرقامها التسلسلية لم تعد صالحة
+            params.pop('since')
+            manifest = client.get_json('/api/replication/manifest', params)
+
+        scopes = [check_key(scope, asset_dirs) for scope in manifest['scopes']]
+        tombstones = [check_key(scope, asset_dirs) for scope in manifest.get('deleted', [])]
+        if not all(_in_scopes(scope, scopes) for scope in tombstones):
+            raise ReplicationError('أصل محذوف خارج نطاقات البيان')
+        remote = {}
+        for entry in manifest['entries']:
+            key = check_key(entry['path'], asset_dirs)
+            if not any(key.startswith(scope + '/') for scope in scopes):
+                raise ReplicationError(f'مسار خارج نطاقات البيان: {key}')
+            remote[key] = entry
+
+        conn = _connect()
+        to_fetch = []
+        to_delete = []
+        unchanged = 0
+        with conn:
+            for scope in scopes:
+                for rel_path, size, mtime in storage.walk_files(scope):
+                    if _is_temporary(rel_path):
+                        continue
+                    key = f"{scope}/{rel_path}"
+                    entry = remote.get(key)
+                    if entry is None:
+                        if MIRROR_DELETES or _in_scopes(key, tombstones):
+                            to_delete.append(key)
+                    elif entry['size'] == size and file_hash(conn, storage, key, size, mtime) == entry['hash']:
+                        unchanged += 1
+                        remote.pop(key)
+            to_fetch = list(remote.values())
+
+        types_by_dir = {prefix: asset_type for asset_type, prefix in asset_dirs.items()}
+        fetched = []
+        stale = 0
+        with ThreadPoolExecutor(max_workers=MAX_CONNECTIONS) as pool:
+            for entry, data in zip(to_fetch, pool.map(lambda entry: _fetch(client, entry), to_fetch)):
+                if data is None:
+                    stale += 1
+                    continue
+                with asset_locks.locked(writes=[_lock_key(entry['path'], types_by_dir)]):
+                    storage.write_bytes(entry['path'], data)
+                fetched.append((entry, len(data)))
+
+        with conn:
+            for entry, size in fetched:
+                # البصمة معروفة مسبقاً فلا حاجة لقراءة الملف مجدداً في البيان التالي
+                local_size, local_mtime = storage.stat(entry['path'])
+                conn.execute('INSERT OR REPLACE INTO hashes (path, size, mtime, hash) VALUES (?, ?, ?, ?)',
+                             (entry['path'], local_size, local_mtime, entry['hash']))
+            for key in to_delete:
+                with asset_locks.locked(writes=[_lock_key(key, types_by_dir)]):
+                    storage.delete(key)
+                conn.execute('DELETE FROM hashes WHERE path = ?', (key,))
+
+        _publish_changes(storage, asset_dirs, [entry['path'] for entry, size in fetched], to_delete)
+
+        _save_peer_state(state_key, {
+            'node': manifest['node'],
+            'seq': manifest['seq'],
+            'pulled_at': time.time()
+        })
+        return {
+            'peer': peer,
+            'prefix': prefix,
+            'full': manifest['full'],
+            'seq': manifest['seq'],
+            'scopes': len(scopes),
+            'fetched': len(fetched),
+            'bytes': sum(size for entry, size in fetched),
+            'deleted': len(to_delete),
+            'unchanged': unchanged,
+            'stale': stale,
+            'took_ms': round((time.monotonic() - started) * 1000, 2)
+        }
+    finally:
+        client.close()
+
+
+def _lock_key(key, types_by_dir):
+    """مفتاح قفل الأصل الذي يحتوي الملف (مثل scene/forest لـ scenes/forest/assets/tree.glb)"""
+    parts = key.split('/')
+    return asset_locks.asset_key(types_by_dir[parts[0]], parts[1] if len(parts) > 2 else '')
+
+
+def _publish_changes(storage, asset_dirs, written, deleted):
+    """نشر حدث لكل أصل تغير (لإبطال الذاكرة المشتركة وإعلام مستمعي البث) وحذف مجلدات الأصول الفارغة"""
+    types_by_dir = {prefix: asset_type for asset_type, prefix in asset_dirs.items()}
+    touched = {}
+    for key, kind in [(key, 'updated') for key in written] + [(key, 'deleted') for key in deleted]:
+        parts = key.split('/')
+        if len(parts) < 3:
+            continue
+        asset = (types_by_dir[parts[0]], parts[1])
+        if kind == 'updated' or asset not in touched:
+            touched[asset] = kind
+    for (asset_type, name), kind in touched.items():
+        folder = f"{asset_dirs[asset_type]}/{name}"
+        with asset_locks.locked(writes=[asset_locks.asset_key(asset_type, name)]):
+            if kind == 'deleted' and not any(True for _ in storage.walk_files(folder)):
+                storage.delete_tree(folder)
+            else:
+                kind = 'updated'
+        change_feed.publish(kind, asset_type, name, source='replication')
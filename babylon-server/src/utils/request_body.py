@@ -0,0 +1,144 @@
+import os
+import json
+import zlib
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import zstandard
+except ImportError:  # اختياري: pip install zstandard
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # اختياري: pip install msgpack
+    msgpack = None
+
+# الحد الأقصى لحجم الجسم بعد فك الضغط (حماية من قنابل الضغط)
+MAX_DECODED_BYTES = int(os.getenv('MAX_DECODED_BODY_BYTES', str(64 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+# مدخل zstd يُمرر على دفعات صغيرة: كتلة واحدة من بضعة بايتات قد تتضخم إلى 128KB،
+# فيبقى ما يُنتج قبل فحص الحد بضعة ميغابايتات على الأكثر
+ZSTD_FEED_SIZE = 256
+
+JSON_TYPES = ('application/json', '')
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+class BodyError(ValueError):
+    """جسم طلب غير صالح؛ status هو رمز HTTP المناسب للرد"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _too_large(limit):
+    return BodyError(f'حجم البيانات بعد فك الضغط يتجاوز الحد المسموح ({limit} بايت)', 413)
+
+
+def _read_identity(stream, limit):
+    out = bytearray()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return bytes(out)
+        out += chunk
+        if len(out) > limit:
+            raise _too_large(limit)
+
+
+def _read_zlib(stream, wbits, limit):
+    decompressor = zlib.decompressobj(wbits)
+    out = bytearray()
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            while chunk:
+                # max_length يمنع تضخم المخرجات دفعة واحدة من مدخل صغير
+                out += decompressor.decompress(chunk, limit + 1 - len(out))
+                if len(out) > limit:
+                    raise _too_large(limit)
+                chunk = decompressor.unconsumed_tail
+        out += decompressor.flush()
+    except zlib.error as e:
+        raise BodyError(f'بيانات مضغوطة غير صالحة: {e}')
+    if len(out) > limit:
+        raise _too_large(limit)
+    if not decompressor.eof:
+        raise BodyError('بيانات مضغوطة ناقصة (انتهى الجسم قبل نهاية التدفق المضغوط)')
+    return bytes(out)
+
+
+def _read_zstd(stream, limit):
+    if zstandard is None:
+        raise BodyError('ترميز zstd غير مدعوم على هذا الخادم', 415)
+    # decompressobj وليس stream_reader: الأخير يعيد ما فُك من إطار مقطوع دون خطأ، بينما eof يكشفه
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    out = bytearray()
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            for start in range(0, len(chunk), ZSTD_FEED_SIZE):
+                out += decompressor.decompress(chunk[start:start + ZSTD_FEED_SIZE])
+                if len(out) > limit:
+                    raise _too_large(limit)
+    except zstandard.ZstdError as e:
+        raise BodyError(f'بيانات مضغوطة غير صالحة: {e}')
+    if not decompressor.eof:
+        raise BodyError('بيانات مضغوطة ناقصة (انتهى الجسم قبل نهاية التدفق المضغوط)')
+    return bytes(out)
+
+
+def read_body(req, limit=MAX_DECODED_BYTES):
+    """قراءة جسم الطلب مع فك ضغط Content-Encoding (gzip, deflate, zstd) بشكل متدفق ومحدود الحجم"""
+    try:
+        return _decode_body(req, limit)
+    except RequestEntityTooLarge:
+        # الجسم الخام (قبل فك الضغط) تجاوز حد الطلب المضبوط في التحكم في القبول
+        raise BodyError('حجم الطلب يتجاوز الحد المسموح', 413)
+
+
+def _decode_body(req, limit):
+    encoding = (req.headers.get('Content-Encoding') or 'identity').strip().lower()
+    stream = req.stream
+    if encoding == 'identity':
+        return _read_identity(stream, limit)
+    if encoding in ('gzip', 'x-gzip'):
+        return _read_zlib(stream, 16 + zlib.MAX_WBITS, limit)
+    if encoding == 'deflate':
+        return _read_zlib(stream, zlib.MAX_WBITS, limit)
+    if encoding == 'zstd':
+        return _read_zstd(stream, limit)
+    raise BodyError(f'ترميز المحتوى غير مدعوم: {encoding}', 415)
+
+
+def parse_body(req, limit=MAX_DECODED_BYTES):
+    """فك جسم الطلب حسب Content-Type (JSON أو MessagePack) وإرجاع القاموس"""
+    content_type = req.mimetype
+    body = read_body(req, limit)
+    if not body:
+        raise BodyError('لا توجد بيانات')
+
+    if content_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise BodyError('صيغة MessagePack غير مدعومة على هذا الخادم', 415)
+        try:
+            data = msgpack.unpackb(body, raw=False, max_bin_len=limit, max_str_len=limit)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise BodyError(f'بيانات MessagePack غير صالحة: {e}')
+    elif content_type in JSON_TYPES or content_type.endswith('+json'):
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise BodyError(f'بيانات JSON غير صالحة: {e}')
+    else:
+        raise BodyError(f'نوع المحتوى غير مدعوم: {content_type}', 415)
+
+    if not data or not isinstance(data, dict):
+        raise BodyError('لا توجد بيانات')
+    return data
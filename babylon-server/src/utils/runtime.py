@@ -0,0 +1,23 @@
+import os
+import tempfile
+import threading
+
+# مجلد ملفات التشغيل المشتركة بين عمليات gunicorn (سجلات، أقفال، ذاكرة مؤقتة)
+RUNTIME_DIR = os.getenv('BABYLON_RUNTIME_DIR', os.path.join(tempfile.gettempdir(), 'babylon-game-api'))
+
+
+def runtime_path(*parts):
+    """إرجاع مسار داخل مجلد التشغيل مع إنشاء المجلد الأب إذا لزم الأمر"""
+    path = os.path.join(RUNTIME_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def temp_path(path):
+    """ملف مؤقت بجانب path للكتابة الذرية (ثم os.replace)، فريد لكل عملية وخيط (عمال gthread)"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def is_temp_path(path):
+    """ملف كتابة ذرية من temp_path لم يُستبدل به الملف النهائي بعد"""
+    return path.endswith('.tmp')
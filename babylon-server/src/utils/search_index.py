@@ -0,0 +1,489 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+from src.utils import change_feed
+from src.utils.runtime import runtime_path
+
+# فهرس البحث: SQLite FTS5 بمقسّم trigram يدعم البحث عن أي جزء من النص، مع جدول للرموز (الدوال والأصناف)
+INDEX_PATH = runtime_path('search', 'index.db')
+# الفهرس يتبع سجل التغييرات؛ المسح الكامل للتخزين عند الحاجة فقط، أو دورياً إذا ضُبطت هذه المدة
+# (تخزين S3 يكتب فيه طرف آخر لا ينشر أحداثاً)
+FULL_RECONCILE_INTERVAL = float(os.getenv('SEARCH_FULL_RECONCILE_SECONDS', '0'))
+# حماية وضع regex من التعابير ذات التراجع الأسي أو متعدد الحدود
+REGEX_MAX_LENGTH = int(os.getenv('SEARCH_REGEX_MAX_LENGTH', '200'))
+REGEX_MAX_LINE = int(os.getenv('SEARCH_REGEX_MAX_LINE', '2000'))
+REGEX_TIME_BUDGET = float(os.getenv('SEARCH_REGEX_SECONDS', '1.0'))
+MAX_SNIPPETS = 3
+# الأسطر الطويلة جداً (كود مصغّر أو بيانات مضمنة) لا تُفحص بحثاً عن الرموز
+MAX_SYMBOL_LINE = 2000
+SNIPPET_WIDTH = 160
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY,
+    asset_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    UNIQUE (asset_type, name)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS asset_text USING fts5(name, code, tokenize = 'trigram');
+CREATE TABLE IF NOT EXISTS symbols (
+    asset_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_symbol ON symbols (symbol COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS symbols_asset ON symbols (asset_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+# أنماط تعريف الرموز في كود JavaScript الخاص بالمشاهد
+SYMBOL_PATTERNS = [
+    re.compile(r'\bfunction\s*\*?\s*([A-Za-z_$][\w$]*)'),
+    re.compile(r'\bclass\s+([A-Za-z_$][\w$]*)'),
+    re.compile(r'\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)'),
+    re.compile(r'(?<![\w$.])([A-Za-z_$][\w$.]{0,127})\s*=\s*(?:async\s*)?function\b'),
+    re.compile(r'^\s*(?:async\s+)?([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*\{'),
+]
+JS_KEYWORDS = {'if', 'for', 'while', 'switch', 'catch', 'function', 'return', 'with'}
+
+_local = threading.local()
+# (inode، حجم) سجل التغييرات عند آخر مطابقة في هذه العملية: إذا لم يتغير فلا شيء جديد
+_journal_seen = False
+_last_full_reconcile = 0.0
+
+
+class SearchError(ValueError):
+    """خطأ في صيغة استعلام البحث"""
+
+
+def _regex_module():
+    # اختياري: pip install regex (يدعم مهلة لكل مطابقة)
+    try:
+        import regex
+    except ImportError:
+        return None
+    return regex
+
+
+def _connect():
+    """اتصال لكل خيط ولكل عملية (لا تُشارك اتصالات SQLite عبر fork)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(INDEX_PATH, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def extract_symbols(code):
+    """استخراج (الرمز، رقم السطر) من الكود"""
+    symbols = []
+    for line_number, line in enumerate(code.splitlines(), 1):
+        if len(line) > MAX_SYMBOL_LINE:
+            continue
+        seen = set()
+        for pattern in SYMBOL_PATTERNS:
+            for match in pattern.finditer(line):
+                symbol = match.group(1)
+                if symbol in JS_KEYWORDS or symbol in seen:
+                    continue
+                seen.add(symbol)
+                symbols.append((symbol, line_number))
+    return symbols
+
+
+def _write_asset(conn, asset_type, name, code, mtime):
+    # الكتابة أولاً (وليس SELECT) حتى تحجز المعاملة قفل الكتابة قبل أي قراءة، فلا يتسابق عاملان على نفس الأصل
+    conn.execute(
+        'INSERT OR IGNORE INTO assets (asset_type, name, mtime) VALUES (?, ?, ?)',
+        (asset_type, name, mtime)
+    )
+    asset_id = conn.execute('SELECT id FROM assets WHERE asset_type = ? AND name = ?', (asset_type, name)).fetchone()[0]
+    conn.execute('UPDATE assets SET mtime = ? WHERE id = ?', (mtime, asset_id))
+    conn.execute('DELETE FROM asset_text WHERE rowid = ?', (asset_id,))
+    conn.execute('DELETE FROM symbols WHERE asset_id = ?', (asset_id,))
+    conn.execute('INSERT INTO asset_text (rowid, name, code) VALUES (?, ?, ?)', (asset_id, name, code))
+    conn.executemany(
+        'INSERT INTO symbols (asset_id, symbol, line) VALUES (?, ?, ?)',
+        [(asset_id, symbol, line) for symbol, line in extract_symbols(code)]
+    )
+
+
+def _delete_asset(conn, asset_type, name):
+    row = conn.execute('SELECT id FROM assets WHERE asset_type = ? AND name = ?', (asset_type, name)).fetchone()
+    if row:
+        conn.execute('DELETE FROM asset_text WHERE rowid = ?', (row[0],))
+        conn.execute('DELETE FROM symbols WHERE asset_id = ?', (row[0],))
+        conn.execute('DELETE FROM assets WHERE id = ?', (row[0],))
+
+
+def code_from_json(raw):
+    """استخراج حقل code من ملف الأصل (bytes) كنص قابل للفهرسة"""
+    return _code_text(json.loads(raw).get('code'))
+
+
+def _code_text(code):
+    return code if isinstance(code, str) else json.dumps(code, ensure_ascii=False)
+
+
+def index_asset(asset_type, name, code, mtime):
+    """إعادة فهرسة أصل واحد بعد حفظه"""
+    try:
+        conn = _connect()
+        with conn:
+            _write_asset(conn, asset_type, name, _code_text(code), mtime)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        # الفهرس يُصحَّح لاحقاً في reconcile، لذا لا نُفشل عملية الحفظ
+        print(f"WARNING: search index update failed for {asset_type}/{name}: {e}")
+
+
+def remove_asset(asset_type, name):
+    """حذف أصل من الفهرس"""
+    try:
+        conn = _connect()
+        with conn:
+            _delete_asset(conn, asset_type, name)
+    except sqlite3.Error as e:
+        print(f"WARNING: search index delete failed for {asset_type}/{name}: {e}")
+
+
+def _journal_state():
+    try:
+        st = os.stat(change_feed.JOURNAL_PATH)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size
+
+
+def reconcile(storage, asset_dirs, force=False):
+    """مطابقة الفهرس مع التخزين (تعديلات خارج الواجهة، عمال أو عقد أخرى) انطلاقاً من سجل التغييرات:
+    تُعاد فهرسة الأصول المذكورة في الأحداث الجديدة فقط، ويُمسح التخزين كاملاً عند فهرس جديد
+    أو سجل لم يعد يحتوي كل الأحداث منذ آخر مطابقة أو حدث resync"""
+    global _journal_seen, _last_full_reconcile
+    now = time.monotonic()
+    periodic = FULL_RECONCILE_INTERVAL > 0 and now - _last_full_reconcile >= FULL_RECONCILE_INTERVAL
+    journal = _journal_state()
+    if not force and not periodic and journal == _journal_seen:
+        return
+
+    conn = _connect()
+    row = conn.execute("SELECT value FROM meta WHERE key = 'feed_cursor'").fetchone()
+    cursor = int(row[0]) if row else None
+    events, newest, complete = change_feed.read_since(cursor or 0)
+
+    full = force or periodic or cursor is None or not complete
+    changed = set()
+    for event in events:
+        asset_type, name = event.get('asset_type'), event.get('name')
+        if event.get('kind') == 'resync' or (asset_type in asset_dirs and not name):
+            full = True
+        elif asset_type in asset_dirs:
+            changed.add((asset_type, name))
+
+    if full:
+        _reconcile_all(conn, storage, asset_dirs)
+        _last_full_reconcile = now
+    else:
+        _reconcile_assets(conn, storage, asset_dirs, changed)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('feed_cursor', ?)", (str(newest),))
+    _journal_seen = journal
+
+
+def _reconcile_assets(conn, storage, asset_dirs, keys):
+    """إعادة فهرسة أصول محددة (نوع، اسم) بمقارنة وقت التعديل"""
+    with conn:
+        for asset_type, name in keys:
+            json_key = f"{asset_dirs[asset_type]}/{name}/{name}.json"
+            try:
+                _, mtime = storage.stat(json_key)
+            except FileNotFoundError:
+                _delete_asset(conn, asset_type, name)
+                continue
+            row = conn.execute(
+                'SELECT mtime FROM assets WHERE asset_type = ? AND name = ?', (asset_type, name)
+            ).fetchone()
+            if row and row[0] == mtime:
+                continue
+            try:
+                _write_asset(conn, asset_type, name, code_from_json(storage.read_bytes(json_key)), mtime)
+            except (OSError, ValueError):
+                continue
+
+
+def _reconcile_all(conn, storage, asset_dirs):
+    """مطابقة كاملة بمسح كل مجلدات الأصول"""
+    indexed = {
+        (asset_type, name): mtime
+        for asset_type, name, mtime in conn.execute('SELECT asset_type, name, mtime FROM assets')
+    }
+    in_storage = {}
+    for asset_type, prefix in asset_dirs.items():
+        # قائمة واحدة لكل نوع (صفحات list_objects في S3) بدلاً من طلب لكل أصل
+        for rel_path, size, mtime in storage.walk_files(prefix):
+            folder_name, _, filename = rel_path.partition('/')
+            if filename == f"{folder_name}.json":
+                in_storage[(asset_type, folder_name)] = (f"{prefix}/{rel_path}", mtime)
+
+    with conn:
+        for key in indexed.keys() - in_storage.keys():
+            _delete_asset(conn, *key)
+        for key, (json_key, mtime) in in_storage.items():
+            if indexed.get(key) == mtime:
+                continue
+            try:
+                _write_asset(conn, key[0], key[1], code_from_json(storage.read_bytes(json_key)), mtime)
+            except (OSError, ValueError):
+                continue
+
+
+_QUANTIFIER = re.compile(r'[*+?]|\{(?:\d+(?:,\d*)?|,\d+)\}')
+_UNBOUNDED = re.compile(r'[*+]|\{\d+,\}')
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\\g<')
+
+
+def check_regex(pattern):
+    """رفض التعابير التي قد يستغرق تنفيذها زمناً أسياً: المكمّمات المتداخلة ((a+)+، (a|ab)*)
+    والمراجع الخلفية والأنماط الطويلة؛ بدون حزمة regex (لا مهلة للمطابقة) يُسمح بمكمّم غير محدود واحد فقط"""
+    if len(pattern) > REGEX_MAX_LENGTH:
+        raise SearchError(f'التعبير النمطي أطول من {REGEX_MAX_LENGTH} حرفاً')
+    if _BACKREFERENCE.search(pattern):
+        raise SearchError('المراجع الخلفية غير مدعومة في البحث')
+
+    # لكل مجموعة مفتوحة: هل تحتوي مكمّماً أو بدائل |
+    groups = [False]
+    unbounded = 0
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        inner = None
+        if ch == '\\':
+            i += 2
+        elif ch == '[':
+            # فئة حروف: تُتخطى كاملة (] في أولها حرف عادي)
+            i += 2 if pattern.startswith('[^', i) else 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif ch == '(':
+            groups.append(False)
+            i += 1
+            continue
+        elif ch == ')' and len(groups) > 1:
+            inner = groups.pop()
+            groups[-1] = groups[-1] or inner
+            i += 1
+        elif ch == '|':
+            groups[-1] = True
+            i += 1
+            continue
+        else:
+            i += 1
+
+        match = _QUANTIFIER.match(pattern, i)
+        if not match:
+            continue
+        quantifier = match.group()
+        if inner and quantifier not in ('?', '{1}', '{0,1}', '{,1}'):
+            raise SearchError('المكمّمات المتداخلة مثل (a+)+ غير مدعومة في البحث')
+        if _UNBOUNDED.fullmatch(quantifier):
+            unbounded += 1
+        groups[-1] = True
+        i = match.end()
+        # المكمّم الكسول أو المتملك
+        if i < len(pattern) and pattern[i] in '?+':
+            i += 1
+
+    if unbounded > 1 and _regex_module() is None:
+        raise SearchError('أكثر من مكمّم غير محدود يحتاج الحزمة الاختيارية regex')
+
+
+def _regex_matcher(pattern):
+    """دالة مطابقة سطر بمهلة إجمالية REGEX_TIME_BUDGET لكل عملية بحث؛ الأسطر الأطول من REGEX_MAX_LINE تُتخطى"""
+    check_regex(pattern)
+    engine = _regex_module()
+    try:
+        compiled = (engine or re).compile(pattern, re.IGNORECASE)
+    except (re.error, getattr(engine, 'error', re.error)) as e:
+        raise SearchError(str(e))
+    deadline = time.monotonic() + REGEX_TIME_BUDGET
+
+    def matcher(line):
+        if len(line) > REGEX_MAX_LINE:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise SearchError('انتهت مهلة البحث بالتعبير النمطي، استخدم تعبيراً أدق')
+        if engine is None:
+            return compiled.search(line)
+        try:
+            return compiled.search(line, timeout=remaining)
+        except TimeoutError:
+            raise SearchError('انتهت مهلة البحث بالتعبير النمطي، استخدم تعبيراً أدق')
+
+    return matcher
+
+
+def _required_literal(pattern):
+    """أطول جزء حرفي يجب أن يظهر في أي نص يطابق التعبير النمطي (لتصفية المرشحين عبر الفهرس)"""
+    if '|' in pattern:
+        return ''
+    simplified = re.sub(r'\[(?:\\.|[^\]])*\]|\\.', '\0', pattern)
+    segments = []
+    current = ''
+    depth = 0
+    i = 0
+    while i < len(simplified):
+        ch = simplified[i]
+        if ch in '()':
+            # محتوى المجموعات قد يكون اختيارياً، لذا نكتفي بالنص خارجها
+            depth += 1 if ch == '(' else -1
+            segments.append(current)
+            current = ''
+        elif depth:
+            pass
+        elif ch in '?*{':
+            # الحرف السابق اختياري
+            current = current[:-1]
+            segments.append(current)
+            current = ''
+            if ch == '{':
+                i = simplified.find('}', i) if '}' in simplified[i:] else len(simplified)
+        elif ch in '\0.^$+':
+            segments.append(current)
+            current = ''
+        else:
+            current += ch
+        i += 1
+    segments.append(current)
+    return max(segments, key=len)
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _snippets(code, matcher):
+    snippets = []
+    matches = 0
+    for line_number, line in enumerate(code.splitlines(), 1):
+        if not matcher(line):
+            continue
+        matches += 1
+        if len(snippets) < MAX_SNIPPETS:
+            snippets.append({'line': line_number, 'text': line.strip()[:SNIPPET_WIDTH]})
+    return matches, snippets
+
+
+def _candidates(conn, literal, asset_types):
+    """المرشحون مرتبون حسب bm25 (الاسم بوزن أعلى من الكود)"""
+    params = []
+    sql = (
+        'SELECT a.asset_type, a.name, t.code, {rank} '
+        'FROM asset_text t JOIN assets a ON a.id = t.rowid'
+    )
+    conditions = []
+    if len(literal) >= 3:
+        sql = sql.format(rank='bm25(asset_text, 10.0, 1.0)')
+        conditions.append('asset_text MATCH ?')
+        params.append(_fts_phrase(literal))
+    else:
+        sql = sql.format(rank='0.0')
+    if asset_types:
+        conditions.append('a.asset_type IN (%s)' % ','.join('?' * len(asset_types)))
+        params.extend(asset_types)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY 4'
+    return conn.execute(sql, params)
+
+
+def search(query, mode='text', asset_types=None, limit=20):
+    """البحث في كود الأصول: text (جزء من النص)، regex (تعبير نمطي)، symbol (أسماء الدوال والأصناف)"""
+    conn = _connect()
+    asset_types = sorted(asset_types) if asset_types else None
+
+    if mode == 'symbol':
+        return _search_symbols(conn, query, asset_types, limit)
+
+    if mode == 'regex':
+        matcher = _regex_matcher(query)
+        literal = _required_literal(query)
+    elif mode == 'text':
+        literal = query
+        needle = query.lower()
+        matcher = lambda line: needle in line.lower()
+    else:
+        raise SearchError(f'unknown search mode: {mode}')
+
+    results = []
+    for asset_type, name, code, rank in _candidates(conn, literal, asset_types):
+        matches, snippets = _snippets(code, matcher)
+        name_match = bool(matcher(name))
+        if not matches and not name_match:
+            continue
+        results.append({
+            'type': asset_type,
+            'name': name,
+            'score': round(-rank, 6) if rank else float(matches),
+            'matches': matches,
+            'snippets': snippets
+        })
+        if len(literal) >= 3 and len(results) >= limit:
+            break
+    if len(literal) < 3:
+        # بدون فهرس لا يوجد ترتيب bm25، فالترتيب حسب عدد المطابقات
+        results.sort(key=lambda r: r['matches'], reverse=True)
+    return results[:limit]
+
+
+def _search_symbols(conn, query, asset_types, limit):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    params = [f'%{escaped}%']
+    sql = (
+        'SELECT a.asset_type, a.name, s.symbol, s.line, t.code '
+        'FROM symbols s JOIN assets a ON a.id = s.asset_id JOIN asset_text t ON t.rowid = a.id '
+        "WHERE s.symbol LIKE ? ESCAPE '\\'"
+    )
+    if asset_types:
+        sql += ' AND a.asset_type IN (%s)' % ','.join('?' * len(asset_types))
+        params.extend(asset_types)
+
+    lowered = query.lower()
+    grouped = {}
+    for asset_type, name, symbol, line, code in conn.execute(sql, params):
+        # تطابق تام أولاً ثم بداية الاسم ثم أي جزء منه
+        symbol_lower = symbol.lower()
+        score = 3.0 if symbol_lower == lowered else 2.0 if symbol_lower.startswith(lowered) else 1.0
+        entry = grouped.setdefault((asset_type, name), {
+            'type': asset_type,
+            'name': name,
+            'score': 0.0,
+            'matches': 0,
+            'snippets': [],
+            '_lines': code.splitlines()
+        })
+        entry['score'] = max(entry['score'], score)
+        entry['matches'] += 1
+        if len(entry['snippets']) < MAX_SNIPPETS:
+            text = entry['_lines'][line - 1] if line <= len(entry['_lines']) else ''
+            entry['snippets'].append({'line': line, 'symbol': symbol, 'text': text.strip()[:SNIPPET_WIDTH]})
+
+    results = sorted(grouped.values(), key=lambda r: (r['score'], r['matches']), reverse=True)[:limit]
+    for result in results:
+        del result['_lines']
+    return results
@@ -0,0 +1,171 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import zlib
+
+from src.utils.runtime import runtime_path, temp_path
+
+# ذاكرة قراءة مشتركة بين جميع عمال gunicorn: ملفات على tmpfs (/dev/shm) يقرؤها كل العمال من نفس صفحات الذاكرة،
+# وتبقى بعد إعادة تدوير العامل (max_requests) فيبدأ العامل الجديد بذاكرة دافئة.
+# الإبطال عبر جدول أجيال (generation) في ملف mmap: كل مجموعة مفاتيح لها عداد يُزاد عند الكتابة.
+CACHE_FORMAT = 1
+# الإبطال يأتي من سجل تغييرات هذه العقدة فقط؛ مع S3 تكتب عقد أخرى في نفس الحاوية دون علمها،
+# فالذاكرة معطلة هناك وتعتمد القراءات على ذاكرة S3Storage المحلية المتحقق منها بـ ETag
+ENABLED = (os.getenv('SHARED_CACHE_ENABLED', 'true').lower() != 'false'
+           and os.getenv('STORAGE_BACKEND', 'local').lower() != 's3')
+MAX_BYTES = int(os.getenv('SHARED_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# حد أقصى لعمر العنصر كشبكة أمان للتعديلات التي لا تمر عبر الواجهة ولا يراها inotify
+TTL = float(os.getenv('SHARED_CACHE_TTL', '300'))
+GENERATION_SLOTS = 8192
+SWEEP_EVERY = 64
+
+_HEADER = struct.Struct('<QQdI')
+_SLOT = struct.Struct('<Q')
+
+
+def _default_dir():
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return os.path.join('/dev/shm', f'babylon-game-api-cache-v{CACHE_FORMAT}')
+    return os.path.dirname(runtime_path(f'cache-v{CACHE_FORMAT}', 'x'))
+
+
+CACHE_DIR = os.getenv('SHARED_CACHE_DIR') or _default_dir()
+GENERATIONS_PATH = os.path.join(CACHE_DIR, 'generations')
+WRITER_LOCK_PATH = os.path.join(CACHE_DIR, 'writer.lock')
+
+_generations = None
+_generations_pid = None
+_puts = 0
+
+
+def _table():
+    """جدول الأجيال المشترك (يُفتح مرة لكل عملية)"""
+    global _generations, _generations_pid
+    if _generations is not None and _generations_pid == os.getpid():
+        return _generations
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd = os.open(GENERATIONS_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        size = GENERATION_SLOTS * _SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        _generations = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+    finally:
+        os.close(fd)
+    _generations_pid = os.getpid()
+    return _generations
+
+
+def _slot(group):
+    # الخانة 0 محجوزة للجيل العام (إبطال كل شيء)
+    return 1 + zlib.crc32(group.encode('utf-8')) % (GENERATION_SLOTS - 1)
+
+
+def generation(group):
+    """(الجيل العام، جيل المجموعة) الحاليان؛ قراءة بدون أقفال"""
+    table = _table()
+    return _SLOT.unpack_from(table, 0)[0], _SLOT.unpack_from(table, _slot(group) * _SLOT.size)[0]
+
+
+def invalidate(*groups):
+    """زيادة جيل المجموعات المعطاة فتصبح كل عناصرها قديمة في جميع العمال"""
+    if not ENABLED:
+        return
+    try:
+        table = _table()
+        with open(WRITER_LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for group in groups:
+                offset = (0 if group == '*' else _slot(group)) * _SLOT.size
+                _SLOT.pack_into(table, offset, _SLOT.unpack_from(table, offset)[0] + 1)
+    except OSError as e:
+        print(f"WARNING: shared cache invalidation failed: {e}")
+
+
+def invalidate_event(event):
+    """مستمع لبث التغييرات: إبطال فهرس النوع والأصل المعني بالحدث"""
+    if event['asset_type'] == '*':
+        invalidate('*')
+    else:
+        invalidate(f"catalog:{event['asset_type']}", f"asset:{event['asset_type']}/{event['name']}")
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.bin')
+
+
+def get(key, group):
+    """قراءة عنصر صالح من الذاكرة المشتركة أو None"""
+    if not ENABLED:
+        return None
+    try:
+        with open(_entry_path(key), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    global_gen, group_gen, created, length = _HEADER.unpack_from(data)
+    if (global_gen, group_gen) != generation(group) or time.time() - created > TTL:
+        return None
+    payload = data[_HEADER.size:]
+    return payload if len(payload) == length else None
+
+
+def put(key, group, payload, generations):
+    """تخزين عنصر؛ generations هي قيمة generation(group) قبل حساب القيمة، حتى لا نخزن بيانات أُبطلت أثناء حسابها"""
+    global _puts
+    if not ENABLED or len(payload) > MAX_BYTES // 8:
+        return
+    try:
+        with open(WRITER_LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if generation(group) != generations:
+                return
+            path = _entry_path(key)
+            tmp_path = temp_path(path)
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(generations[0], generations[1], time.time(), len(payload)))
+                f.write(payload)
+            os.replace(tmp_path, path)
+            _puts += 1
+            if _puts % SWEEP_EVERY == 0:
+                _sweep()
+    except OSError as e:
+        print(f"WARNING: shared cache write failed: {e}")
+
+
+def _sweep():
+    """حذف أقدم العناصر عند تجاوز الحجم الأقصى (يُستدعى مع قفل الكاتب)"""
+    entries = []
+    total = 0
+    for entry in os.scandir(CACHE_DIR):
+        if not entry.name.endswith('.bin'):
+            continue
+        st = entry.stat()
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        total += st.st_size
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= MAX_BYTES * 0.9:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
+
+
+def cached(key, group, compute):
+    """إرجاع القيمة من الذاكرة المشتركة أو حسابها بـ compute() (bytes) وتخزينها"""
+    payload = get(key, group)
+    if payload is not None:
+        return payload
+    generations = generation(group) if ENABLED else None
+    payload = compute()
+    if payload is not None and generations is not None:
+        put(key, group, payload, generations)
+    return payload
@@ -0,0 +1,161 @@
+import os
+import json
+import gzip
+import hashlib
+import mimetypes
+
+from flask import Response, request, send_file
+
+# الملفات التي أخرجها Vite ببصمة المحتوى في اسمها (مثل assets/index-B1x9kQ2a.js) لا تتغير أبداً.
+# القائمة تُقرأ من ملف manifest الذي يكتبه البناء (build.manifest) بدلاً من تخمينها من شكل الاسم،
+# فملفات public مثل material-icons-v140.woff2 تبقى بالتخزين المؤقت الافتراضي
+BUILD_MANIFEST = os.path.join('.vite', 'manifest.json')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=3600'
+INDEX_CACHE = 'no-cache'
+
+MEMORY_MAX_FILE = int(os.getenv('STATIC_MEMORY_MAX_FILE', str(256 * 1024)))
+MEMORY_BUDGET = int(os.getenv('STATIC_MEMORY_BUDGET', str(32 * 1024 * 1024)))
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+MIN_COMPRESS_SIZE = 1024
+
+
+class StaticEntry:
+    """ملف ثابت واحد مع الرؤوس المحسوبة مسبقاً ومحتواه في الذاكرة إن كان صغيراً"""
+
+    __slots__ = ('path', 'size', 'mimetype', 'etag', 'cache_control', 'data', 'variants')
+
+    def __init__(self, path, size, mimetype, etag, cache_control):
+        self.path = path
+        self.size = size
+        self.mimetype = mimetype
+        self.etag = etag
+        self.cache_control = cache_control
+        self.data = None
+        # ترميز المحتوى -> (bytes في الذاكرة أو None، مسار الملف المضغوط مسبقاً أو None، etag خاص بالترميز)
+        self.variants = {}
+
+
+class StaticManifest:
+    """فهرس للمجلد الثابت يُبنى مرة واحدة عند بدء التشغيل (قبل fork، فيتشاركه جميع العمال)"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.entries = {}
+        self.memory_used = 0
+        self.fingerprinted = set()
+        self.build()
+
+    def _load_fingerprinted(self):
+        """مسارات الملفات ذات البصمة كما سجلها Vite؛ مجموعة فارغة إن لم يوجد manifest للبناء"""
+        try:
+            with open(os.path.join(self.static_folder, BUILD_MANIFEST), 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        paths = set()
+        for chunk in chunks.values() if isinstance(chunks, dict) else ():
+            if not isinstance(chunk, dict):
+                continue
+            if isinstance(chunk.get('file'), str):
+                paths.add(chunk['file'])
+            for key in ('css', 'assets'):
+                paths.update(path for path in chunk.get(key) or () if isinstance(path, str))
+        # نقطة الدخول HTML ليست ذات بصمة حتى لو ظهرت في القائمة
+        paths.discard('index.html')
+        return paths
+
+    def build(self):
+        entries = {}
+        self.memory_used = 0
+        if not self.static_folder or not os.path.isdir(self.static_folder):
+            self.entries = entries
+            return
+        self.fingerprinted = self._load_fingerprinted()
+        for root, dirs, files in os.walk(self.static_folder):
+            if root == self.static_folder and '.vite' in dirs:
+                # بيانات البناء الداخلية لا تُقدَّم للمتصفح
+                dirs.remove('.vite')
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(full_path, self.static_folder).replace(os.sep, '/')
+                base, ext = os.path.splitext(full_path)
+                if ext in ('.gz', '.br') and os.path.exists(base):
+                    # نسخة مضغوطة مسبقاً لملف آخر، تُربط به أدناه
+                    continue
+                entries[rel_path] = self._build_entry(rel_path, full_path)
+        self.entries = entries
+
+    def _build_entry(self, rel_path, full_path):
+        st = os.stat(full_path)
+        mimetype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        if rel_path == 'index.html':
+            cache_control = INDEX_CACHE
+        elif rel_path in self.fingerprinted:
+            cache_control = IMMUTABLE_CACHE
+        else:
+            cache_control = DEFAULT_CACHE
+
+        data = None
+        if st.st_size <= MEMORY_MAX_FILE and self.memory_used + st.st_size <= MEMORY_BUDGET:
+            with open(full_path, 'rb') as f:
+                data = f.read()
+            self.memory_used += len(data)
+            etag = hashlib.md5(data).hexdigest()
+        else:
+            etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+        entry = StaticEntry(full_path, st.st_size, mimetype, etag, cache_control)
+        entry.data = data
+
+        # لكل ترميز etag مختلف: النسخة المضغوطة ليست نفس البايتات، والوسطاء يخزنونها بشكل منفصل
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if os.path.exists(full_path + suffix):
+                variant_st = os.stat(full_path + suffix)
+                variant_etag = f"{etag}-{encoding}-{variant_st.st_mtime_ns:x}-{variant_st.st_size:x}"
+                entry.variants[encoding] = (None, full_path + suffix, variant_etag)
+
+        if ('gzip' not in entry.variants and data is not None and len(data) >= MIN_COMPRESS_SIZE
+                and mimetype.startswith(COMPRESSIBLE_TYPES)):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                entry.variants['gzip'] = (compressed, None, f'{etag}-gzip')
+                self.memory_used += len(compressed)
+        return entry
+
+    def serve(self, path):
+        """إرجاع استجابة للملف المطلوب أو index.html (توجيه SPA)، أو None إن لم يوجد أي منهما"""
+        entry = self.entries.get(path) if path else None
+        if entry is None:
+            entry = self.entries.get('index.html')
+            if entry is None:
+                return None
+
+        headers = {
+            'Cache-Control': entry.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            variant = entry.variants.get(encoding)
+            if variant is None or not accepted[encoding]:
+                continue
+            data, variant_path, variant_etag = variant
+            headers['ETag'] = f'"{variant_etag}"'
+            if request.if_none_match.contains(variant_etag):
+                return Response(status=304, headers=headers)
+            headers['Content-Encoding'] = encoding
+            if data is not None:
+                return Response(data, mimetype=entry.mimetype, headers=headers)
+            response = send_file(variant_path, mimetype=entry.mimetype, conditional=False, etag=False)
+            response.headers.update(headers)
+            return response
+
+        headers['ETag'] = f'"{entry.etag}"'
+        if request.if_none_match.contains(entry.etag):
+            return Response(status=304, headers=headers)
+        if entry.data is not None:
+            return Response(entry.data, mimetype=entry.mimetype, headers=headers)
+        response = send_file(entry.path, mimetype=entry.mimetype, conditional=True, etag=False)
+        response.headers.update(headers)
+        return response
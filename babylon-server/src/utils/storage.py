@@ -0,0 +1,427 @@
+import os
+import io
+import shutil
+import hashlib
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.runtime import runtime_path, temp_path
+
+# كل عمليات الأصول تمر عبر واجهة تخزين واحدة بمفاتيح منطقية بصيغة POSIX
+# (مثل maps/<name>/<name>.json أو external-import/meshes/HVGirl.glb)،
+# مع تنفيذ محلي على نظام الملفات وتنفيذ متوافق مع S3 لتشغيل عدة عقد.
+
+
+def normalize_key(key):
+    """توحيد المفتاح ورفض أي محاولة للخروج من جذر التخزين"""
+    parts = [part for part in key.replace('\\', '/').split('/') if part not in ('', '.')]
+    if '..' in parts:
+        raise ValueError(f'مسار غير صالح: {key}')
+    return '/'.join(parts)
+
+
+def join(*parts):
+    return normalize_key(posixpath.join(*parts))
+
+
+class LocalStorage:
+    """تخزين على نظام الملفات المحلي؛ roots يربط أول جزء من المفتاح بمجلد (المفتاح '' هو الافتراضي)"""
+
+    def __init__(self, roots):
+        self.roots = dict(roots)
+
+    def local_path(self, key):
+        key = normalize_key(key)
+        head, _, rest = key.partition('/')
+        if head in self.roots and head != '':
+            return os.path.join(self.roots[head], *rest.split('/')) if rest else self.roots[head]
+        return os.path.join(self.roots[''], *key.split('/')) if key else self.roots['']
+
+    def exists(self, key):
+        return os.path.isfile(self.local_path(key))
+
+    def is_dir(self, key):
+        return os.path.isdir(self.local_path(key))
+
+    def list_dir(self, key):
+        """(المجلدات، الملفات) المباشرة تحت المفتاح"""
+        path = self.local_path(key)
+        dirs, files = [], []
+        if not os.path.isdir(path):
+            return dirs, files
+        for entry in os.scandir(path):
+            (dirs if entry.is_dir() else files).append(entry.name)
+        return dirs, files
+
+    def walk_files(self, key):
+        """كل الملفات تحت المفتاح: (المسار النسبي، الحجم، وقت التعديل)"""
+        path = self.local_path(key)
+        for root, dirs, filenames in os.walk(path):
+            for filename in filenames:
+                full_path = os.path.join(root, filename)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                yield os.path.relpath(full_path, path).replace(os.sep, '/'), st.st_size, st.st_mtime
+
+    def stat(self, key):
+        st = os.stat(self.local_path(key))
+        return st.st_size, st.st_mtime
+
+    def read_bytes(self, key):
+        with open(self.local_path(key), 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, key, data):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # كتابة ذرية: القراء لا يرون ملفاً نصف مكتوب
+        tmp_path = temp_path(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def save_stream(self, key, stream):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = temp_path(path)
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, 1024 * 1024)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def make_dir(self, key):
+        os.makedirs(self.local_path(key), exist_ok=True)
+
+    def copy(self, src_key, dst_key):
+        dst = self.local_path(dst_key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp_path = temp_path(dst)
+        shutil.copy2(self.local_path(src_key), tmp_path)
+        os.replace(tmp_path, dst)
+
+    def copy_tree(self, src_key, dst_key):
+        """نسخ مجلد كامل مع استبدال الوجهة إن وجدت؛ يعيد عدد الملفات المنسوخة"""
+        dst = self.local_path(dst_key)
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        copied = []
+        shutil.copytree(self.local_path(src_key), dst,
+                        copy_function=lambda src, dst: copied.append(shutil.copy2(src, dst)))
+        return len(copied)
+
+    def delete(self, key):
+        os.remove(self.local_path(key))
+
+    def delete_tree(self, key):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+    def open_local(self, key):
+        """مسار محلي قابل للإرسال بـ send_file أو None إن لم يوجد الملف"""
+        path = self.local_path(key)
+        return path if os.path.isfile(path) else None
+
+
+class _CountingReader(io.RawIOBase):
+    """يحسب عدد البايتات المقروءة من تدفق الرفع"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+
+class S3Storage:
+    """تخزين متوافق مع S3 (AWS أو MinIO) مع رفع متعدد الأجزاء ونسخ من جهة الخادم وذاكرة قراءة محلية"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, cache_dir=None,
+                 multipart_threshold=8 * 1024 * 1024, max_connections=32, cache_max_bytes=512 * 1024 * 1024):
+        # اختياري: pip install boto3
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+        from boto3.s3.transfer import TransferConfig
+
+        self.ClientError = ClientError
+        self.bucket = bucket
+        self.prefix = normalize_key(prefix)
+        self._client_args = {
+            'endpoint_url': endpoint_url,
+            'region_name': region,
+            'config': Config(max_pool_connections=max_connections, retries={'max_attempts': 5, 'mode': 'standard'})
+        }
+        self._boto3 = boto3
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+            max_concurrency=8
+        )
+        self.cache_dir = cache_dir or os.path.dirname(runtime_path('s3-cache', 'x'))
+        self.cache_max_bytes = cache_max_bytes
+        self._cache_writes = 0
+        self._pid = None
+        self._client = None
+        self._pool = None
+
+    def _ensure_process(self):
+        # الاتصالات المجمّعة وخيوط النسخ لا تنجو من fork، لذا تُنشأ مرة لكل عامل
+        if self._pid != os.getpid():
+            self._client = self._boto3.session.Session().client('s3', **self._client_args)
+            self._pool = ThreadPoolExecutor(max_workers=8)
+            self._pid = os.getpid()
+
+    @property
+    def client(self):
+        self._ensure_process()
+        return self._client
+
+    def _key(self, key):
+        key = normalize_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _dir_prefix(self, key):
+        full = self._key(key)
+        return f"{full}/" if full else ''
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def local_path(self, key):
+        return None
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except self.ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def is_dir(self, key):
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self._dir_prefix(key), MaxKeys=1)
+        return response.get('KeyCount', 0) > 0
+
+    def list_dir(self, key):
+        prefix = self._dir_prefix(key)
+        dirs, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            for common in page.get('CommonPrefixes', []):
+                dirs.append(common['Prefix'][len(prefix):].rstrip('/'))
+            for obj in page.get('Contents', []):
+                files.append(obj['Key'][len(prefix):])
+        return dirs, files
+
+    def walk_files(self, key):
+        prefix = self._dir_prefix(key)
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(prefix):], obj['Size'], obj['LastModified'].timestamp()
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self.ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key)
+            raise
+        return response['ContentLength'], response['LastModified'].timestamp()
+
+    def _cache_base(self, key):
+        digest = hashlib.sha1(self._key(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def _data_path(self, base, etag):
+        # ملف البيانات يحمل بصمة ETag في اسمه فلا يتغير محتواه بعد كتابته
+        return f"{base}.{hashlib.sha1(etag.encode('utf-8')).hexdigest()[:16]}.data"
+
+    def _cached(self, key):
+        """(etag، مسار البيانات) للنسخة المحلية، أو (None، None) إذا لم توجد"""
+        base = self._cache_base(key)
+        try:
+            with open(base + '.etag') as f:
+                etag = f.read().strip()
+        except FileNotFoundError:
+            return None, None
+        data_path = self._data_path(base, etag)
+        if not etag or not os.path.exists(data_path):
+            return None, None
+        return etag, data_path
+
+    def _store_cache(self, key, body, etag):
+        """كتابة البيانات في ملف خاص بـ etag ثم استبدال ملف etag ذرياً: الاستبدال هو لحظة التبديل الوحيدة،
+        فلا يشير etag أبداً إلى بيانات نسخة أخرى (ولا يُرد 304 على محتوى قديم)"""
+        base = self._cache_base(key)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        data_path = self._data_path(base, etag)
+        tmp_path = temp_path(data_path)
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(body, f, 1024 * 1024)
+        os.replace(tmp_path, data_path)
+        etag_path = base + '.etag'
+        tmp_path = temp_path(etag_path)
+        with open(tmp_path, 'w') as f:
+            f.write(etag)
+        os.replace(tmp_path, etag_path)
+        # بيانات النسخة السابقة تبقى لمن يرسلها الآن، ويحذفها التنظيف لاحقاً (لا يشير إليها etag بعد الآن)
+        self._cache_writes += 1
+        if self._cache_writes % 64 == 0:
+            self._sweep_cache()
+        return data_path
+
+    def _drop_cache(self, key):
+        try:
+            os.remove(self._cache_base(key) + '.etag')
+        except OSError:
+            pass
+
+    def _sweep_cache(self):
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.data'):
+                    path = os.path.join(root, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        # حذفه تنظيف متزامن في عامل أو خيط آخر
+                        continue
+                    entries.append((st.st_atime, st.st_size, path))
+                    total += st.st_size
+        entries.sort()
+        for atime, size, path in entries:
+            if total <= self.cache_max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _fetch(self, key, etag=None, data_path=None):
+        """GET للكائن (شرطي إذا أُعطي etag) وتخزينه محلياً؛ None إذا لم يعد موجوداً"""
+        kwargs = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if etag:
+            kwargs['IfNoneMatch'] = etag
+        try:
+            response = self.client.get_object(**kwargs)
+        except self.ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if etag and code in ('304', 'NotModified'):
+                try:
+                    # تحديث وقت الوصول يضعه في آخر قائمة التنظيف (الأقدم وصولاً يُحذف أولاً)
+                    os.utime(data_path)
+                    return data_path
+                except FileNotFoundError:
+                    # حذفه التنظيف بعد قراءة etag: الـ 304 لا يعني أن الأصل مفقود، فيُجلب دون شرط
+                    return self._fetch(key)
+            if self._is_missing(e):
+                self._drop_cache(key)
+                return None
+            raise
+        return self._store_cache(key, response['Body'], response['ETag'])
+
+    def open_local(self, key):
+        """قراءة عبر الذاكرة المحلية: طلب GET شرطي (If-None-Match) يعيد 304 إذا لم يتغير الكائن"""
+        etag, data_path = self._cached(key)
+        return self._fetch(key, etag, data_path)
+
+    def read_bytes(self, key):
+        path = self.open_local(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # حذفه التنظيف بين الإرجاع والفتح؛ جلب جديد بدل الإبلاغ عن أصل مفقود
+            path = self._fetch(key)
+            if path is None:
+                raise
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, key, data):
+        response = self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+        self._store_cache(key, io.BytesIO(data), response['ETag'])
+
+    def save_stream(self, key, stream):
+        # upload_fileobj يقسم الملفات الكبيرة تلقائياً إلى رفع متعدد الأجزاء حسب multipart_threshold
+        reader = _CountingReader(stream)
+        self.client.upload_fileobj(reader, self.bucket, self._key(key), Config=self.transfer)
+        self._drop_cache(key)
+        return reader.count
+
+    def make_dir(self, key):
+        # لا توجد مجلدات حقيقية في S3؛ المجلد موجود ضمنياً عند وجود أي كائن تحته
+        pass
+
+    def copy(self, src_key, dst_key):
+        # نسخ من جهة الخادم (UploadPartCopy للكائنات الكبيرة) دون تمرير البيانات عبر هذه العقدة
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self._key(src_key)},
+            self.bucket,
+            self._key(dst_key),
+            Config=self.transfer
+        )
+        self._drop_cache(dst_key)
+
+    def copy_tree(self, src_key, dst_key):
+        self.delete_tree(dst_key)
+        self._ensure_process()
+        futures = [
+            self._pool.submit(self.copy, join(src_key, rel), join(dst_key, rel))
+            for rel, size, mtime in self.walk_files(src_key)
+        ]
+        for future in futures:
+            future.result()
+        return len(futures)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        self._drop_cache(key)
+
+    def delete_tree(self, key):
+        prefix = self._dir_prefix(key)
+        batch = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                batch.append({'Key': obj['Key']})
+                if len(batch) == 1000:
+                    self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch, 'Quiet': True})
+                    batch = []
+        if batch:
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch, 'Quiet': True})
+
+
+def create_storage(local_roots):
+    """إنشاء واجهة التخزين حسب STORAGE_BACKEND (local أو s3)"""
+    backend = os.getenv('STORAGE_BACKEND', 'local').lower()
+    if backend == 'local':
+        return LocalStorage(local_roots)
+    if backend == 's3':
+        return S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.getenv('S3_PREFIX', ''),
+            endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+            region=os.getenv('S3_REGION') or None,
+            cache_dir=os.getenv('S3_CACHE_DIR') or None,
+            multipart_threshold=int(os.getenv('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024))),
+            max_connections=int(os.getenv('S3_MAX_CONNECTIONS', '32')),
+            cache_max_bytes=int(os.getenv('S3_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+        )
+    raise ValueError(f'Unknown STORAGE_BACKEND: {backend}')
@@ -0,0 +1,197 @@
+import io
+import os
+import re
+import posixpath
+
+# نسخ مصغرة (LOD) ونسخ بأبعاد قوة 2 للخامات المستوردة، وتجميع وجوه skybox الستة في صورة واحدة.
+# النسخ تُكتب بجانب الأصل بأسماء ثابتة (wood.lod256.jpg، skybox2.strip.jpg) فتنتقل مع الأصول
+# عند التجميع والاستعادة، ويختارها العميل عبر ?variant= أو ?max_size= دون المساس بالأصل.
+ENABLED = os.getenv('TEXTURE_VARIANTS_ENABLED', 'true').lower() != 'false'
+LOD_SIZES = sorted(
+    (int(size) for size in os.getenv('TEXTURE_LOD_SIZES', '1024,512,256,128').split(',') if size.strip()),
+    reverse=True
+)
+MAX_POT_SIZE = int(os.getenv('TEXTURE_MAX_POT_SIZE', '4096'))
+JPEG_QUALITY = int(os.getenv('TEXTURE_JPEG_QUALITY', '85'))
+# حماية من الصور المضغوطة بأبعاد ضخمة (decompression bombs) ومن الصور التي تطيل المهمة الخلفية:
+# 4096x4096 تُعالج في ~1.5 ثانية و~180MB، بينما 8192x8192 تحتاج ~5 ثوانٍ و~600MB
+MAX_PIXELS = int(os.getenv('TEXTURE_MAX_PIXELS', str(16 * 1024 * 1024)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# ترتيب الامتدادات الافتراضي في BABYLON.CubeTexture، فتُقطَّع الشريحة مباشرة إلى CreateFromImages
+CUBE_FACES = ('px', 'py', 'pz', 'nx', 'ny', 'nz')
+# التقاطع الأفقي 4x3 (العمود، الصف) بالتخطيط الشائع: +Y فوق، -X +Z +X -Z في الوسط، -Y تحت
+CROSS_LAYOUT = {'py': (1, 0), 'nx': (0, 1), 'pz': (1, 1), 'px': (2, 1), 'nz': (3, 1), 'ny': (1, 2)}
+
+_VARIANT_PATTERN = re.compile(r'\.(lod\d+|pot|cross|strip)$')
+_FACE_PATTERN = re.compile(r'^(.*)_(px|nx|py|ny|pz|nz)$')
+
+
+class TextureError(ValueError):
+    """صورة غير صالحة أو غير قابلة للمعالجة"""
+
+
+def _pil():
+    # اختياري: pip install Pillow
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def available():
+    return _pil() is not None
+
+
+def is_variant(name):
+    return bool(_VARIANT_PATTERN.search(posixpath.splitext(name)[0]))
+
+
+def is_source_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not is_variant(name)
+
+
+def variant_name(name, variant):
+    """اسم ملف النسخة: textures/wood.jpg + lod256 -> textures/wood.lod256.jpg؛
+    cross/strip تُشتق من بادئة وجه skybox: textures/skybox2_px.jpg -> textures/skybox2.strip.jpg"""
+    stem, ext = posixpath.splitext(name)
+    if variant in ('cross', 'strip'):
+        match = _FACE_PATTERN.match(stem)
+        if not match:
+            return None
+        return f"{match.group(1)}.{variant}{ext}"
+    if variant == 'pot' or re.fullmatch(r'lod\d+', variant or ''):
+        return f"{stem}.{variant}{ext}"
+    return None
+
+
+def _nearest_power_of_two(value):
+    # نفس تقريب Babylon.js للخامات غير قوة 2 (الأقرب وليس الأعلى)
+    lower = 1 << (value.bit_length() - 1)
+    upper = lower << 1
+    return min(lower if value - lower <= upper - value else upper, MAX_POT_SIZE)
+
+
+def _is_power_of_two(value):
+    return value > 0 and value & (value - 1) == 0
+
+
+def _open(data):
+    Image = _pil()
+    if Image is None:
+        raise TextureError('Pillow غير مثبت')
+    try:
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        if width * height > MAX_PIXELS:
+            raise TextureError(f'أبعاد الصورة كبيرة جداً ({width}x{height})')
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise TextureError(f'صورة غير صالحة: {e}')
+    return image
+
+
+def _encode(image, ext):
+    out = io.BytesIO()
+    if ext in ('.jpg', '.jpeg'):
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+
+def _resize(image, width, height):
+    Image = _pil()
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def make_variants(data, name):
+    """(إحصاءات الصورة، [(النسخة، اسم الملف، البايتات)]) لكل LOD أصغر من الأصل ولنسخة قوة 2"""
+    ext = posixpath.splitext(name.lower())[1]
+    image = _open(data)
+    width, height = image.size
+    report = {'width': width, 'height': height, 'size': len(data), 'variants': {}}
+    variants = []
+
+    longest = max(width, height)
+    for size in LOD_SIZES:
+        if size >= longest:
+            continue
+        scale = size / longest
+        resized = _resize(image, max(1, round(width * scale)), max(1, round(height * scale)))
+        variants.append((f'lod{size}', resized))
+
+    if not (_is_power_of_two(width) and _is_power_of_two(height)):
+        variants.append(('pot', _resize(image, _nearest_power_of_two(width), _nearest_power_of_two(height))))
+
+    out = []
+    for variant, resized in variants:
+        encoded = _encode(resized, ext)
+        out.append((variant, variant_name(name, variant), encoded))
+        report['variants'][variant] = {'width': resized.width, 'height': resized.height, 'size': len(encoded)}
+    return report, out
+
+
+def find_cubemaps(names):
+    """مجموعات وجوه skybox المكتملة: [{الوجه: الاسم}] (مثل textures/skybox2_px.jpg ...)"""
+    groups = {}
+    for name in names:
+        stem, ext = posixpath.splitext(name)
+        match = _FACE_PATTERN.match(stem)
+        if match and ext.lower() in IMAGE_EXTENSIONS:
+            groups.setdefault((match.group(1), ext), {})[match.group(2)] = name
+    return [faces for faces in groups.values() if len(faces) == len(CUBE_FACES)]
+
+
+def pack_cubemap(faces, ext):
+    """تجميع ستة وجوه مربعة متساوية في شريحة أفقية 6x1 (بترتيب CUBE_FACES) وتقاطع 4x3"""
+    Image = _pil()
+    images = {face: _open(data) for face, data in faces.items()}
+    sizes = {image.size for image in images.values()}
+    if len(sizes) != 1:
+        raise TextureError('وجوه skybox بأبعاد مختلفة')
+    size, height = sizes.pop()
+    if size != height:
+        raise TextureError('وجوه skybox يجب أن تكون مربعة')
+    mode = 'RGB' if ext in ('.jpg', '.jpeg') else 'RGBA'
+
+    strip = Image.new(mode, (size * 6, size))
+    for index, face in enumerate(CUBE_FACES):
+        strip.paste(images[face].convert(mode), (index * size, 0))
+
+    cross = Image.new(mode, (size * 4, size * 3))
+    for face, (column, row) in CROSS_LAYOUT.items():
+        cross.paste(images[face].convert(mode), (column * size, row * size))
+
+    return {
+        'strip': (_encode(strip, ext), {'faceSize': size, 'order': list(CUBE_FACES)}),
+        'cross': (_encode(cross, ext), {'faceSize': size, 'layout': {face: list(cell) for face, cell in CROSS_LAYOUT.items()}})
+    }
+
+
+def pick_lod(name, max_size, exists, image_size=None):
+    """أكبر نسخة LOD لا تتجاوز max_size، أو None إذا كان الأصل نفسه مناسباً
+    exists(name) يفحص وجود ملف النسخة؛ image_size أبعاد الأصل إن كانت معروفة"""
+    if image_size is not None and max(image_size) <= max_size:
+        return None
+    for size in LOD_SIZES:
+        if size <= max_size:
+            candidate = variant_name(name, f'lod{size}')
+            if exists(candidate):
+                return f'lod{size}', candidate
+    return None
+
+
+def image_size(path):
+    """أبعاد صورة على القرص من ترويستها فقط (None إذا لم يكن Pillow متاحاً)"""
+    Image = _pil()
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, SyntaxError):
+        return None
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# الاختبارات لا تلمس مجلد التشغيل الافتراضي ولا قاعدة البيانات المتتبعة في src/database
+_workdir = tempfile.mkdtemp(prefix='babylon-tests-')
+os.environ.setdefault('BABYLON_RUNTIME_DIR', os.path.join(_workdir, 'runtime'))
+os.environ.setdefault('SHARED_CACHE_DIR', os.path.join(_workdir, 'shm'))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_workdir, 'app.db')}")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import os
+import threading
+
+import pytest
+
+from src.utils import asset_locks
+
+
+@pytest.fixture
+def lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(asset_locks, 'LOCK_DIR', str(tmp_path))
+    return tmp_path
+
+
+class Holder:
+    """يمسك الأقفال في خيط آخر (flock يتعارض بين خيوط العملية نفسها لأن لكل منها ملفاً مفتوحاً)"""
+
+    def __init__(self, **keys):
+        self.acquired = threading.Event()
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(keys,), daemon=True)
+
+    def _run(self, keys):
+        with asset_locks.locked(**keys):
+            self.acquired.set()
+            self.release.wait(10)
+
+    def __enter__(self):
+        self.thread.start()
+        assert self.acquired.wait(5)
+        return self
+
+    def __exit__(self, *exc):
+        self.release.set()
+        self.thread.join(5)
+
+
+def test_lock_files_are_bounded_by_stripes(lock_dir, monkeypatch):
+    monkeypatch.setattr(asset_locks, 'STRIPES', 8)
+    for index in range(200):
+        with asset_locks.locked(writes=[asset_locks.asset_key('map', f'm{index}')]):
+            pass
+    assert len(os.listdir(lock_dir)) <= 8
+
+
+def test_keys_sharing_a_stripe_do_not_block_themselves(lock_dir, monkeypatch):
+    monkeypatch.setattr(asset_locks, 'STRIPES', 1)
+    with asset_locks.locked(writes=['scene/a', asset_locks.EXTERNAL], reads=['flow/b'], timeout=0.2):
+        pass
+
+
+def test_write_excludes_and_times_out(lock_dir):
+    key = asset_locks.asset_key('map', 'busy')
+    with Holder(writes=[key]):
+        with pytest.raises(asset_locks.LockTimeout):
+            with asset_locks.locked(writes=[key], timeout=0.1):
+                pass
+        with pytest.raises(asset_locks.LockTimeout):
+            with asset_locks.locked(reads=[key], timeout=0.1):
+                pass
+    with asset_locks.locked(writes=[key], timeout=0.1):
+        pass
+
+
+def test_reads_share(lock_dir):
+    key = asset_locks.asset_key('scene', 'shared')
+    with Holder(reads=[key]):
+        with asset_locks.locked(reads=[key], timeout=0.1):
+            pass
+
+
+def test_opposite_key_order_does_not_deadlock(lock_dir, monkeypatch):
+    monkeypatch.setattr(asset_locks, 'STRIPES', 4)
+    keys = [asset_locks.asset_key('scene', f's{index}') for index in range(6)]
+    errors = []
+
+    def worker(order):
+        try:
+            for _ in range(100):
+                with asset_locks.locked(writes=order[:3], reads=order[3:], timeout=5):
+                    pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(order,)) for order in (keys, keys[::-1], keys[2:] + keys[:2])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert not any(thread.is_alive() for thread in threads)
+    assert errors == []
+
+
+def test_busy_asset_answers_503(monkeypatch):
+    from src.main import app
+
+    monkeypatch.setattr(asset_locks, 'LOCK_TIMEOUT', 0.1)
+    client = app.test_client()
+    with Holder(writes=[asset_locks.asset_key('map', 'locked-map')]):
+        with client.post('/api/assets/save', json={'type': 'map', 'name': 'locked-map', 'code': '// x'}) as response:
+            assert response.status_code == 503
+            assert 'error' in response.get_json()
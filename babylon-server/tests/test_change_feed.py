@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from src.utils import change_feed
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, 'JOURNAL_PATH', str(tmp_path / 'changes.log'))
+    monkeypatch.setattr(change_feed, 'JOURNAL_LOCK_PATH', str(tmp_path / 'changes.lock'))
+    monkeypatch.setattr(change_feed, '_journal_inode', None)
+    monkeypatch.setattr(change_feed, '_journal_offset', 0)
+    monkeypatch.setattr(change_feed, '_last_id', 0)
+    return tmp_path
+
+
+def _streamed(since):
+    events = []
+    for chunk in change_feed.stream(since=since, duration=0.2):
+        if chunk.startswith('id:'):
+            events.append(json.loads(chunk.split('data: ', 1)[1]))
+    return events
+
+
+def test_every_event_gets_a_journal_id(journal):
+    first = change_feed.publish('updated', 'map', 'm')
+    second = change_feed.publish('updated', 'map', 'm')
+    assert second['id'] == first['id'] + 1
+    events, newest, complete = change_feed.read_since(first['id'])
+    assert [event['id'] for event in events] == [second['id']] and complete
+
+
+def test_stream_coalesces_pending_duplicates_but_not_later_saves(journal):
+    change_feed.publish('updated', 'map', 'm', source='api')
+    change_feed.publish('updated', 'map', 'm', source='watcher')
+    change_feed.publish('updated', 'scene', 's')
+    events = _streamed(0)
+    assert [(event['asset_type'], event['id']) for event in events] == [('map', 2), ('scene', 3)]
+
+    # عميل استهلك الحفظ الأول يرى الحفظ الثاني مهما قصرت المدة بينهما
+    change_feed.publish('updated', 'map', 'm')
+    assert [event['id'] for event in _streamed(3)] == [4]
+
+
+@pytest.mark.parametrize('asset_type, path', [
+    ('external', 'external-import/model.glb.12.3456.tmp'),
+    ('map', 'maps/level/level.json.12.3456.tmp'),
+])
+def test_watcher_ignores_atomic_write_temp_files(asset_type, path):
+    watcher = change_feed.AssetWatcher({'external': 'external-import', 'map': 'maps'})
+    assert watcher._classify(asset_type, path, change_feed.IN_CREATE) is None
+    assert watcher._classify(asset_type, path, change_feed.IN_MOVED_FROM) is None
+    final = path[:path.index('.12.')]
+    assert watcher._classify(asset_type, final, change_feed.IN_MOVED_TO) is not None
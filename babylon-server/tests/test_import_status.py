@@ -0,0 +1,60 @@
+import os
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.routes import assets
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from src.main import app
+
+    monkeypatch.setattr(assets, 'IMPORT_JOB_PATH', str(tmp_path / 'external.json'))
+    monkeypatch.setattr(assets, 'IMPORT_HEARTBEAT_PATH', str(tmp_path / 'external.heartbeat'))
+    return app.test_client()
+
+
+def _status(client, job):
+    assets._save_import_job(job)
+    with client.get('/api/assets/import-status') as response:
+        assert response.status_code == 200
+        return response.get_json()
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_running_job_stays_processing(client):
+    assets._touch_import_heartbeat()
+    job = {'id': 'a', 'status': 'processing', 'started': time.time(), 'pid': os.getpid(), 'files': {}}
+    assert _status(client, job)['status'] == 'processing'
+
+
+def test_job_of_a_dead_worker_is_failed(client):
+    assets._touch_import_heartbeat()
+    job = {'id': 'b', 'status': 'processing', 'started': time.time(), 'pid': _dead_pid(), 'files': {}}
+    result = _status(client, job)
+    assert result['status'] == 'failed' and result['error']
+
+
+def test_job_with_stale_heartbeat_is_failed(client, monkeypatch):
+    monkeypatch.setattr(assets, 'IMPORT_HEARTBEAT_SECONDS', 0.01)
+    started = time.time() - 1
+    assets._touch_import_heartbeat()
+    os.utime(assets.IMPORT_HEARTBEAT_PATH, (started, started))
+    job = {'id': 'c', 'status': 'processing', 'started': started, 'pid': os.getpid(), 'files': {}}
+    assert _status(client, job)['status'] == 'failed'
+
+
+def test_finished_job_is_reported_as_is(client):
+    job = {'id': 'd', 'status': 'done', 'started': 0, 'pid': _dead_pid(), 'files': {}}
+    assert _status(client, job)['status'] == 'done'
+    with open(assets.IMPORT_JOB_PATH) as f:
+        assert json.load(f)['status'] == 'done'
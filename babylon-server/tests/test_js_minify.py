@@ -0,0 +1,77 @@
+import pytest
+
+from src.utils import js_minify
+from src.utils.js_minify import minify
+
+
+@pytest.mark.parametrize('source, expected', [
+    # السطر الجديد يبقى حيث قد ينهي الإدراج التلقائي للفواصل الجملة
+    ('let a = b\n(c)', 'let a=b\n(c)'),
+    ('return\nvalue', 'return\nvalue'),
+    ('x\n++y', 'x\n++y'),
+    ('a = [\n  1]', 'a=[1]'),
+    ('call(a,\n  b)', 'call(a,b)'),
+])
+def test_asi_newlines(source, expected):
+    assert minify(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('s = `a  b ${ x  +  y } c`', 's=`a  b ${ x  +  y } c`'),
+    ('s = `outer ${ `inner  ${ z }` }  end`', 's=`outer ${ `inner  ${ z }` }  end`'),
+    ("s = 'a  // b' + \"c  /* d */\"", "s='a  // b'+\"c  /* d */\""),
+])
+def test_strings_and_templates_copied_verbatim(source, expected):
+    assert minify(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('x = /a  b/g.test(s)', 'x=/a  b/g.test(s)'),
+    ('if (x) /a  b/.test(s)', 'if(x)/a  b/.test(s)'),
+    ('while (i--) /x  y/.exec(s)', 'while(i--)/x  y/.exec(s)'),
+    ('return /a [/] b/', 'return/a [/] b/'),
+])
+def test_regex_literals_keep_whitespace(source, expected):
+    assert minify(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('y = (a + b) / 2 / c', 'y=(a+b)/2/c'),
+    ('f(x)  /  g(y)', 'f(x)/g(y)'),
+    ('for (i = (a) / 2 / b; i; i--) {}', 'for(i=(a)/2/b;i;i--){}'),
+    ('n = total / count', 'n=total/count'),
+    ('m = a[0] / b / c', 'm=a[0]/b/c'),
+    ('s = `${ total / count }  x`', 's=`${ total / count }  x`'),
+])
+def test_division(source, expected):
+    assert minify(source) == expected
+
+
+@pytest.mark.parametrize('source', [
+    'function f() {}\n/a  b/.test(s)',
+    'x = y) / a  b /',
+    # } أو ` داخل تعبير نمطي في ${...} كان ينهي التعبير في غير موضعه
+    "s = `${s.replace(/}/g, '')}  x`;  y = 1",
+    's = `${ x ? /`/ : y }`',
+    's = `${typeof /x/}`',
+])
+def test_ambiguous_slash_returns_source(source):
+    assert minify(source) == source
+
+
+def test_delivered_code_fails_closed_without_node(monkeypatch):
+    source = 'let   a = 1;   // comment\n'
+    monkeypatch.setattr(js_minify, 'NODE_BINARY', None)
+    assert js_minify.delivered_code(source) == source
+
+
+def test_delivered_code_fails_closed_when_node_cannot_run(monkeypatch):
+    source = 'let   b = 2;   // comment\n'
+    monkeypatch.setattr(js_minify, 'NODE_BINARY', '/nonexistent/node')
+    assert js_minify.delivered_code(source) == source
+
+
+@pytest.mark.skipif(not js_minify.NODE_BINARY, reason='node is not installed')
+def test_delivered_code_minifies_when_verified():
+    source = 'if (ready) /a  b/.test(name)\nlet   c = (x + y) / 2;   // comment\n'
+    assert js_minify.delivered_code(source) == 'if(ready)/a  b/.test(name)\nlet c=(x+y)/2;'
@@ -0,0 +1,24 @@
+TOKEN = 'test-profiling-token'
+
+
+def test_profiling_endpoints_refuse_without_token(monkeypatch):
+    from src.main import app
+    from src.utils import profiling
+
+    monkeypatch.setattr(profiling, 'ENABLED', True)
+    monkeypatch.setattr(profiling, 'TOKEN', '')
+    client = app.test_client()
+    # لا استثناء للجهاز نفسه: خلف وكيل عكسي كل الطلبات تأتي من 127.0.0.1
+    response = client.get('/api/profiling/status', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 403
+    response.close()
+    with app.test_request_context('/', headers={'X-Profile': '1'}, environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+        assert not profiling.authorized()
+
+    monkeypatch.setattr(profiling, 'TOKEN', TOKEN)
+    response = client.get('/api/profiling/status', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 401
+    response.close()
+    response = client.get('/api/profiling/status', headers={'X-Profile-Token': TOKEN})
+    assert response.status_code == 200
+    response.close()
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import urllib.error
+import urllib.request
+
+import pytest
+
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = 'test-replication-token'
+
+SERVER_SCRIPT = '''
+import sys
+sys.path.insert(0, sys.argv[2])
+from werkzeug.serving import make_server
+from src.main import app
+make_server('127.0.0.1', int(sys.argv[1]), app, threaded=True).serve_forever()
+'''
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Node:
+    def __init__(self, tmp_path, name, port, peer_port):
+        self.url = f'http://127.0.0.1:{port}'
+        self.assets = tmp_path / name / 'assets'
+        env = dict(
+            os.environ,
+            ASSETS_DIR=str(self.assets),
+            BABYLON_RUNTIME_DIR=str(tmp_path / name / 'runtime'),
+            SHARED_CACHE_DIR=str(tmp_path / name / 'shm'),
+            DATABASE_URL=f"sqlite:///{tmp_path / name / 'app.db'}",
+            REPLICATION_TOKEN=TOKEN,
+            REPLICATION_PEERS=f'http://127.0.0.1:{peer_port}',
+            REPLICATION_MIRROR_DELETES='false'
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT, str(port), SERVER_ROOT],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method, headers={
+            'Content-Type': 'application/json',
+            'X-Replication-Token': TOKEN
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b'null')
+
+    def wait_ready(self):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('node exited during startup')
+            try:
+                if self.request('GET', '/api/replication/status')[0] == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('node did not start')
+
+    def save_map(self, name, code=None):
+        status, _ = self.request('POST', '/api/assets/save', {'type': 'map', 'name': name, 'code': code or f'// {name}'})
+        assert status == 200
+
+    def map_code(self, name):
+        return json.loads((self.assets / 'maps' / name / f'{name}.json').read_text())['code']
+
+    def pull(self):
+        status, body = self.request('POST', '/api/replication/pull', {'wait': True})
+        assert status == 200, body
+        return body['results'][0]
+
+    def has_map(self, name):
+        return (self.assets / 'maps' / name).is_dir()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    port_a, port_b = _free_port(), _free_port()
+    node_a = Node(tmp_path, 'a', port_a, port_b)
+    node_b = Node(tmp_path, 'b', port_b, port_a)
+    try:
+        node_a.wait_ready()
+        node_b.wait_ready()
+        yield node_a, node_b
+    finally:
+        node_a.stop()
+        node_b.stop()
+
+
+def test_pull_keeps_local_assets_and_applies_peer_deletes(nodes):
+    node_a, node_b = nodes
+    node_a.save_map('shared')
+    node_b.save_map('local-only')
+
+    # السحب الأول كامل: يجلب الناقص ولا يحذف ما أُنشئ على هذه العقدة فقط
+    result = node_b.pull()
+    assert result['full'] and result['deleted'] == 0
+    assert node_b.has_map('shared') and node_b.has_map('local-only')
+
+    # حذف صريح على A يصل إلى B كحدث في السجل، ومعه أصل جديد
+    assert node_a.request('DELETE', '/api/assets/delete/map/shared')[0] == 200
+    node_a.save_map('fresh')
+    result = node_b.pull()
+    assert not result['full']
+    assert result['deleted'] >= 1 and result['fetched'] >= 1
+    assert not node_b.has_map('shared')
+    assert node_b.has_map('fresh') and node_b.has_map('local-only')
+
+    # الاتجاه المعاكس: A يجلب أصل B المحلي ولا يستعيد المحذوف
+    result = node_a.pull()
+    assert result['deleted'] == 0
+    assert node_a.has_map('local-only') and node_a.has_map('fresh')
+    assert not node_a.has_map('shared')
+
+    # لا شيء جديد: سحب تزايدي لا يجلب ولا يحذف
+    result = node_b.pull()
+    assert result['fetched'] == 0 and result['deleted'] == 0
+
+
+def test_rapid_resave_reaches_the_peer(nodes):
+    node_a, node_b = nodes
+    node_a.save_map('quick', '// v1')
+    node_b.pull()
+    assert node_b.map_code('quick') == '// v1'
+
+    # حفظان متتاليان خلال أقل من ثانية: كل منهما حدث في السجل فيظهر في البيان التزايدي
+    node_a.save_map('quick', '// v2')
+    node_b.pull()
+    node_a.save_map('quick', '// v3')
+    result = node_b.pull()
+    assert not result['full']
+    assert node_b.map_code('quick') == '// v3'
+
+
+def test_background_pull_failure_is_reported(monkeypatch):
+    from src.main import app
+    from src.utils import replication
+
+    def broken_pull(*args):
+        raise OSError('disk unavailable')
+
+    monkeypatch.setattr(replication, 'TOKEN', TOKEN)
+    monkeypatch.setattr(replication, 'PEERS', ['http://127.0.0.1:9'])
+    monkeypatch.setattr(replication, 'pull', broken_pull)
+    client = app.test_client()
+    headers = {'X-Replication-Token': TOKEN}
+    with client.post('/api/replication/pull', json={}, headers=headers) as response:
+        assert response.status_code == 202
+
+    deadline = time.monotonic() + 10
+    while True:
+        with client.get('/api/replication/status', headers=headers) as response:
+            last_pull = response.get_json()['lastPull']
+        if last_pull and not last_pull['running']:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert last_pull['success'] is False
+    assert last_pull['results'] == [{'peer': 'http://127.0.0.1:9', 'error': 'disk unavailable'}]
+
+
+def test_replication_endpoints_refuse_without_token(monkeypatch):
+    from src.main import app
+    from src.utils import replication
+
+    monkeypatch.setattr(replication, 'TOKEN', '')
+    client = app.test_client()
+    for path in ('/api/replication/status', '/api/replication/manifest'):
+        response = client.get(path)
+        assert response.status_code == 403
+        response.close()
+
+    monkeypatch.setattr(replication, 'TOKEN', TOKEN)
+    response = client.get('/api/replication/status')
+    assert response.status_code == 401
+    response.close()
+    response = client.get('/api/replication/status', headers={'X-Replication-Token': TOKEN})
+    assert response.status_code == 200
+    response.close()
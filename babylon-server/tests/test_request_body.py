@@ -0,0 +1,55 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from src.utils import request_body
+
+BODY = json.dumps({'type': 'map', 'name': 'm', 'code': 'let x = 1;\n' * 2000}).encode()
+
+
+def _request(data, encoding):
+    headers = {'Content-Encoding': encoding} if encoding else {}
+    return Request(EnvironBuilder(method='POST', data=data, content_type='application/json', headers=headers).get_environ())
+
+
+def _deflate(data):
+    return zlib.compress(data)
+
+
+def _zstd(data):
+    zstandard = pytest.importorskip('zstandard')
+    return zstandard.ZstdCompressor().compress(data)
+
+
+ENCODINGS = [('gzip', gzip.compress), ('deflate', _deflate), ('zstd', _zstd)]
+
+
+@pytest.mark.parametrize('encoding, compress', ENCODINGS)
+def test_compressed_body_is_decoded(encoding, compress):
+    assert request_body.parse_body(_request(compress(BODY), encoding))['name'] == 'm'
+
+
+@pytest.mark.parametrize('encoding, compress', ENCODINGS)
+@pytest.mark.parametrize('keep', [0.5, 0.9])
+def test_truncated_body_is_rejected(encoding, compress, keep):
+    data = compress(BODY)
+    with pytest.raises(request_body.BodyError) as error:
+        request_body.read_body(_request(data[:int(len(data) * keep)], encoding))
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize('encoding, compress', ENCODINGS)
+def test_decompression_bomb_is_rejected(encoding, compress):
+    with pytest.raises(request_body.BodyError) as error:
+        request_body.read_body(_request(compress(b'\0' * (4 * 1024 * 1024)), encoding), limit=1024 * 1024)
+    assert error.value.status == 413
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(request_body.BodyError) as error:
+        request_body.read_body(_request(BODY, 'br'))
+    assert error.value.status == 415
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from src.utils import change_feed
+from src.utils import search_index
+from src.utils.storage import LocalStorage
+
+ASSET_DIRS = {'map': 'maps'}
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, 'INDEX_PATH', str(tmp_path / 'index.db'))
+    monkeypatch.setattr(change_feed, 'JOURNAL_PATH', str(tmp_path / 'changes.log'))
+    monkeypatch.setattr(change_feed, 'JOURNAL_LOCK_PATH', str(tmp_path / 'changes.lock'))
+    monkeypatch.setattr(change_feed, '_journal_inode', None)
+    monkeypatch.setattr(change_feed, '_journal_offset', 0)
+    monkeypatch.setattr(change_feed, '_last_id', 0)
+    monkeypatch.setattr(search_index, '_journal_seen', False)
+    monkeypatch.setattr(search_index._local, 'conn', None, raising=False)
+    return LocalStorage({'': str(tmp_path / 'assets')})
+
+
+def _save(storage, name, code):
+    storage.write_bytes(f'maps/{name}/{name}.json', json.dumps({'code': code}).encode())
+
+
+def _names(results):
+    return sorted(result['name'] for result in results)
+
+
+def test_reconcile_follows_the_change_feed(storage, monkeypatch):
+    _save(storage, 'first', 'function spawnEnemy() {}')
+    search_index.reconcile(storage, ASSET_DIRS)
+    assert _names(search_index.search('spawnEnemy')) == ['first']
+
+    # بعد المطابقة الأولى لا يُمسح التخزين: أحداث السجل فقط تحدد ما يُعاد فهرسته
+    def no_walk(prefix):
+        raise AssertionError('full storage walk')
+    monkeypatch.setattr(storage, 'walk_files', no_walk)
+
+    _save(storage, 'second', 'function spawnBoss() {}')
+    search_index.reconcile(storage, ASSET_DIRS)
+    assert search_index.search('spawnBoss') == []
+
+    change_feed.publish('created', 'map', 'second', source='watcher')
+    search_index.reconcile(storage, ASSET_DIRS)
+    assert _names(search_index.search('spawn')) == ['first', 'second']
+
+    storage.delete_tree('maps/first')
+    change_feed.publish('deleted', 'map', 'first', source='watcher')
+    search_index.reconcile(storage, ASSET_DIRS)
+    assert _names(search_index.search('spawn')) == ['second']
+
+
+def test_resync_event_rescans_storage(storage):
+    search_index.reconcile(storage, ASSET_DIRS)
+    _save(storage, 'late', 'const spawnLate = 1')
+    change_feed.publish('resync', '*', '', source='watcher')
+    search_index.reconcile(storage, ASSET_DIRS)
+    assert _names(search_index.search('spawnLate')) == ['late']
+
+
+@pytest.mark.parametrize('pattern', [
+    '(a+)+$',
+    '(a|ab)*c',
+    r'(\w+\s*)+$',
+    '(a?)*',
+    r'(x)\1',
+    'a' * (search_index.REGEX_MAX_LENGTH + 1),
+])
+def test_dangerous_regex_rejected(storage, pattern):
+    with pytest.raises(search_index.SearchError):
+        search_index.search(pattern, mode='regex')
+
+
+def test_regex_search_has_a_time_budget(storage, monkeypatch):
+    _save(storage, 'slow', 'function spawnEnemy() {}')
+    search_index.reconcile(storage, ASSET_DIRS)
+    assert _names(search_index.search(r'function\s+spawn', mode='regex')) == ['slow']
+
+    monkeypatch.setattr(search_index, 'REGEX_TIME_BUDGET', 0)
+    with pytest.raises(search_index.SearchError):
+        search_index.search(r'function\s+spawn', mode='regex')
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from flask import Flask
+
+from src.utils import static_manifest
+from src.utils.static_manifest import StaticManifest
+
+app = Flask(__name__)
+
+
+@pytest.fixture
+def static_folder(tmp_path):
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'fonts').mkdir()
+    (tmp_path / '.vite').mkdir()
+    (tmp_path / 'index.html').write_text('<html></html>')
+    (tmp_path / 'assets' / 'index-B1x9kQ2a.js').write_text('console.log(1);' * 200)
+    (tmp_path / 'assets' / 'player-walking1.png').write_bytes(b'png')
+    (tmp_path / 'fonts' / 'material-icons-v140.woff2').write_bytes(b'font')
+    (tmp_path / 'widget2024.js').write_text('let widget = 1;')
+    (tmp_path / '.vite' / 'manifest.json').write_text(json.dumps({
+        'index.html': {'file': 'assets/index-B1x9kQ2a.js', 'isEntry': True, 'src': 'index.html'}
+    }))
+    return str(tmp_path)
+
+
+def _serve(manifest, path, headers=None):
+    with app.test_request_context(f'/{path}', headers=headers or {}):
+        return manifest.serve(path)
+
+
+def test_only_build_manifest_files_are_immutable(static_folder):
+    manifest = StaticManifest(static_folder)
+    assert manifest.entries['assets/index-B1x9kQ2a.js'].cache_control == static_manifest.IMMUTABLE_CACHE
+    for path in ('assets/player-walking1.png', 'fonts/material-icons-v140.woff2', 'widget2024.js'):
+        assert manifest.entries[path].cache_control == static_manifest.DEFAULT_CACHE
+    assert manifest.entries['index.html'].cache_control == static_manifest.INDEX_CACHE
+    assert '.vite/manifest.json' not in manifest.entries
+
+
+def test_without_build_manifest_nothing_is_immutable(static_folder, tmp_path):
+    (tmp_path / '.vite' / 'manifest.json').unlink()
+    manifest = StaticManifest(static_folder)
+    assert manifest.entries['assets/index-B1x9kQ2a.js'].cache_control == static_manifest.DEFAULT_CACHE
+
+
+def test_each_encoding_has_its_own_etag(static_folder):
+    manifest = StaticManifest(static_folder)
+    path = 'assets/index-B1x9kQ2a.js'
+
+    identity = _serve(manifest, path)
+    gzipped = _serve(manifest, path, {'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['ETag'] != gzipped.headers['ETag']
+
+    # etag الهوية لا يُرد عليه 304 حين ستُرسل النسخة المضغوطة، والعكس
+    response = _serve(manifest, path, {'Accept-Encoding': 'gzip', 'If-None-Match': identity.headers['ETag']})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    response = _serve(manifest, path, {'If-None-Match': gzipped.headers['ETag']})
+    assert response.status_code == 200
+
+    response = _serve(manifest, path, {'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']})
+    assert response.status_code == 304
+    response = _serve(manifest, path, {'If-None-Match': identity.headers['ETag']})
+    assert response.status_code == 304
@@ -0,0 +1,136 @@
+import os
+import io
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from src.utils.storage import S3Storage  # noqa: E402
+
+BUCKET = 'babylon-assets'
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        yield S3Storage(BUCKET, prefix='nodes/a', region='us-east-1', cache_dir=str(tmp_path / 'cache'))
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _put_behind_cache(storage, key, data):
+    """كتابة من عقدة أخرى: الكائن يتغير دون علم ذاكرة هذه العقدة"""
+    boto3.client('s3', region_name='us-east-1').put_object(Bucket=BUCKET, Key=f'nodes/a/{key}', Body=data)
+
+
+def test_cached_read_revalidates_with_etag(storage):
+    storage.write_bytes('maps/m/m.json', b'{"code": 1}')
+    path = storage.open_local('maps/m/m.json')
+    assert _read(path) == b'{"code": 1}'
+    # غير متغير: 304 ونفس الملف المحلي
+    assert storage.open_local('maps/m/m.json') == path
+
+    _put_behind_cache(storage, 'maps/m/m.json', b'{"code": 2}')
+    assert storage.read_bytes('maps/m/m.json') == b'{"code": 2}'
+    assert storage.read_bytes('maps/m/m.json') == b'{"code": 2}'
+
+
+def test_etag_never_points_at_another_version(storage):
+    storage.write_bytes('maps/m/m.json', b'old')
+    old_path = storage.open_local('maps/m/m.json')
+
+    # عامل توقف بعد كتابة بيانات النسخة الجديدة وقبل تبديل ملف etag: الذاكرة ما زالت على النسخة القديمة كاملة
+    response = boto3.client('s3', region_name='us-east-1').put_object(
+        Bucket=BUCKET, Key='nodes/a/maps/m/m.json', Body=b'new'
+    )
+    base = storage._cache_base('maps/m/m.json')
+    new_path = storage._data_path(base, response['ETag'])
+    with open(new_path, 'wb') as f:
+        f.write(b'new')
+    assert storage._cached('maps/m/m.json')[1] == old_path
+    assert _read(old_path) == b'old'
+
+    # الطلب الشرطي بـ etag القديم يجلب النسخة الجديدة ولا يُرد 304 على البيانات القديمة
+    assert storage.read_bytes('maps/m/m.json') == b'new'
+    assert storage.open_local('maps/m/m.json') == new_path
+
+
+def test_evicted_data_is_fetched_again(storage):
+    storage.write_bytes('maps/m/m.json', b'payload')
+    path = storage.open_local('maps/m/m.json')
+    os.remove(path)
+    # ملف etag بلا بيانات لا يُرسل If-None-Match (وإلا لرُد 304 على ملف غير موجود)
+    assert storage.read_bytes('maps/m/m.json') == b'payload'
+
+
+def test_missing_object_drops_cache(storage):
+    storage.write_bytes('maps/m/m.json', b'payload')
+    storage.open_local('maps/m/m.json')
+    boto3.client('s3', region_name='us-east-1').delete_object(Bucket=BUCKET, Key='nodes/a/maps/m/m.json')
+    assert storage.open_local('maps/m/m.json') is None
+    assert storage._cached('maps/m/m.json') == (None, None)
+
+
+def test_stream_upload_and_tree_operations(storage):
+    assert storage.save_stream('external-import/big.bin', io.BytesIO(b'x' * 1024)) == 1024
+    storage.write_bytes('scenes/s/s.json', b'{}')
+    storage.write_bytes('scenes/s/assets/a.txt', b'a')
+    assert storage.copy_tree('scenes/s', 'scenes/t') == 2
+    assert sorted(name for name, _, _ in storage.walk_files('scenes/t')) == ['assets/a.txt', 's.json']
+    assert storage.stat('scenes/t/assets/a.txt')[0] == 1
+    storage.delete_tree('scenes/s')
+    assert not storage.is_dir('scenes/s')
+    with pytest.raises(FileNotFoundError):
+        storage.stat('scenes/s/s.json')
+
+
+def test_data_removed_after_304_is_fetched_again(storage, monkeypatch):
+    storage.write_bytes('maps/m/m.json', b'payload')
+    open_local = storage.open_local
+
+    # تنظيف متزامن يحذف الملف بعد رد 304 وقبل أن يفتحه القارئ
+    def open_then_sweep(key):
+        path = open_local(key)
+        os.remove(path)
+        return path
+    monkeypatch.setattr(storage, 'open_local', open_then_sweep)
+    assert storage.read_bytes('maps/m/m.json') == b'payload'
+
+    # حذف بين قراءة etag وطلب 304 نفسه
+    monkeypatch.setattr(storage, 'open_local', open_local)
+    etag, path = storage._cached('maps/m/m.json')
+    os.remove(path)
+    assert _read(storage._fetch('maps/m/m.json', etag, path)) == b'payload'
+
+
+def test_sweep_tolerates_files_removed_concurrently(storage, monkeypatch):
+    storage.write_bytes('maps/m/m.json', b'payload')
+    walk = os.walk
+
+    def walk_with_vanished_file(top):
+        for root, dirs, files in walk(top):
+            yield root, dirs, files + ['vanished.data']
+    monkeypatch.setattr(os, 'walk', walk_with_vanished_file)
+    monkeypatch.setattr(storage, 'cache_max_bytes', 0)
+    storage._sweep_cache()
+    assert storage._cached('maps/m/m.json') == (None, None)
+
+
+def test_shared_cache_is_off_with_s3(monkeypatch):
+    import importlib
+    from src.utils import shared_cache
+
+    monkeypatch.setenv('STORAGE_BACKEND', 's3')
+    try:
+        assert importlib.reload(shared_cache).ENABLED is False
+    finally:
+        monkeypatch.delenv('STORAGE_BACKEND')
+        importlib.reload(shared_cache)
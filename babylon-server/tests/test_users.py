@@ -0,0 +1,35 @@
+import pytest
+
+from src.main import app
+
+
+@pytest.fixture
+def client():
+    client = app.test_client()
+    users = [{'username': f'page{i:03d}', 'email': f'page{i:03d}@example.com'} for i in range(150)]
+    # الطلبات الجماعية ثقيلة: إغلاق الرد يحرر مكانها في admission
+    with client.post('/api/users/bulk', json={'users': users}) as response:
+        assert response.status_code == 201
+        ids = response.get_json()['ids']
+    yield client
+    with client.delete('/api/users/bulk', json={'ids': ids}) as response:
+        assert response.status_code == 200
+
+
+def test_list_without_cursor_returns_every_user(client):
+    response = client.get('/api/users?username=page')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 150
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_limit_paginates_by_cursor(client):
+    names = []
+    url = '/api/users?username=page&sort=username&limit=100'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        names.extend(user['username'] for user in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/users?username=page&sort=username&limit=100&after={cursor}' if cursor else None
+    assert names == [f'page{i:03d}' for i in range(150)]
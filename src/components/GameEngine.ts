@@ -447,7 +447,7 @@ export class GameEngine {
     private async loadAndExecuteScene(sceneName: string, flowData: any): Promise<void> {
         try {
             // Load the scene code
-            const sceneResult = await this.apiClient.loadAsset('scene', sceneName);
+            const sceneResult = await this.apiClient.loadAsset('scene', sceneName, 'play');
             
             if (sceneResult.success && sceneResult.data && sceneResult.data.code) {
                 console.log(`Executing scene: ${sceneName}`);
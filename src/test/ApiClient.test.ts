@@ -62,6 +62,38 @@ describe('ApiClient', () => {
         'Network error'
       );
     });
+
+    it('should gzip large bodies when CompressionStream is available', async () => {
+      const compressed = new Blob(['gzip']);
+      const stream = vi.fn().mockReturnValue({ pipeThrough: vi.fn().mockReturnValue('compressed-stream') });
+      vi.stubGlobal('CompressionStream', vi.fn());
+      vi.stubGlobal('Blob', vi.fn().mockImplementation(() => ({ stream })));
+      vi.stubGlobal('Response', vi.fn().mockImplementation(() => ({ blob: async () => compressed })));
+      mockFetch.mockResolvedValueOnce({ ok: true, json: async () => ({ success: true }) });
+
+      try {
+        await apiClient.saveAsset('map', 'big-map', 'x'.repeat(16 * 1024));
+      } finally {
+        vi.unstubAllGlobals();
+      }
+
+      const [, options] = mockFetch.mock.calls[0];
+      expect(options.headers).toEqual({ 'Content-Type': 'application/json', 'Content-Encoding': 'gzip' });
+      expect(options.body).toBe(compressed);
+    });
+  });
+
+  describe('saveThumbnail', () => {
+    it('should upload data-URL thumbnails as raw bytes', async () => {
+      mockFetch.mockResolvedValueOnce({ ok: true, json: async () => ({ success: true }) });
+
+      await apiClient.saveThumbnail('map', 'my map', `data:image/png;base64,${btoa('PNGDATA')}`);
+
+      const [url, options] = mockFetch.mock.calls[0];
+      expect(url).toBe('http://localhost:5001/api/assets/save-thumbnail?type=map&name=my%20map');
+      expect(options.headers).toEqual({ 'Content-Type': 'image/png' });
+      expect(new TextDecoder().decode(options.body)).toBe('PNGDATA');
+    });
   });
 
   describe('loadAsset', () => {
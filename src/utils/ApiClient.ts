@@ -1,3 +1,8 @@
+/**
+ * أجسام JSON أكبر من هذا الحجم تُرسل مضغوطة بـ gzip (الخادم يفك Content-Encoding)
+ */
+const COMPRESS_MIN_BYTES = 8 * 1024;
+
 /**
  * عميل API للتواصل مع خادم Flask
  */
@@ -8,6 +13,21 @@ export class ApiClient {
         this.baseUrl = baseUrl;
     }
 
+    /**
+     * جسم JSON وترويساته؛ الأجسام الكبيرة تُضغط إذا دعم المتصفح CompressionStream
+     */
+    private async jsonRequest(payload: unknown): Promise<{ headers: Record<string, string>; body: BodyInit }> {
+        const json = JSON.stringify(payload);
+        if (json.length < COMPRESS_MIN_BYTES || typeof CompressionStream === 'undefined') {
+            return { headers: { 'Content-Type': 'application/json' }, body: json };
+        }
+        const compressed = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'));
+        return {
+            headers: { 'Content-Type': 'application/json', 'Content-Encoding': 'gzip' },
+            body: await new Response(compressed).blob()
+        };
+    }
+
     /**
      * حفظ أصل (خريطة، شخصية، أو كائن)
      */
@@ -15,14 +35,11 @@ export class ApiClient {
         try {
             const response = await fetch(`${this.baseUrl}/assets/save`, {
                 method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
+                ...(await this.jsonRequest({
                     type,
                     name,
                     code
-                })
+                }))
             });
 
             if (!response.ok) {
@@ -38,10 +55,12 @@ export class ApiClient {
 
     /**
      * تحميل أصل محفوظ
+     * mode = 'play' يطلب الكود مصغّراً للتشغيل؛ المحررات تستخدم الافتراضي (الكود كما حُفظ)
      */
-    async loadAsset(type: 'map' | 'character' | 'object' | 'scene' | 'flow' | 'code', name: string): Promise<any> {
+    async loadAsset(type: 'map' | 'character' | 'object' | 'scene' | 'flow' | 'code', name: string, mode?: 'play'): Promise<any> {
         try {
-            const response = await fetch(`${this.baseUrl}/assets/load/${type}/${name}`);
+            const query = mode ? `?mode=${mode}` : '';
+            const response = await fetch(`${this.baseUrl}/assets/load/${type}/${name}${query}`);
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -95,20 +114,27 @@ export class ApiClient {
 
     /**
      * حفظ صورة مصغرة للأصل
+     * رابط data:image يُرسل كبايتات خام (دون تضخم base64)، والنوع والاسم في رابط الطلب
      */
     async saveThumbnail(type: 'map' | 'character' | 'object' | 'scene' | 'flow' | 'code', name: string, thumbnailData: string): Promise<any> {
         try {
-            const response = await fetch(`${this.baseUrl}/assets/save-thumbnail`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    type,
-                    name,
-                    thumbnail: thumbnailData
+            const dataUrl = /^data:(image\/[\w.+-]+);base64,(.*)$/.exec(thumbnailData);
+            const response = dataUrl
+                ? await fetch(`${this.baseUrl}/assets/save-thumbnail?type=${encodeURIComponent(type)}&name=${encodeURIComponent(name)}`, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': dataUrl[1],
+                    },
+                    body: Uint8Array.from(atob(dataUrl[2]), char => char.charCodeAt(0))
                 })
-            });
+                : await fetch(`${this.baseUrl}/assets/save-thumbnail`, {
+                    method: 'POST',
+                    ...(await this.jsonRequest({
+                        type,
+                        name,
+                        thumbnail: thumbnailData
+                    }))
+                });
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -6,6 +6,8 @@ export default defineConfig({
   publicDir: 'public',
   build: {
     outDir: 'dist',
+    // dist/.vite/manifest.json lists the hashed files the Flask server may cache as immutable
+    manifest: true,
     rollupOptions: {
       input: {
         main: resolve(__dirname, 'index.html')